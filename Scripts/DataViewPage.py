@@ -11,6 +11,14 @@ except ImportError:
 
 import sqlite3
 import os
+from query_cache import cached_read, read_sql_cached
+from page_queries import DATA_VIEW_SHEETS_SQL
+from db_writer import execute_write
+from sheet_store import delete_projects, find_current_projects, find_sheet_ids, find_sheet_ids_in_period, load_sheet
+from export_job_panel import show_export_jobs, start_batch_export
+from export_cache import invalidate_sheet
+from project_phases import PHASE_LABELS, decode_phase_columns
+from project_periods import ONGOING_MONTH_INDEX, parse_month_index
 
 # データベースパス
 DB_PATH = os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
@@ -113,38 +121,99 @@ def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
     except Exception:
         return False
 
+def _batch_export_section(users_df, login_user_id):
+    """複数のスキルシートをまとめてExcel出力し、ZIPでダウンロードさせる"""
+    with st.container():
+        st.markdown(
+            "<div class='card-section'><div class='card-title'>一括Excel出力</div>",
+            unsafe_allow_html=True
+        )
+        keyword = st.text_input("氏名・フリガナで絞り込み（空欄なら全件）:", key="batch_export_keyword")
+        period_cols = st.columns([1, 1, 2])
+        with period_cols[0]:
+            period_from = st.text_input("参画期間の開始（yyyy/MM、空欄なら指定なし）", key="batch_export_period_from")
+        with period_cols[1]:
+            period_to = st.text_input("参画期間の終了（yyyy/MM、空欄なら指定なし）", key="batch_export_period_to")
+        with period_cols[2]:
+            current_only = st.checkbox("現在参画中の案件がある人のみ", key="batch_export_current_only")
+        # 入力による再実行ではDBへ問い合わせないよう、DBが変わるまでは前回の結果を使う
+        candidate_ids = cached_read(
+            DB_PATH, ("find_sheet_ids", login_user_id, keyword),
+            lambda c: find_sheet_ids(c, login_user_id, keyword),
+            scope=login_user_id,
+        )
+        if period_from.strip() or period_to.strip():
+            # 期間の重なりで絞り込む（片方が空欄なら、その側は制限しない）
+            start_idx = parse_month_index(period_from) if period_from.strip() else 0
+            end_idx = parse_month_index(period_to) if period_to.strip() else ONGOING_MONTH_INDEX
+            if start_idx is None or end_idx is None:
+                st.warning("参画期間は yyyy/MM の形式で入力してください。")
+            else:
+                in_period = set(cached_read(
+                    DB_PATH, ("find_sheet_ids_in_period", login_user_id, start_idx, end_idx),
+                    lambda c: find_sheet_ids_in_period(c, login_user_id, start_idx, end_idx),
+                    scope=login_user_id,
+                ))
+                candidate_ids = [x for x in candidate_ids if x in in_period]
+        current_projects = {}
+        for user_info_id, _, system_name, _ in cached_read(
+            DB_PATH, ("find_current_projects", login_user_id),
+            lambda c: find_current_projects(c, login_user_id),
+            scope=login_user_id,
+        ):
+            current_projects.setdefault(user_info_id, []).append(system_name or "")
+        if current_only:
+            candidate_ids = [x for x in candidate_ids if x in current_projects]
+        names = dict(zip(users_df["id"], users_df["name"]))
+
+        def format_candidate(x):
+            label = f"ID: {x} - {names.get(x, '')}"
+            if x in current_projects:
+                label += f"（参画中: {', '.join(current_projects[x])}）"
+            return label
+
+        target_ids = st.multiselect(
+            "出力するデータを選択してください:",
+            options=candidate_ids,
+            default=candidate_ids,
+            format_func=format_candidate,
+            key=f"batch_export_ids_{keyword}_{period_from}_{period_to}_{current_only}",
+        )
+        if st.button(f"選択した{len(target_ids)}件をZIPで出力", key="batch_export_btn", disabled=not target_ids):
+            # 出力はジョブとして行い、この画面は完了を待たない（ZIP は artifact_store の一時フォルダに書いてそこからダウンロードさせる）
+            start_batch_export("batch_export_jobs", DB_PATH, target_ids, login_user_id=login_user_id)
+        show_export_jobs("batch_export_jobs")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+
 def display_saved_data():
     """保存されたデータを表示（新スキーマ優先、なければ旧スキーマ）"""
-    conn = sqlite3.connect(DB_PATH)
     try:
-        use_new = _table_exists(conn, "user_info")
+        use_new = cached_read(DB_PATH, ("table_exists", "user_info"), lambda c: _table_exists(c, "user_info"))
         # ログインユーザーIDを取得
         login_user_id = st.session_state.get('user_id')
 
         if use_new:
             # ログインユーザーが作成したスキルシートのみ表示
             if login_user_id:
-                users_df = pd.read_sql_query(
-                    """
-                    SELECT id, name, name_kana, gender, birth_date, final_education, created_at
-                    FROM user_info
-                    WHERE login_user_id = ?
-                    ORDER BY created_at DESC
-                    """,
-                    conn,
-                    params=[login_user_id]
+                # 再実行のたびにDBへ問い合わせないよう、DBが変わるまでは前回の結果を使う
+                users_df = read_sql_cached(
+                    DB_PATH,
+                    DATA_VIEW_SHEETS_SQL,
+                    [login_user_id],
+                    scope=login_user_id,
                 )
             else:
                 users_df = pd.DataFrame()
         else:
             # 旧スキーマの場合は全件表示（後方互換性のため）
-            users_df = pd.read_sql_query(
+            users_df = read_sql_cached(
+                DB_PATH,
                 """
                 SELECT id, name, name_kana, gender, birth_date, final_education, created_at
                 FROM basic_info
                 ORDER BY created_at DESC
                 """,
-                conn,
             )
 
         if users_df.empty:
@@ -159,6 +228,9 @@ def display_saved_data():
             st.dataframe(users_df, use_container_width=True, hide_index=True)
             st.markdown("</div>", unsafe_allow_html=True)
 
+        if use_new and login_user_id:
+            _batch_export_section(users_df, login_user_id)
+
         # セレクトボックスを枠で囲むためにst.selectboxをst.containerでラップ
         with st.container():
             st.markdown(
@@ -197,135 +269,80 @@ def display_saved_data():
         if use_new:
             # ログインユーザーが作成したスキルシートのみ表示
             login_user_id = st.session_state.get('user_id')
+            sheet = None
             if login_user_id:
-                detail = pd.read_sql_query(
-                    "SELECT * FROM user_info WHERE id = ? AND login_user_id = ?",
-                    conn,
-                    params=[selected_id, login_user_id],
+                # 基本情報・スキル・案件をまとめて読み込み（DBが変わるまでは前回の結果を使う）
+                sheet = cached_read(
+                    DB_PATH, ("sheet", selected_id),
+                    lambda c: load_sheet(c, selected_id, login_user_id),
+                    scope=login_user_id,
                 )
-            else:
-                detail = pd.DataFrame()
-            if not detail.empty:
+            if sheet is not None:
                 with col1:
                     st.markdown("**基本情報**")
-                    row = detail.iloc[0]
-                    if pd.notna(row.get('name')):
-                        st.write(f"**氏名:** {row['name']}")
-                    if pd.notna(row.get('name_kana')):
-                        st.write(f"**カナ:** {row['name_kana']}")
-                    if pd.notna(row.get('gender')):
-                        st.write(f"**性別:** {row['gender']}")
-                    if pd.notna(row.get('birth_date')):
-                        st.write(f"**生年月日:** {row['birth_date']}")
-                    if pd.notna(row.get('final_education')):
-                        st.write(f"**最終学歴:** {row['final_education']}")
-                    if pd.notna(row.get('nearest_station')):
-                        st.write(f"**最寄り駅:** {row['nearest_station']}")
-                    if pd.notna(row.get('access_method')):
-                        st.write(f"**交通手段:** {row['access_method']}")
-                    if pd.notna(row.get('access_time')):
-                        st.write(f"**所要時間:** {row['access_time']}分")
+                    if sheet.name is not None:
+                        st.write(f"**氏名:** {sheet.name}")
+                    if sheet.name_kana is not None:
+                        st.write(f"**カナ:** {sheet.name_kana}")
+                    if sheet.gender is not None:
+                        st.write(f"**性別:** {sheet.gender}")
+                    if sheet.birth_date is not None:
+                        st.write(f"**生年月日:** {sheet.birth_date}")
+                    if sheet.final_education is not None:
+                        st.write(f"**最終学歴:** {sheet.final_education}")
+                    if sheet.nearest_station is not None:
+                        st.write(f"**最寄り駅:** {sheet.nearest_station}")
+                    if sheet.access_method is not None:
+                        st.write(f"**交通手段:** {sheet.access_method}")
+                    if sheet.access_time is not None:
+                        st.write(f"**所要時間:** {sheet.access_time}分")
 
                 # 資格はuser_info.qualificationsに保持（文字列）
-                quals = detail.iloc[0]["qualifications"] if not detail.empty else ""
+                quals = sheet.qualifications
                 if isinstance(quals, str) and quals.strip():
                     with col2:
                         st.markdown("**資格**")
                         st.write(quals)
 
-            if not detail.empty:
-                skills = pd.read_sql_query(
-                    "SELECT skill_type, skill_name, experience_years FROM skills WHERE user_info_id = ?",
-                    conn,
-                    params=[selected_id],
-                )
-            else:
-                skills = pd.DataFrame()
-            if not skills.empty:
+            if sheet is not None and sheet.skills:
                 st.markdown("---")
                 st.markdown("**スキル**")
+                # 経験年数は月数から表示用の「〇年〇ヶ月」に変換
+                skills = pd.DataFrame(
+                    [(skill.skill_type, skill.skill_name, skill.experience) for skill in sheet.skills],
+                    columns=['skill_type', 'skill_name', 'experience_years'],
+                )
                 st.dataframe(skills, use_container_width=True, hide_index=True)
 
-            if not detail.empty:
-                projects = pd.read_sql_query(
-                    """
-                    SELECT period_start, period_end, system_name, role, industry, work_content, phases, headcount,
-                           env_langs, env_tools, env_dbs, env_oss
-                    FROM projects WHERE user_info_id = ?
-                    """,
-                    conn,
-                    params=[selected_id],
-                )
-            else:
-                projects = pd.DataFrame()
-            if not projects.empty:
+            if sheet is not None and sheet.projects:
                 st.markdown("---")
                 st.markdown("**職務経歴**")
-                # phasesカラムを処理して表示用に変換
-                PHASE_LABELS = [
-                    "環境構築", "要件", "基本", "詳細", "製造", "単体", "結合", "総合", "保守運用", "他"
-                ]
-                projects_display = projects.copy()
-                
-                def parse_phases(phases_val):
-                    """phasesの値を解析して辞書形式に変換"""
-                    if pd.isna(phases_val) or phases_val == '':
-                        return {label: False for label in PHASE_LABELS}
-                    
-                    try:
-                        import ast
-                        import json
-                        # 文字列の場合、JSONまたはPythonリテラルとして解析
-                        if isinstance(phases_val, str):
-                            # JSON形式を試す
-                            try:
-                                phases_dict = json.loads(phases_val)
-                            except:
-                                # Pythonリテラルとして解析
-                                try:
-                                    phases_dict = ast.literal_eval(phases_val)
-                                except:
-                                    # リスト形式の場合
-                                    if phases_val.startswith('[') and phases_val.endswith(']'):
-                                        phases_list = ast.literal_eval(phases_val)
-                                        phases_dict = {label: label in phases_list for label in PHASE_LABELS}
-                                    else:
-                                        return {label: False for label in PHASE_LABELS}
-                        else:
-                            phases_dict = phases_val
-                        
-                        # 辞書形式の場合
-                        if isinstance(phases_dict, dict):
-                            result = {}
-                            for label in PHASE_LABELS:
-                                # true/falseまたは1/0をチェック
-                                val = phases_dict.get(label, False)
-                                result[label] = val in [True, 1, 'true', 'True', '1']
-                            return result
-                        # リスト形式の場合（工程名のリスト）
-                        elif isinstance(phases_dict, list):
-                            return {label: label in phases_dict for label in PHASE_LABELS}
-                        else:
-                            return {label: False for label in PHASE_LABELS}
-                    except Exception as e:
-                        return {label: False for label in PHASE_LABELS}
-                
-                # phasesカラムを解析して各工程の列に展開
-                if 'phases' in projects_display.columns:
-                    phases_data = projects_display['phases'].apply(parse_phases)
-                    # 各工程の列を追加（true→●、false→空白）
-                    for label in PHASE_LABELS:
-                        projects_display[label] = phases_data.apply(lambda x: '●' if x.get(label, False) else '')
-                    # 元のphasesカラムを削除
-                    projects_display = projects_display.drop(columns=['phases'])
+                projects_display = pd.DataFrame(
+                    [
+                        (
+                            p.period_start, p.period_end, p.system_name, p.role, p.industry, p.work_content,
+                            p.headcount, ", ".join(p.env_langs), ", ".join(p.env_tools),
+                            ", ".join(p.env_dbs), ", ".join(p.env_oss),
+                        )
+                        for p in sheet.projects
+                    ],
+                    columns=[
+                        'period_start', 'period_end', 'system_name', 'role', 'industry', 'work_content',
+                        'headcount', 'env_langs', 'env_tools', 'env_dbs', 'env_oss',
+                    ],
+                )
+                # phase_mask を各工程の列（●/空白）に一括展開
+                projects_display[PHASE_LABELS] = decode_phase_columns(
+                    pd.Series([p.phase_mask for p in sheet.projects])
+                )
                 
                 st.dataframe(projects_display, use_container_width=True, hide_index=True)
         else:
             # 旧スキーマ
-            basic_detail = pd.read_sql_query(
+            basic_detail = read_sql_cached(
+                DB_PATH,
                 "SELECT * FROM basic_info WHERE id = ?",
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not basic_detail.empty:
                 with col1:
@@ -348,63 +365,63 @@ def display_saved_data():
                     if pd.notna(row.get('access_time')):
                         st.write(f"**所要時間:** {row['access_time']}分")
 
-            qualifications = pd.read_sql_query(
+            qualifications = read_sql_cached(
+                DB_PATH,
                 "SELECT qualification FROM qualifications WHERE basic_info_id = ?",
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not qualifications.empty:
                 with col2:
                     st.markdown("**資格**")
                     st.dataframe(qualifications, use_container_width=True, hide_index=True)
 
-            languages = pd.read_sql_query(
+            languages = read_sql_cached(
+                DB_PATH,
                 "SELECT language, experience_years FROM languages WHERE basic_info_id = ?",
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not languages.empty:
                 st.markdown("---")
                 st.markdown("**言語**")
                 st.dataframe(languages, use_container_width=True, hide_index=True)
 
-            tools = pd.read_sql_query(
+            tools = read_sql_cached(
+                DB_PATH,
                 "SELECT tool, experience_years FROM tools WHERE basic_info_id = ?",
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not tools.empty:
                 st.markdown("---")
                 st.markdown("**ツール/フレームワーク/ライブラリ**")
                 st.dataframe(tools, use_container_width=True, hide_index=True)
 
-            databases = pd.read_sql_query(
+            databases = read_sql_cached(
+                DB_PATH,
                 "SELECT database, experience_years FROM databases WHERE basic_info_id = ?",
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not databases.empty:
                 st.markdown("---")
                 st.markdown("**データベース**")
                 st.dataframe(databases, use_container_width=True, hide_index=True)
 
-            machines = pd.read_sql_query(
+            machines = read_sql_cached(
+                DB_PATH,
                 "SELECT machine, experience_years FROM machines WHERE basic_info_id = ?",
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not machines.empty:
                 st.markdown("---")
                 st.markdown("**マシン/OS**")
                 st.dataframe(machines, use_container_width=True, hide_index=True)
 
-            projects = pd.read_sql_query(
+            projects = read_sql_cached(
+                DB_PATH,
                 """
                 SELECT period_start, period_end, system_name, role, industry, work_content, headcount
                 FROM projects WHERE basic_info_id = ?
                 """,
-                conn,
-                params=[selected_id],
+                [selected_id],
             )
             if not projects.empty:
                 st.markdown("---")
@@ -414,8 +431,6 @@ def display_saved_data():
     
     except Exception as e:
         st.error(f"データ取得エラー: {str(e)}")
-    finally:
-        conn.close()
 
 with st.container():
     st.markdown(
@@ -444,25 +459,22 @@ with st.container():
     )
     if st.button("データを削除", type="secondary"):
         if delete_id:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            try:
+            # ログインユーザーIDは書き込みスレッドから参照できないため先に取り出す
+            login_user_id = st.session_state.get('user_id')
+
+            def _delete_sheet(conn):
+                cursor = conn.cursor()
                 # 新スキーマ優先で削除。なければ旧スキーマを削除
-                login_user_id = st.session_state.get('user_id')
                 if _table_exists(conn, "user_info"):
                     # ログインユーザーが作成したスキルシートのみ削除可能
-                    if login_user_id:
-                        cursor.execute("SELECT id FROM user_info WHERE id = ? AND login_user_id = ?", (delete_id, login_user_id))
-                        if cursor.fetchone():
-                            cursor.execute("DELETE FROM skills WHERE user_info_id = ?", (delete_id,))
-                            cursor.execute("DELETE FROM projects WHERE user_info_id = ?", (delete_id,))
-                            cursor.execute("DELETE FROM user_info WHERE id = ?", (delete_id,))
-                            conn.commit()
-                            st.success(f"ID {delete_id} のデータを削除しました。")
-                        else:
-                            st.error("このデータを削除する権限がありません。")
-                    else:
-                        st.error("ログインが必要です。")
+                    if not login_user_id:
+                        return "login_required"
+                    cursor.execute("SELECT id FROM user_info WHERE id = ? AND login_user_id = ?", (delete_id, login_user_id))
+                    if not cursor.fetchone():
+                        return "forbidden"
+                    cursor.execute("DELETE FROM skills WHERE user_info_id = ?", (delete_id,))
+                    delete_projects(conn, "user_info_id = ?", (delete_id,))
+                    cursor.execute("DELETE FROM user_info WHERE id = ?", (delete_id,))
                 else:
                     cursor.execute("DELETE FROM qualifications WHERE basic_info_id = ?", (delete_id,))
                     cursor.execute("DELETE FROM languages WHERE basic_info_id = ?", (delete_id,))
@@ -471,12 +483,19 @@ with st.container():
                     cursor.execute("DELETE FROM machines WHERE basic_info_id = ?", (delete_id,))
                     cursor.execute("DELETE FROM projects WHERE basic_info_id = ?", (delete_id,))
                     cursor.execute("DELETE FROM basic_info WHERE id = ?", (delete_id,))
-                    conn.commit()
+                return "deleted"
+
+            try:
+                result = execute_write(DB_PATH, _delete_sheet)
+                invalidate_sheet(delete_id)
+                if result == "deleted":
                     st.success(f"ID {delete_id} のデータを削除しました。")
+                elif result == "forbidden":
+                    st.error("このデータを削除する権限がありません。")
+                else:
+                    st.error("ログインが必要です。")
             except Exception as e:
                 st.error(f"削除エラー: {str(e)}")
-            finally:
-                conn.close()
         else:
             st.warning("削除するデータのIDを入力してください。")
 st.markdown("</div>", unsafe_allow_html=True)
\ No newline at end of file
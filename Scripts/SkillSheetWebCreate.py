@@ -1,18 +1,17 @@
 import streamlit as st
-import openpyxl, shutil, os, datetime, sys
+import os, datetime, sys
 import pandas as pd
-import sqlite3
 from datetime import datetime as dt
-from openpyxl.utils import column_index_from_string, get_column_letter
 import base64
 import tempfile
+from db_writer import execute_write
+from export_job_panel import show_export_jobs, start_export
+from sheet_store import insert_sheet, sheet_from_form
+from project_phases import PHASE_LABELS
 
 
 # ======== 定数・リスト類（ヘッダー・選択肢など） ========
 
-PHASE_LABELS = [
-    "環境構築", "要件", "基本", "詳細", "製造", "単体", "結合", "総合", "保守運用", "他"
-]
 ROLE_OPTIONS = [
     "CNSL(ｺﾝｻﾙﾀﾝﾄ)", "PMO(ﾌﾟﾛｼﾞｪｸﾄﾏﾈｰｼﾞﾒﾝﾄｵﾌｨｽ)", "PM(ﾌﾟﾛｼﾞｪｸﾄﾏﾈｰｼﾞｬｰ)", "PL(ﾌﾟﾛｼﾞｪｸﾄﾘｰﾀﾞｰ)",
     "SL(ｻﾌﾞﾘｰﾀﾞｰ)", "SE(ｼｽﾃﾑｴﾝｼﾞﾆｱ)", "PG(ﾌﾟﾛｸﾞﾗﾏ)", "M（ﾒﾝﾊﾞｰ）"
@@ -27,27 +26,6 @@ ENV_HEADERS = [
     ("DB", "env_dbs"),
     ("OS\nﾏｼﾝ", "env_oss"),
 ]
-BASE_ROW_MAP = {
-    "period_start": 37,  # D37
-    "period_end": 38,    # E38
-    "system_and_work": 40,  # J40
-    "role": 39,          # T39
-    "industry": 39,      # L39
-    "headcount": 39,     # Z39
-    "phase": 38,         # J38, L38, ... (工程)
-    "env_langs": 39,     # AD39
-    "env_dbs": 39,       # AJ39
-}
-COL_MAP = {
-    "period_start": "D",
-    "period_end": "E",
-    "system_and_work": "J",
-    "role": "T",
-    "industry": "L",
-    "headcount": "Z",
-    "env_langs": "AD",
-    "env_dbs": "AJ",
-}
 ENV_MAX = 11
 
 b64_SKILLSHEET_TEMPLATE = """
@@ -94,149 +72,22 @@ def get_template_path():
     return None
 
 TEMPLATE_PATH = get_template_path()
-OUTPUT_PATH = "SkillSheetOutput.xlsx"
 DB_PATH = os.path.join(os.path.dirname(__file__) if '__file__' in globals() else os.getcwd(), "skillsheet_data.db")
 
-def init_database():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_info (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            name_kana TEXT NOT NULL,
-            transportation TEXT,
-            nearest_station TEXT,
-            access_method TEXT,
-            access_time TEXT,
-            gender TEXT,
-            birth_date DATE,
-            final_education TEXT,
-            graduation_date TEXT,
-            self_pr TEXT,
-            qualifications TEXT,
-            login_user_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (login_user_id) REFERENCES users (id)
-        )
-    ''')
-    # login_user_idカラムが存在しない場合は追加
-    cursor.execute("PRAGMA table_info(user_info)")
-    existing_cols = [row[1] for row in cursor.fetchall()]
-    if 'login_user_id' not in existing_cols:
-        try:
-            cursor.execute("ALTER TABLE user_info ADD COLUMN login_user_id INTEGER")
-        except Exception as e:
-            pass
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS skills (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_info_id INTEGER,
-            skill_type TEXT,
-            skill_name TEXT,
-            experience_years TEXT,
-            FOREIGN KEY (user_info_id) REFERENCES user_info (id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT
-        )
-    ''')
-    project_columns = [
-        ("user_info_id", "INTEGER"),
-        ("period_start", "TEXT"),
-        ("period_end", "TEXT"),
-        ("system_name", "TEXT"),
-        ("role", "TEXT"),
-        ("industry", "TEXT"),
-        ("work_content", "TEXT"),
-        ("phases", "TEXT"),
-        ("headcount", "TEXT"),
-        ("env_langs", "TEXT"),
-        ("env_tools", "TEXT"),
-        ("env_dbs", "TEXT"),
-        ("env_oss", "TEXT"),
-    ]
-    cursor.execute("PRAGMA table_info(projects)")
-    existing_cols = [row[1] for row in cursor.fetchall()]
-    for col, typ in project_columns:
-        if col not in existing_cols:
-            try:
-                cursor.execute(f"ALTER TABLE projects ADD COLUMN {col} {typ}")
-            except Exception as e:
-                pass
-    conn.commit()
-    conn.close()
-
 def save_to_database(data):
-    conn = sqlite3.connect(DB_PATH, isolation_level="EXCLUSIVE")
-    cursor = conn.cursor()
+    # ログインユーザーIDを取得（セッション情報は書き込みスレッドから参照できないため先に取り出す）
+    login_user_id = st.session_state.get('user_id')
+
+    def _insert_sheet(conn):
+        # 基本情報1件 + スキル・案件はそれぞれ executemany で一括登録
+        return insert_sheet(conn, data, login_user_id)
+
     try:
-        # ログインユーザーIDを取得
-        login_user_id = st.session_state.get('user_id')
-        
-        cursor.execute('''
-            INSERT INTO user_info (name, name_kana, transportation, nearest_station, 
-                                  access_method, access_time, gender, birth_date, 
-                                  final_education, graduation_date, self_pr, qualifications, login_user_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['name'], data['name_kana'], data['transportation'], data['nearest_station'],
-            data['access_method'], data['access_time'], data['gender'], data['birth_date'],
-            data['final_education'], data['graduation_date'], data['self_pr'],
-            ",".join([q for q in data['qualifications'] if isinstance(q, str) and q.strip()]),
-            login_user_id
-        ))
-        user_info_id = cursor.lastrowid
-        for lang, years in zip(data['languages'], data['language_years']):
-            if isinstance(lang, str) and lang.strip():
-                cursor.execute('''
-                    INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_info_id, 'language', lang, years))
-        for tool, years in zip(data['tools'], data['tool_years']):
-            if isinstance(tool, str) and tool.strip():
-                cursor.execute('''
-                    INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_info_id, 'tool', tool, years))
-        for db, years in zip(data['databases'], data['db_years']):
-            if isinstance(db, str) and db.strip():
-                cursor.execute('''
-                    INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_info_id, 'db', db, years))
-        for machine, years in zip(data['machines'], data['machine_years']):
-            if isinstance(machine, str) and machine.strip():
-                cursor.execute('''
-                    INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_info_id, 'machine', machine, years))
-        for project in data['projects']:
-            cursor.execute('''
-                INSERT INTO projects (user_info_id, period_start, period_end, system_name,
-                                    role, industry, work_content, phases, headcount,
-                                    env_langs, env_tools, env_dbs, env_oss)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_info_id, project.get('period_start', ""), project.get('period_end', ""),
-                project.get('system_and_work', ""), project.get('role', ""), project.get('industry', ""),
-                project.get('work_content', ""), str(project.get('phases', "")), project.get('headcount', ""),
-                str(project.get('env_langs', "")), str(project.get('env_tools', "")),
-                str(project.get('env_dbs', "")), str(project.get('env_oss', ""))
-            ))
-        conn.commit()
-        cursor.execute("PRAGMA wal_checkpoint(FULL)")
+        execute_write(DB_PATH, _insert_sheet)
         return True
     except Exception as e:
-        conn.rollback()
         st.error(f"データベース保存エラー: {str(e)}")
         return False
-    finally:
-        conn.close()
-
-init_database()
 
 # --- レイアウト調整: サイドバーとセクション分割 ---
 st.set_page_config(page_title="スキルシート作成フォーム", layout="wide")
@@ -636,53 +487,6 @@ with st.container():
                     )
             else:
                 try:
-                    shutil.copy(TEMPLATE_PATH, OUTPUT_PATH)
-                    wb = openpyxl.load_workbook(OUTPUT_PATH)
-                    ws = wb.active
-                    try:
-                        ws["AG39"] = ""
-                    except Exception:
-                        pass
-                    ws["E5"], ws["E4"], ws["T5"], ws["AB5"], ws["AJ5"], ws["AM5"], ws["Q5"], ws["AV1"], ws["B8"], ws["AE8"] = (
-                        name_val, nameKana_val, transportation, nearest_station, access_method, access_time, gender_val, birth_date_val, final_education, graduation_date_str
-                    )
-                    def unpack(lst, n): return lst[:n]
-                    field_map = [
-                        (["B10", "B11", "B12", "V10", "V11", "V12"], None, unpack(qualification_inputs,6), None),
-                        (["B15","B16","B17","B18","B19","B20","B21","B22","B23","B24"], ["H15","H16","H17","H18","H19","H20","H21","H22","H23","H24"], unpack(language_inputs,10), unpack(language_years,10)),
-                        (["L15","L16","L17","L18","L19","L20","L21","L22","L23","L24"], ["R15","R16","R17","R18","R19","R20","R21","R22","R23","R24"], unpack(tool_inputs,10), unpack(tool_years,10)),
-                        (["V15","V16","V17","V18","V19","V20","V21","V22","V23","V24"], ["AB15","AB16","AB17","AB18","AB19","AB20","AB21","AB22","AB23","AB24"], unpack(db_inputs,10), unpack(db_years,10)),
-                        (["AF15","AF16","AF17","AF18","AF19","AF20","AF21","AF22","AF23","AF24"], ["AL15","AL16","AL17","AL18","AL19","AL20","AL21","AL22","AL23","AL24"], unpack(machine_inputs,10), unpack(machine_years,10)),
-                    ]
-                    for value_cells, year_cells, values, years in field_map:
-                        for cell, value in zip(value_cells, values):
-                            try:
-                                ws[cell] = value
-                            except AttributeError:
-                                pass
-                        if years:
-                            for cell, year in zip(year_cells, years):
-                                try:
-                                    ws[cell] = year
-                                except AttributeError:
-                                    pass
-                    ws["B27"] = self_pr
-
-                    def find_cell_by_value(ws, text):
-                        for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-                            for cell in row:
-                                if isinstance(cell.value, str) and cell.value.strip() == text:
-                                    return cell
-                        return None
-
-                    def write_below(ws, anchor_cell, value, row_offset=2, col_offset=0):
-                        if anchor_cell is None:
-                            return
-                        try:
-                            ws.cell(row=anchor_cell.row + row_offset, column=anchor_cell.column + col_offset, value=value)
-                        except Exception:
-                            pass
-
                     reordered_projects = []
                     if len(projects) >= 2:
                         first = projects[0]
@@ -728,70 +532,37 @@ with st.container():
                     else:
                         reordered_projects = projects[:]
 
-                    ENV_ROW_OFFSET = 2
-                    ENV_BLOCK_OFFSET = 13
-                    for idx, proj in enumerate(reordered_projects):
-                        row_offset = idx * ENV_BLOCK_OFFSET
-                        ws[f"{COL_MAP['period_start']}{BASE_ROW_MAP['period_start']+row_offset}"] = proj.get("period_start", "")
-                        ws[f"{COL_MAP['period_end']}{BASE_ROW_MAP['period_end']+row_offset}"] = proj.get("period_end", "")
-                        ws[f"{COL_MAP['system_and_work']}{BASE_ROW_MAP['system_and_work']+row_offset}"] = proj.get("system_and_work", "")
-                        ws[f"{COL_MAP['role']}{BASE_ROW_MAP['role']+row_offset}"] = proj.get("role", "")
-                        ws[f"{COL_MAP['industry']}{BASE_ROW_MAP['industry']+row_offset}"] = proj.get("industry", "")
-                        ws[f"{COL_MAP['headcount']}{BASE_ROW_MAP['headcount']+row_offset}"] = proj.get("headcount", "")
-                        env_lang_values = [v for v in proj.get("env_langs", []) if isinstance(v, str) and v.strip()]
-                        env_db_values = [v for v in proj.get("env_dbs", []) if isinstance(v, str) and v.strip()]
-                        ws[f"{COL_MAP['env_langs']}{BASE_ROW_MAP['env_langs']+row_offset}"] = env_lang_values[0] if env_lang_values else ""
-                        ws[f"{COL_MAP['env_dbs']}{BASE_ROW_MAP['env_dbs']+row_offset}"] = env_db_values[0] if env_db_values else ""
-                        phase_base_col = column_index_from_string("J")
-                        for phase_idx, label in enumerate(PHASE_LABELS):
-                            col = phase_base_col + phase_idx * 2
-                            cell = f"{get_column_letter(col)}{BASE_ROW_MAP['phase']+row_offset}"
-                            mark = "●" if proj.get("phases", {}).get(label) else ""
-                            ws[cell] = mark
-                    
-                    if reordered_projects:
-                        first_proj = reordered_projects[0]
-                        ws["D37"] = first_proj.get("period_start", "")
-                        ws["E38"] = first_proj.get("period_end", "")
-                        ws["J40"] = first_proj.get("system_and_work", "")
-                        ws["T39"] = first_proj.get("role", "")
-                        ws["L39"] = first_proj.get("industry", "")
-                        ws["Z39"] = first_proj.get("headcount", "")
-                        first_env_langs = [v for v in first_proj.get("env_langs", []) if isinstance(v, str) and v.strip()]
-                        first_env_dbs = [v for v in first_proj.get("env_dbs", []) if isinstance(v, str) and v.strip()]
-                        ws["AD39"] = first_env_langs[0] if first_env_langs else ""
-                        ws["AJ39"] = first_env_dbs[0] if first_env_dbs else ""
-                    proj_ws = wb["Projects"] if "Projects" in wb.sheetnames else wb.create_sheet("Projects")
-                    proj_ws.delete_rows(1, proj_ws.max_row)
-                    headers = (
-                        ["開始(yyyy/MM)","終了(yyyy/MM|現在)","システム名/案件名・業務内容","役割","業種"]
-                        + [f"工程:{p}" for p in PHASE_LABELS]
-                        + ["人数"]
-                        + [f"環境:言語{i+1}" for i in range(ENV_MAX)]
-                        + [f"環境:ツール/FW/Lib{i+1}" for i in range(ENV_MAX)]
-                        + [f"環境:DB{i+1}" for i in range(ENV_MAX)]
-                        + [f"環境:OS/マシン{i+1}" for i in range(ENV_MAX)]
+                    # 保存前の入力をスキルシートに組み立て、更新ページと同じレイアウト定義で書き込む
+                    export_sheet = sheet_from_form({
+                        'name': name_val,
+                        'name_kana': nameKana_val,
+                        'transportation': transportation,
+                        'nearest_station': nearest_station,
+                        'access_method': access_method,
+                        'access_time': access_time,
+                        'gender': gender_val,
+                        'birth_date': birth_date_val,
+                        'final_education': final_education,
+                        'graduation_date': graduation_date_str,
+                        'self_pr': self_pr,
+                        'qualifications': qualification_inputs,
+                        'languages': language_inputs,
+                        'language_years': language_years,
+                        'tools': tool_inputs,
+                        'tool_years': tool_years,
+                        'databases': db_inputs,
+                        'db_years': db_years,
+                        'machines': machine_inputs,
+                        'machine_years': machine_years,
+                        'projects': reordered_projects,
+                    })
+                    # 出力はジョブとして子プロセスで行い、この画面は完了を待たない（export_jobs 参照）
+                    start_export(
+                        "create_export_jobs", export_sheet,
+                        f"SkillSheetOutput_{name_val}_{dt.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                        "SkillSheet.xlsx", template_path=TEMPLATE_PATH,
                     )
-                    proj_ws.append(headers)
-                    for p in reordered_projects:
-                        row = [
-                            p.get("period_start", ""),
-                            p.get("period_end", ""),
-                            p.get("system_and_work", ""),
-                            p.get("role", ""),
-                            p.get("industry", ""),
-                            *[1 if p["phases"].get(label) else 0 for label in PHASE_LABELS],
-                            p.get("headcount", ""),
-                            *p.get("env_langs", [])[:ENV_MAX],
-                            *p.get("env_tools", [])[:ENV_MAX],
-                            *p.get("env_dbs", [])[:ENV_MAX],
-                            *p.get("env_oss", [])[:ENV_MAX],
-                        ]
-                        proj_ws.append(row)
-                    wb.save(OUTPUT_PATH)
-                    st.success("Excelに出力しました！")
-                    with open(OUTPUT_PATH, "rb") as f:
-                        st.download_button("ダウンロード", f, file_name="SkillSheet.xlsx")
+                    st.success("Excel出力を受け付けました。出来上がるとダウンロードボタンが表示されます。")
                 except Exception as e:
                     st.error(f"Excel出力中にエラーが発生しました: {e}")
 
@@ -843,5 +614,7 @@ with st.container():
                     st.error("データベースの保存に失敗しました。")
                     st.session_state["db_saved"] = False
                     st.session_state["db_save_btn_disabled"] = False
+    # 出力中・出力済みのExcel（再実行しても残る）
+    show_export_jobs("create_export_jobs")
 
 
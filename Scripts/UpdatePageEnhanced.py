@@ -1,18 +1,40 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import os
+import copy
 from datetime import datetime, timedelta
 import re
-from io import BytesIO
 
 # --- 追加: Excel出力に必要なライブラリ ---
-import shutil
-import openpyxl
+from excel_template import TEMPLATE_PATH
+from export_cache import invalidate_sheet
+from export_job_panel import show_export_jobs, start_export
+
+from query_cache import cached_read
+from page_queries import UPDATE_PAGE_SHEETS_SQL
+from db_writer import execute_write
+from sheet_store import (
+    normalize_skill_name, split_skill_items, upsert_skills,
+    SheetUnitOfWork, changed_fields, changed_skill_years,
+    delete_projects, insert_project,
+    load_sheet,
+    project_skill_keys, recompute_sheet_skills, sheet_skill_months, form_skill_months, ENV_TYPES,
+)
+from project_phases import PHASE_LABELS, project_phases
+from experience import format_experience, months_to_years_months, to_months
+from project_periods import normalize_ym
 
 # データベースパス
 DB_PATH = os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
 
+
+def write_sheet(user_id, fn):
+    """スキルシートへの書き込み（書き込み後にそのシートのExcel出力のキャッシュを捨てる）"""
+    try:
+        return execute_write(DB_PATH, fn)
+    finally:
+        invalidate_sheet(user_id)
+
 st.title("📝 スキルシート更新")
 
 # ページ内ナビゲーション
@@ -27,38 +49,20 @@ st.markdown("---")
 # データベースからユーザー一覧を取得
 def get_user_list():
     """データ一覧を取得（ログインユーザーが作成したスキルシートのみ）"""
-    conn = sqlite3.connect(DB_PATH)
+    login_user_id = st.session_state.get('user_id')
+
+    def _load(conn):
+        # ログインユーザーが作成したスキルシートのみ表示
+        if not login_user_id:
+            return pd.DataFrame()
+        return pd.read_sql_query(UPDATE_PAGE_SHEETS_SQL, conn, params=[login_user_id])
+
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_info'")
-        login_user_id = st.session_state.get('user_id')
-        
-        if cursor.fetchone():
-            # ログインユーザーが作成したスキルシートのみ表示
-            if login_user_id:
-                query = """
-                    SELECT id, name, name_kana, created_at
-                    FROM user_info
-                    WHERE login_user_id = ?
-                    ORDER BY created_at DESC
-                """
-                df = pd.read_sql_query(query, conn, params=[login_user_id])
-            else:
-                df = pd.DataFrame()
-        else:
-            # 旧スキーマの場合は全件表示（後方互換性のため）
-            query = """
-                SELECT id, name, name_kana, created_at
-                FROM basic_info
-                ORDER BY created_at DESC
-            """
-            df = pd.read_sql_query(query, conn)
-        return df
+        # 再実行のたびにDBへ問い合わせないよう、DBが変わるまでは前回の結果を使う
+        return cached_read(DB_PATH, "user_list", _load, scope=login_user_id).copy()
     except Exception as e:
         st.error(f"データ一覧の取得に失敗しました: {str(e)}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
 # ユーザー選択
 st.subheader("更新するデータを選択してください")
@@ -93,396 +97,70 @@ edit_mode = st.radio(
 st.markdown("---")
 
 if selected_user:
-        # ユーティリティ: スキル名の正規化（記号除去・空白トリム）
-        def normalize_skill_name(name):
-            if name is None:
-                return ""
-            s = str(name).strip()
-            # 記号除去: [ ] ' " など
-            s = re.sub(r"^[\[\]'\"]+|[\[\]'\"]+$", "", s)
-            s = s.strip()
-            return s
-
-        # 年月→「〇年〇ヶ月」表記
-        def float_to_year_month(val):
-            try:
-                total_months = int(round(float(val) * 12))
-                years = total_months // 12
-                months = total_months % 12
-                if years > 0 and months > 0:
-                    return f"{years}年{months}ヶ月"
-                elif years > 0:
-                    return f"{years}年"
-                elif months > 0:
-                    return f"{months}ヶ月"
-                else:
-                    return "0ヶ月"
-            except Exception:
-                return ""
-
-        # 「〇年〇ヶ月」→ float年
-        def year_month_to_float(years, months):
+        # 選択されたスキルシート（基本情報・スキル・案件）を取得
+        def get_sheet(user_id):
+            login_user_id = st.session_state.get('user_id')
             try:
-                return float(years) + float(months) / 12.0
-            except Exception:
-                return 0.0
-
-        # float年→(年, 月)
-        def float_to_years_months(val):
-            try:
-                total_months = int(round(float(val) * 12))
-                years = total_months // 12
-                months = total_months % 12
-                return years, months
-            except Exception:
-                return 0, 0
-
-        # 選択されたユーザーの詳細情報を取得
-        def get_user_details(user_id):
-            conn = sqlite3.connect(DB_PATH)
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_info'")
-                if cursor.fetchone():
-                    # 新しいスキーマ
-                    user_query = "SELECT * FROM user_info WHERE id = ?"
-                    skills_query = "SELECT * FROM skills WHERE user_info_id = ?"
-                    projects_query = "SELECT * FROM projects WHERE user_info_id = ?"
-                else:
-                    # 古いスキーマ
-                    user_query = "SELECT * FROM basic_info WHERE id = ?"
-                    skills_query = None
-                    projects_query = "SELECT * FROM projects WHERE basic_info_id = ?"
-                user_data = pd.read_sql_query(user_query, conn, params=(user_id,))
-                skills_data = pd.DataFrame()
-                if skills_query:
-                    skills_data = pd.read_sql_query(skills_query, conn, params=(user_id,))
-                projects_data = pd.read_sql_query(projects_query, conn, params=(user_id,))
-                return user_data, skills_data, projects_data
+                # 再実行のたびにDBへ問い合わせないよう、DBが変わるまでは前回の結果を使う
+                return cached_read(
+                    DB_PATH, ("sheet", user_id),
+                    lambda conn: load_sheet(conn, user_id, login_user_id),
+                    scope=login_user_id,
+                )
             except Exception as e:
                 st.error(f"ユーザー詳細の取得に失敗しました: {str(e)}")
-                return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-            finally:
-                conn.close()
+                return None
         
-        user_data, skills_data, projects_data = get_user_details(selected_user)
+        sheet = get_sheet(selected_user)
 
         # --- Excel出力用関数 ---
-        def export_user_to_excel(user_data, skills_data, projects_data):
-            # 必要なライブラリは冒頭でimport済み
-            def safe_write_cell(ws, cell_address, value):
-                try:
-                    cell = ws[cell_address]
-                    if hasattr(cell, 'value') and hasattr(cell, 'coordinate'):
-                        cell.value = value
-                    else:
-                        if hasattr(cell, 'coordinate'):
-                            master_cell = ws[cell.coordinate]
-                            master_cell.value = value
-                except Exception:
-                    pass
-
-            def clean_project_value(val):
-                if val is None:
-                    return ""
-                if isinstance(val, str):
-                    s = val.strip()
-                    if (s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'")):
-                        s = s[1:-1]
-                    if s.startswith("[") and s.endswith("]"):
-                        try:
-                            import ast
-                            parsed = ast.literal_eval(s)
-                            if isinstance(parsed, list):
-                                return ", ".join(str(x).strip('"').strip("'") for x in parsed if str(x).strip() and x not in ["", None, "''", '""', "[]"])
-                            else:
-                                return str(parsed)
-                        except Exception:
-                            return s[1:-1]
-                    return s
-                if isinstance(val, list):
-                    return ", ".join(str(x).strip('"').strip("'") for x in val if str(x).strip() and x not in ["", None, "''", '""', "[]"])
-                return str(val)
-
-            def split_env_items(val):
-                if val is None:
-                    return []
-                if isinstance(val, dict):
-                    return []
-                if isinstance(val, list):
-                    return [str(x).strip() for x in val if str(x).strip() and x not in ["", None, "''", '""', "[]"]]
-                s = str(val).strip()
-                if s.startswith("[") and s.endswith("]"):
-                    try:
-                        import ast
-                        parsed = ast.literal_eval(s)
-                        if isinstance(parsed, list):
-                            return [str(x).strip('"').strip("'").strip() for x in parsed if str(x).strip() and x not in ["", None, "''", '""', "[]"]]
-                    except Exception:
-                        pass
-                items = []
-                for part in s.replace('\r\n', '\n').replace('\r', '\n').replace(',', '\n').split('\n'):
-                    part = part.strip()
-                    if part and part not in ['""', "''", "[]"]:
-                        if part.strip() not in ["", "''", '""', "[]"]:
-                            items.append(part)
-                return items
-
-            def split_qualifications(qual_str):
-                if not qual_str:
-                    return [], []
-                items = []
-                for part in str(qual_str).replace('\r\n', '\n').replace('\r', '\n').replace(',', '\n').split('\n'):
-                    part = part.strip()
-                    if part and part not in ['""', "''", "[]"]:
-                        items.append(part)
-                first6 = items[:6]
-                rest = items[6:]
-                return first6, rest
-
-            # --- テンプレートファイルのパスを Template フォルダ配下に変更 ---
-            template_path = os.path.join(os.path.dirname(__file__), "Template", "SkillSheetTemplate.xlsx")
+        def export_user_to_excel(sheet):
+            # --- テンプレートファイルは templates フォルダ配下 ---
+            template_path = TEMPLATE_PATH
             if not os.path.exists(template_path):
-                st.error("テンプレートファイル（Template/SkillSheetTemplate.xlsx）が見つかりません。")
+                st.error("テンプレートファイル（templates/SkillSheetTemplate.xlsx）が見つかりません。")
                 st.info(
-                    "テンプレートファイル（Template/SkillSheetTemplate.xlsx）がこのアプリのTemplateフォルダに存在しません。"
+                    "テンプレートファイル（templates/SkillSheetTemplate.xlsx）がこのアプリのtemplatesフォルダに存在しません。"
                     "テンプレートが必要な場合は、管理者または開発者に連絡してテンプレートファイルを入手し、"
-                    "このアプリのTemplateフォルダに配置してください。"
+                    "このアプリのtemplatesフォルダに配置してください。"
                 )
-                return None, None
-
-            # 生成ファイルの保存先を明示的に指定し、Streamlitのダウンロードボタンと同時に物理ファイルも残す
-            output_dir = os.path.join(os.path.dirname(__file__), "generated_excels")
-            os.makedirs(output_dir, exist_ok=True)
-            output_filename = f"SkillSheetOutput_{user_data.iloc[0]['name']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-            output_path = os.path.join(output_dir, output_filename)
+                return None
 
             try:
-                shutil.copy(template_path, output_path)
-                wb = openpyxl.load_workbook(output_path)
-                ws = wb.active
-                try:
-                    ws["AG39"] = ""
-                except Exception:
-                    pass
-
-                if not user_data.empty:
-                    user = user_data.iloc[0]
-                    safe_write_cell(ws, "E5", user.get('name', ''))
-                    safe_write_cell(ws, "E4", user.get('name_kana', ''))
-                    safe_write_cell(ws, "T5", user.get('transportation', ''))
-                    safe_write_cell(ws, "AB5", user.get('nearest_station', ''))
-                    safe_write_cell(ws, "AJ5", user.get('access_method', ''))
-                    safe_write_cell(ws, "AM5", user.get('access_time', ''))
-                    safe_write_cell(ws, "Q5", user.get('gender', ''))
-                    safe_write_cell(ws, "AV1", user.get('birth_date', ''))
-                    safe_write_cell(ws, "B8", user.get('final_education', ''))
-                    safe_write_cell(ws, "AE8", user.get('graduation_date', ''))
-                    safe_write_cell(ws, "B27", user.get('self_pr', ''))
-                    qual_items, qual_rest = [], []
-                    if 'qualifications' in user:
-                        qual_items, qual_rest = split_qualifications(user.get('qualifications', ''))
-                    qual_cells = ["B10", "B11", "B12", "V10", "V11", "V12"]
-                    for i, cell in enumerate(qual_cells):
-                        val = qual_items[i] if i < len(qual_items) else ""
-                        safe_write_cell(ws, cell, val)
-                    if qual_rest:
-                        extra_cells = []
-                        for n in range(13, 30):
-                            extra_cells.append(f"B{n}")
-                            extra_cells.append(f"V{n}")
-                        for i, val in enumerate(qual_rest):
-                            if i < len(extra_cells):
-                                safe_write_cell(ws, extra_cells[i], val)
-                    safe_write_cell(ws, "B29", "")
-
-                skill_types = ['language', 'tool', 'db', 'machine']
-                skill_cell_map = {
-                    'language': {'name': 'B', 'years': 'H', 'row_start': 15},
-                    'tool': {'name': 'L', 'years': 'R', 'row_start': 15},
-                    'db': {'name': 'V', 'years': 'AB', 'row_start': 15},
-                    'machine': {'name': 'AF', 'years': 'AL', 'row_start': 15},
-                }
-                for skill_type in skill_types:
-                    cell_info = skill_cell_map[skill_type]
-                    if not skills_data.empty:
-                        type_skills = skills_data[skills_data['skill_type'] == skill_type]
-                        for i in range(10):
-                            if i < len(type_skills):
-                                skill = type_skills.iloc[i]
-                                skill_name = normalize_skill_name(skill['skill_name'])
-                                years_val = skill['experience_years']
-                                years_str = float_to_year_month(years_val)
-                                safe_write_cell(ws, f"{cell_info['name']}{cell_info['row_start']+i}", skill_name)
-                                safe_write_cell(ws, f"{cell_info['years']}{cell_info['row_start']+i}", years_str)
-                            else:
-                                safe_write_cell(ws, f"{cell_info['name']}{cell_info['row_start']+i}", "")
-                                safe_write_cell(ws, f"{cell_info['years']}{cell_info['row_start']+i}", "")
-                    else:
-                        for i in range(10):
-                            safe_write_cell(ws, f"{cell_info['name']}{cell_info['row_start']+i}", "")
-                            safe_write_cell(ws, f"{cell_info['years']}{cell_info['row_start']+i}", "")
-
-                project_base_rows = [37, 50, 63]
-                project_cell_map = {
-                    "period_start": lambda base: f"D{base}",
-                    "period_end": lambda base: f"E{base+1}",
-                    "system_name": lambda base: f"J{base+3}",
-                    "role": lambda base: f"T{base+2}",
-                    "industry": lambda base: f"L{base+2}",
-                    "headcount": lambda base: f"Z{base+2}",
-                    "env_langs": lambda base, i: f"AD{base+2+i}",
-                    "env_dbs": lambda base, i: f"AJ{base+2+i}",
-                    "env_tools": lambda base, i: f"AG{base+2+i}",
-                    "env_oss": lambda base, i: f"AM{base+2+i}",
-                    "work_content": lambda base: f"B{base+3}",
-                    "phases": lambda base: f"AP{base+1}",
-                }
-                max_projects = 3
-
-                projects_list = []
-                if not projects_data.empty:
-                    if 'period_start' in projects_data.columns:
-                        try:
-                            projects_data_sorted = projects_data.copy()
-                            projects_data_sorted['period_start_sort'] = pd.to_datetime(projects_data_sorted['period_start'], errors='coerce')
-                            projects_data_sorted = projects_data_sorted.sort_values('period_start_sort', ascending=False)
-                            projects_list = [row for _, row in projects_data_sorted.iterrows()]
-                        except Exception:
-                            projects_list = [row for _, row in projects_data.sort_values('id', ascending=False).iterrows()]
-                    else:
-                        projects_list = [row for _, row in projects_data.sort_values('id', ascending=False).iterrows()]
-                for proj_idx in range(max_projects):
-                    base_row = project_base_rows[proj_idx]
-                    if proj_idx < len(projects_list):
-                        project = projects_list[proj_idx]
-                        safe_write_cell(ws, project_cell_map["period_start"](base_row), clean_project_value(project.get('period_start', '')))
-                        safe_write_cell(ws, project_cell_map["period_end"](base_row), clean_project_value(project.get('period_end', '')))
-                        safe_write_cell(ws, project_cell_map["system_name"](base_row), clean_project_value(project.get('system_name', '')))
-                        safe_write_cell(ws, project_cell_map["role"](base_row), clean_project_value(project.get('role', '')))
-                        safe_write_cell(ws, project_cell_map["industry"](base_row), clean_project_value(project.get('industry', '')))
-                        safe_write_cell(ws, project_cell_map["headcount"](base_row), clean_project_value(project.get('headcount', '')))
-                        safe_write_cell(ws, project_cell_map["work_content"](base_row), clean_project_value(project.get('work_content', '')))
-                        phases_val = project.get('phases', '')
-                        phase_labels = [
-                            "環境構築", "要件", "基本", "詳細", "製造", "単体", "結合", "総合", "保守運用", "他"
-                        ]
-                        phase_columns = ["J", "L", "N", "P", "R", "T", "V", "X", "Z", "AB"]
-
-                        def is_phase_checked(val, label):
-                            try:
-                                if isinstance(val, dict):
-                                    return bool(val.get(label, False))
-                                if isinstance(val, list):
-                                    return label in val
-                                s = str(val)
-                                if s.startswith("[") and s.endswith("]"):
-                                    import ast
-                                    try:
-                                        parsed = ast.literal_eval(s)
-                                        if isinstance(parsed, list):
-                                            return label in [str(x) for x in parsed]
-                                    except Exception:
-                                        pass
-                                for part in s.replace('\n', ',').split(','):
-                                    if part.strip() == label:
-                                        return True
-                            except Exception:
-                                return False
-                            return False
-
-                        target_row = base_row + 1
-                        for col_letter, label in zip(phase_columns, phase_labels):
-                            ws[f"{col_letter}{target_row}"] = "●" if is_phase_checked(phases_val, label) else ""
-
-                        def safe_split_env_items(val):
-                            if isinstance(val, dict):
-                                return []
-                            try:
-                                import math
-                                if isinstance(val, float) and math.isnan(val):
-                                    return []
-                            except Exception:
-                                pass
-                            items = split_env_items(val)
-                            return [x for x in items if x and x.strip() not in {"nan", "none", "", "''", '""', "[]"}]
-                        
-                        env_langs_list = safe_split_env_items(project.get('env_langs', ''))
-                        env_dbs_list = safe_split_env_items(project.get('env_dbs', ''))
-                        env_tools_list = safe_split_env_items(project.get('env_tools', ''))
-                        env_oss_list = safe_split_env_items(project.get('env_oss', ''))
-
-                        for i in range(3):
-                            val = env_langs_list[i] if i < len(env_langs_list) else ""
-                            safe_write_cell(ws, project_cell_map["env_langs"](base_row, i), val)
-                        for i in range(3):
-                            val = env_dbs_list[i] if i < len(env_dbs_list) else ""
-                            safe_write_cell(ws, project_cell_map["env_dbs"](base_row, i), val)
-                        for i in range(3):
-                            val = env_tools_list[i] if i < len(env_tools_list) else ""
-                            safe_write_cell(ws, project_cell_map["env_tools"](base_row, i), val)
-                        for i in range(3):
-                            val = env_oss_list[i] if i < len(env_oss_list) else ""
-                            safe_write_cell(ws, project_cell_map["env_oss"](base_row, i), val)
-                    else:
-                        safe_write_cell(ws, project_cell_map["period_start"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["period_end"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["system_name"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["role"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["industry"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["headcount"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["work_content"](base_row), "")
-                        safe_write_cell(ws, project_cell_map["phases"](base_row), "")
-                        for i in range(3):
-                            safe_write_cell(ws, project_cell_map["env_langs"](base_row, i), "")
-                            safe_write_cell(ws, project_cell_map["env_dbs"](base_row, i), "")
-                            safe_write_cell(ws, project_cell_map["env_tools"](base_row, i), "")
-                            safe_write_cell(ws, project_cell_map["env_oss"](base_row, i), "")
-
-                wb.save(output_path)
-                # 物理ファイルのパスをStreamlitで明示表示
-                st.info(f"生成されたExcelファイル: `{output_path}`")
-                with open(output_path, 'rb') as f:
-                    output = BytesIO(f.read())
-                # ファイルは削除しない（物理的に残す）
-                return output, output_path
+                # 出力はジョブとして子プロセスで行い、この画面は完了を待たない（export_jobs 参照）
+                # 控えの保存は設定で有効な場合のみ（artifact_store 参照）
+                output_filename = f"SkillSheetOutput_{sheet.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+                return start_export("update_export_jobs", sheet, output_filename, f"{sheet.name}SkillSheet.xlsx")
 
             except Exception as e:
                 st.error(f"Excel出力中にエラーが発生しました: {str(e)}")
-                return None, None
+                return None
 
         # Excel出力ボタン
         st.markdown("### データ出力")
         excel_btn_col, _ = st.columns([1, 9])
         with excel_btn_col:
             if st.button("このデータをExcel出力", key="export_excel"):
-                excel_bytes, output_path = export_user_to_excel(user_data, skills_data, projects_data)
-                if excel_bytes:
-                    st.download_button(
-                        label="ダウンロード（Excel）",
-                        data=excel_bytes,
-                        file_name=f"{user_data.iloc[0]['name']}SkillSheet.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    st.success(f"Excelファイルが生成されました: `{output_path}`")
-                else:
+                if not export_user_to_excel(sheet):
                     st.error("Excelファイルの生成に失敗しました。")
+        # 出力中・出力済みのジョブ（再実行しても残る）
+        show_export_jobs("update_export_jobs")
 
         # --- 以下は元のまま ---
-        if not user_data.empty:
+        if sheet is not None:
             # 基本情報の表示と編集
             if edit_mode == "基本情報の編集":
                 st.subheader("基本情報の編集")
                 with st.form("edit_basic_info_form"):
                     col1, col2 = st.columns(2)
                     with col1:
-                        name = st.text_input("氏名", value=user_data.iloc[0]['name'], key="edit_name")
-                        name_kana = st.text_input("カナ", value=user_data.iloc[0]['name_kana'], key="edit_name_kana")
-                        gender = st.selectbox("性別", ["男", "女"], index=0 if user_data.iloc[0]['gender'] == "男" else 1, key="edit_gender")
+                        name = st.text_input("氏名", value=sheet.name, key="edit_name")
+                        name_kana = st.text_input("カナ", value=sheet.name_kana, key="edit_name_kana")
+                        gender = st.selectbox("性別", ["男", "女"], index=0 if sheet.gender == "男" else 1, key="edit_gender")
                         birth_date_value = None
-                        if user_data.iloc[0]['birth_date']:
+                        if sheet.birth_date:
                             try:
-                                birth_date_str = str(user_data.iloc[0]['birth_date'])
+                                birth_date_str = str(sheet.birth_date)
                                 if '/' in birth_date_str:
                                     birth_date_value = datetime.strptime(birth_date_str, '%Y/%m/%d').date()
                                 else:
@@ -490,60 +168,41 @@ if selected_user:
                             except:
                                 birth_date_value = None
                         birth_date = st.date_input("生年月日", value=birth_date_value, key="edit_birth_date")
-                        final_education = st.text_input("最終学歴", value=user_data.iloc[0]['final_education'], key="edit_final_education")
+                        final_education = st.text_input("最終学歴", value=sheet.final_education, key="edit_final_education")
                     with col2:
-                        transportation = st.text_input("電車", value=user_data.iloc[0]['transportation'], key="edit_transportation")
-                        nearest_station = st.text_input("最寄り駅", value=user_data.iloc[0]['nearest_station'], key="edit_nearest_station")
+                        transportation = st.text_input("電車", value=sheet.transportation, key="edit_transportation")
+                        nearest_station = st.text_input("最寄り駅", value=sheet.nearest_station, key="edit_nearest_station")
                         access_method = st.selectbox("駅からの交通手段", ["徒歩", "自転車", "バス", "車"], 
-                                                   index=["徒歩", "自転車", "バス", "車"].index(user_data.iloc[0]['access_method']) if user_data.iloc[0]['access_method'] in ["徒歩", "自転車", "バス", "車"] else 0, 
+                                                   index=["徒歩", "自転車", "バス", "車"].index(sheet.access_method) if sheet.access_method in ["徒歩", "自転車", "バス", "車"] else 0, 
                                                    key="edit_access_method")
-                        access_time = st.text_input("所要時間(分)", value=user_data.iloc[0]['access_time'], key="edit_access_time")
-                        graduation_date = st.text_input("卒業年月", value=user_data.iloc[0]['graduation_date'], key="edit_graduation_date")
-                    self_pr = st.text_area("自己PR", value=user_data.iloc[0]['self_pr'], key="edit_self_pr")
-                    qualifications = st.text_area("資格", value=user_data.iloc[0]['qualifications'], key="edit_qualifications")
+                        access_time = st.text_input("所要時間(分)", value=sheet.access_time, key="edit_access_time")
+                        graduation_date = st.text_input("卒業年月", value=sheet.graduation_date, key="edit_graduation_date")
+                    self_pr = st.text_area("自己PR", value=sheet.self_pr, key="edit_self_pr")
+                    qualifications = st.text_area("資格", value=sheet.qualifications, key="edit_qualifications")
                     submitted = st.form_submit_button("基本情報を更新", type="primary")
                     if submitted:
                         def update_basic_info(user_id, updated_data):
-                            conn = sqlite3.connect(DB_PATH)
-                            try:
-                                cursor = conn.cursor()
-                                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_info'")
-                                use_new_schema = cursor.fetchone() is not None
-                                if use_new_schema:
-                                    cursor.execute("""
-                                        UPDATE user_info SET 
-                                        name = ?, name_kana = ?, transportation = ?, nearest_station = ?,
-                                        access_method = ?, access_time = ?, gender = ?, birth_date = ?,
-                                        final_education = ?, graduation_date = ?, self_pr = ?, qualifications = ?
-                                        WHERE id = ?
-                                    """, (
-                                        updated_data['name'], updated_data['name_kana'], updated_data['transportation'],
-                                        updated_data['nearest_station'], updated_data['access_method'], updated_data['access_time'],
-                                        updated_data['gender'], updated_data['birth_date'], updated_data['final_education'],
-                                        updated_data['graduation_date'], updated_data['self_pr'], updated_data['qualifications'],
-                                        user_id
-                                    ))
-                                else:
-                                    cursor.execute("""
-                                        UPDATE basic_info SET 
-                                        name = ?, name_kana = ?, transportation = ?, nearest_station = ?,
-                                        access_method = ?, access_time = ?, gender = ?, birth_date = ?,
-                                        final_education = ?, graduation_date = ?, self_pr = ?
-                                        WHERE id = ?
-                                    """, (
-                                        updated_data['name'], updated_data['name_kana'], updated_data['transportation'],
-                                        updated_data['nearest_station'], updated_data['access_method'], updated_data['access_time'],
-                                        updated_data['gender'], updated_data['birth_date'], updated_data['final_education'],
-                                        updated_data['graduation_date'], updated_data['self_pr'], user_id
-                                    ))
-                                conn.commit()
+                            def _write(conn):
+                                conn.execute("""
+                                    UPDATE user_info SET
+                                    name = ?, name_kana = ?, transportation = ?, nearest_station = ?,
+                                    access_method = ?, access_time = ?, gender = ?, birth_date = ?,
+                                    final_education = ?, graduation_date = ?, self_pr = ?, qualifications = ?
+                                    WHERE id = ?
+                                """, (
+                                    updated_data['name'], updated_data['name_kana'], updated_data['transportation'],
+                                    updated_data['nearest_station'], updated_data['access_method'], updated_data['access_time'],
+                                    updated_data['gender'], updated_data['birth_date'], updated_data['final_education'],
+                                    updated_data['graduation_date'], updated_data['self_pr'], updated_data['qualifications'],
+                                    user_id
+                                ))
                                 return True
+
+                            try:
+                                return write_sheet(user_id, _write)
                             except Exception as e:
-                                conn.rollback()
                                 st.error(f"基本情報の更新に失敗しました: {str(e)}")
                                 return False
-                            finally:
-                                conn.close()
                         updated_data = {
                             'name': name,
                             'name_kana': name_kana,
@@ -567,13 +226,13 @@ if selected_user:
                 st.subheader("基本情報")
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.write(f"**氏名:** {user_data.iloc[0]['name']}")
-                    st.write(f"**カナ:** {user_data.iloc[0]['name_kana']}")
-                    st.write(f"**性別:** {user_data.iloc[0]['gender']}")
+                    st.write(f"**氏名:** {sheet.name}")
+                    st.write(f"**カナ:** {sheet.name_kana}")
+                    st.write(f"**性別:** {sheet.gender}")
                 with col2:
-                    st.write(f"**最寄り駅:** {user_data.iloc[0]['nearest_station']}")
-                    st.write(f"**交通手段:** {user_data.iloc[0]['access_method']}")
-                    st.write(f"**所要時間:** {user_data.iloc[0]['access_time']}分")
+                    st.write(f"**最寄り駅:** {sheet.nearest_station}")
+                    st.write(f"**交通手段:** {sheet.access_method}")
+                    st.write(f"**所要時間:** {sheet.access_time}分")
             st.markdown("---")
             
             # 案件情報の表示・編集
@@ -581,28 +240,32 @@ if selected_user:
                 st.subheader("案件情報の編集")
                 
                 # --- 案件情報の出力順を「新しい順」にする ---
-                projects_list = []
-                if not projects_data.empty:
-                    if 'period_start' in projects_data.columns:
-                        try:
-                            projects_data_sorted = projects_data.copy()
-                            projects_data_sorted['period_start_sort'] = pd.to_datetime(projects_data_sorted['period_start'], errors='coerce')
-                            projects_data_sorted = projects_data_sorted.sort_values('period_start_sort', ascending=False)
-                            projects_list = [row for _, row in projects_data_sorted.iterrows()]
-                        except Exception:
-                            projects_list = [row for _, row in projects_data.sort_values('id', ascending=False).iterrows()]
-                    else:
-                        projects_list = [row for _, row in projects_data.sort_values('id', ascending=False).iterrows()]
+                # 開始年月（start_month_idx）の新しい順に読み込み済み
+                projects_list = sheet.projects
 
                 # 編集フォームの値を一時保存するためのセッションステート
                 if "edit_projects_buffer" not in st.session_state or st.session_state.get("edit_projects_buffer_user") != selected_user:
                     st.session_state["edit_projects_buffer"] = []
                     for project in projects_list:
-                        st.session_state["edit_projects_buffer"].append(dict(project))
+                        st.session_state["edit_projects_buffer"].append(project.to_dict())
                     st.session_state["edit_projects_buffer_user"] = selected_user
+                    # 読み込み時点の値（フォーム表示形式）。保存時はこれとの差分だけを書き込む
+                    st.session_state["edit_projects_baseline"] = {}
 
                 # 編集用バッファ
                 edit_projects_buffer = st.session_state["edit_projects_buffer"]
+                edit_projects_baseline = st.session_state.setdefault("edit_projects_baseline", {})
+
+                # 期間の入った案件で使ったスキルは、保存時に案件期間から計算し直すため年数の入力欄を出さない
+                # （未反映の入力も含めた編集中の値で計算して表示する）
+                derived_months = form_skill_months([
+                    {
+                        'period_start': st.session_state.get(f"edit_proj_{i}_period_start", p.get('period_start')),
+                        'period_end': st.session_state.get(f"edit_proj_{i}_period_end", p.get('period_end')),
+                        **{env_type: st.session_state.get(f"edit_proj_{i}_{env_type}", p.get(env_type, '')) for env_type in ENV_TYPES},
+                    }
+                    for i, p in enumerate(edit_projects_buffer)
+                ])
 
                 st.write("**現在の案件情報:**")
                 expander_states = []
@@ -611,24 +274,8 @@ if selected_user:
                         # --- 編集フォーム ---
                         col1, col2 = st.columns(2)
                         with col1:
-                            def parse_ym(val):
-                                if not val:
-                                    return ""
-                                if isinstance(val, str):
-                                    try:
-                                        if "/" in val:
-                                            return datetime.strptime(val, "%Y/%m").strftime("%Y/%m")
-                                        elif "-" in val:
-                                            return datetime.strptime(val, "%Y-%m").strftime("%Y/%m")
-                                        elif len(val) == 6 and val.isdigit():
-                                            return f"{val[:4]}/{val[4:]}"
-                                    except:
-                                        return val
-                                elif isinstance(val, datetime):
-                                    return val.strftime("%Y/%m")
-                                return str(val)
-                            period_start_ym = parse_ym(project.get('period_start', ''))
-                            period_end_ym = parse_ym(project.get('period_end', ''))
+                            period_start_ym = normalize_ym(project.get('period_start', ''))
+                            period_end_ym = normalize_ym(project.get('period_end', ''))
                             period_start = st.text_input("開始年月 (yyyy/MM)", value=period_start_ym, key=f"edit_proj_{idx}_period_start")
                             period_end = st.text_input("終了年月 (yyyy/MM)", value=period_end_ym, key=f"edit_proj_{idx}_period_end")
                             system_name = st.text_input("システム名・作業内容", value=project.get('system_name', ''), key=f"edit_proj_{idx}_system_name")
@@ -652,30 +299,9 @@ if selected_user:
                             headcount = st.text_input("人数", value=project.get('headcount', ''), key=f"edit_proj_{idx}_headcount")
                         st.write("**工程:**")
                         phase_cols = st.columns(5)
-                        current_phases = []
-                        phases_raw = project.get('phases', '')
-                        if phases_raw:
-                            try:
-                                if isinstance(phases_raw, list):
-                                    current_phases = phases_raw
-                                elif isinstance(phases_raw, str):
-                                    if phases_raw.startswith('[') and phases_raw.endswith(']'):
-                                        import ast
-                                        try:
-                                            parsed = ast.literal_eval(phases_raw)
-                                            if isinstance(parsed, list):
-                                                current_phases = parsed
-                                            else:
-                                                current_phases = []
-                                        except Exception:
-                                            current_phases = []
-                                    else:
-                                        current_phases = [phases_raw] if phases_raw else []
-                            except:
-                                current_phases = []
+                        current_phases = project_phases(project)
                         phases = []
-                        phase_options = ["環境構築", "要件", "基本", "詳細", "製造", "単体", "結合", "総合", "保守運用", "他"]
-                        for i, phase in enumerate(phase_options):
+                        for i, phase in enumerate(PHASE_LABELS):
                             with phase_cols[i % 5]:
                                 checked = phase in current_phases
                                 if st.checkbox(phase, value=checked, key=f"edit_proj_{idx}_phase_{i}"):
@@ -692,9 +318,11 @@ if selected_user:
                         env_years_dicts = {}
                         for i, (env_type, env_label, env_key) in enumerate(env_types):
                             env_val = project.get(env_type, "")
+                            if isinstance(env_val, list):
+                                env_val = "\n".join(env_val)
                             years_dict_key = f"edit_proj_{idx}_{env_type}_years"
                             if years_dict_key not in st.session_state:
-                                env_items = [normalize_skill_name(x) for x in re.split(r"[\n,]", str(env_val)) if normalize_skill_name(x) and normalize_skill_name(x) not in ["''", '""', "[]"]]
+                                env_items = split_skill_items(env_val)
                                 # 新しい形式: 年/月入力
                                 st.session_state[years_dict_key] = {x: (0, 0) for x in env_items}
                             with env_cols[i]:
@@ -704,18 +332,17 @@ if selected_user:
                                 # 既存の値をfloat→(年,月)に変換
                                 for x in env_items:
                                     if x not in years_dict:
-                                        # skills_dataから既存年数を取得
-                                        years, months = 0, 0
-                                        if not skills_data.empty:
-                                            skill_row = skills_data[(skills_data['skill_type'] == env_key) & (skills_data['skill_name'] == x)]
-                                            if not skill_row.empty:
-                                                y, m = float_to_years_months(skill_row.iloc[0]['experience_years'])
-                                                years, months = y, m
-                                        years_dict[x] = (years, months)
+                                        # 登録済みスキルの経験年数を初期値にする
+                                        skill = sheet.find_skill(env_key, x)
+                                        years_dict[x] = months_to_years_months(skill.experience_months if skill else None)
                                 for k in list(years_dict.keys()):
-                                    if k not in env_items:
+                                    if k not in env_items or (env_key, k) in derived_months:
                                         del years_dict[k]
                                 for x in env_items:
+                                    if (env_key, x) in derived_months:
+                                        y, m = months_to_years_months(derived_months[env_key, x])
+                                        st.caption(f"{env_label}「{x}」経験年数: {y}年{m}ヶ月（案件期間から計算）")
+                                        continue
                                     year_key = f"edit_proj_{idx}_{env_type}_years_{x}_year"
                                     month_key = f"edit_proj_{idx}_{env_type}_years_{x}_month"
                                     default_year, default_month = years_dict.get(x, (0, 0))
@@ -735,18 +362,19 @@ if selected_user:
 
                         if st.button("案件を削除", key=f"edit_proj_{idx}_delete"):
                             def delete_project(project_id):
-                                conn = sqlite3.connect(DB_PATH)
-                                try:
-                                    cursor = conn.cursor()
-                                    cursor.execute("DELETE FROM projects WHERE id = ?", (project.get('id'),))
-                                    conn.commit()
+                                def _write(conn):
+                                    # 削除した案件のスキルは残りの案件の期間で経験月数を再計算（どの案件でも使われなくなれば 0）
+                                    skill_keys = project_skill_keys(conn, [project.get('id')])
+                                    covered_before = set(sheet_skill_months(conn, selected_user, skill_keys))
+                                    delete_projects(conn, "id = ?", (project.get('id'),))
+                                    recompute_sheet_skills(conn, selected_user, skill_keys, covered_before)
                                     return True
+
+                                try:
+                                    return write_sheet(selected_user, _write)
                                 except Exception as e:
-                                    conn.rollback()
                                     st.error(f"案件情報の削除に失敗しました: {str(e)}")
                                     return False
-                                finally:
-                                    conn.close()
                             if delete_project(project.get('id')):
                                 st.success("案件情報を削除しました！")
                                 del st.session_state["edit_projects_buffer"]
@@ -763,74 +391,16 @@ if selected_user:
                         for env_type, _, env_key in env_types:
                             edit_projects_buffer[idx][env_type] = st.session_state.get(f"edit_proj_{idx}_{env_type}", project.get(env_type, ''))
                             edit_projects_buffer[idx][f"{env_type}_years"] = st.session_state.get(f"edit_proj_{idx}_{env_type}_years", st.session_state.get(f"edit_proj_{idx}_{env_type}_years", {}))
+                        if idx not in edit_projects_baseline:
+                            edit_projects_baseline[idx] = copy.deepcopy(edit_projects_buffer[idx])
 
                 if st.button("すべての案件情報を更新", key="update_all_projects"):
-                    def update_skills_with_env_items(user_id, env_type, env_items, years_dict):
-                        conn = sqlite3.connect(DB_PATH)
-                        try:
-                            cursor = conn.cursor()
-                            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_info'")
-                            use_new_schema = cursor.fetchone() is not None
-                            if not use_new_schema:
-                                return
-                            cursor.execute("SELECT skill_type, skill_name, experience_years FROM skills WHERE user_info_id = ?", (user_id,))
-                            all_skills = cursor.fetchall()
-                            skill_dict = {}
-                            for skill_type, skill_name, exp in all_skills:
-                                norm_name = normalize_skill_name(skill_name)
-                                skill_dict[(skill_type, norm_name)] = exp
-                            for item in env_items:
-                                norm_item = normalize_skill_name(item)
-                                if not norm_item or norm_item in ["''", '""', "[]"]:
-                                    continue
-                                y, m = years_dict.get(norm_item, (0, 0))
-                                years = year_month_to_float(y, m)
-                                key = (env_type, norm_item)
-                                if key in skill_dict:
-                                    new_years = years  # 上書き方式
-                                    cursor.execute("""
-                                        UPDATE skills SET experience_years = ? 
-                                        WHERE user_info_id = ? AND skill_type = ? AND skill_name = ?
-                                    """, (new_years, user_id, env_type, norm_item))
-                                else:
-                                    cursor.execute("""
-                                        INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years)
-                                        VALUES (?, ?, ?, ?)
-                                    """, (user_id, env_type, norm_item, years))
-                            conn.commit()
-                        except Exception as e:
-                            conn.rollback()
-                            st.error(f"スキル経験年数の更新に失敗しました: {str(e)}")
-                        finally:
-                            conn.close()
-                    def update_project(project_id, updated_data):
-                        conn = sqlite3.connect(DB_PATH)
-                        try:
-                            cursor = conn.cursor()
-                            cursor.execute("""
-                                UPDATE projects SET 
-                                period_start = ?, period_end = ?, system_name = ?,
-                                role = ?, industry = ?, work_content = ?, phases = ?,
-                                headcount = ?, env_langs = ?, env_tools = ?,
-                                env_dbs = ?, env_oss = ?
-                                WHERE id = ?
-                            """, (
-                                updated_data['period_start'], updated_data['period_end'],
-                                updated_data['system_name'], updated_data['role'], updated_data['industry'],
-                                updated_data.get('work_content', ''), str(updated_data['phases']) if not isinstance(updated_data['phases'], dict) else '', updated_data['headcount'],
-                                updated_data['env_langs'], updated_data['env_tools'],
-                                updated_data['env_dbs'], updated_data['env_oss'], project_id
-                            ))
-                            conn.commit()
-                            return True
-                        except Exception as e:
-                            conn.rollback()
-                            st.error(f"案件情報の更新に失敗しました: {str(e)}")
-                            return False
-                        finally:
-                            conn.close()
-                    all_success = True
+                    # 変更のあった案件・スキルだけをまとめ、1トランザクションで反映（失敗時はすべて取り消し）
+                    unit_of_work = SheetUnitOfWork(selected_user)
+                    # 保存後に案件期間から計算されるスキルは、手入力の年数を書き込まない
+                    derived_months = form_skill_months(edit_projects_buffer)
                     for idx, project in enumerate(edit_projects_buffer):
+                        baseline = edit_projects_baseline.get(idx)
                         updated_data = {
                             'period_start': project.get('period_start', ''),
                             'period_end': project.get('period_end', ''),
@@ -851,45 +421,46 @@ if selected_user:
                             ("db", "env_dbs", "env_dbs_years"),
                             ("machine", "env_oss", "env_oss_years"),
                         ]:
-                            env_val = project.get(env_key, "")
                             years_dict = project.get(years_key, {})
-                            env_items = [normalize_skill_name(x) for x in re.split(r"[\n,]", str(env_val)) if normalize_skill_name(x) and normalize_skill_name(x) not in ["''", '""', "[]"]]
-                            update_skills_with_env_items(selected_user, env_type, env_items, years_dict)
-                        if not update_project(project.get('id'), updated_data):
+                            current_years = {item: years_dict.get(item, (0, 0)) for item in split_skill_items(project.get(env_key, ""))}
+                            baseline_years = baseline.get(years_key) if baseline is not None else None
+                            for item, (y, m) in changed_skill_years(baseline_years, current_years).items():
+                                if (env_type, item) not in derived_months:
+                                    unit_of_work.set_skill_months(env_type, item, to_months(y, m))
+                        if changed_fields(baseline, project):
+                            unit_of_work.update_project(project.get('id'), updated_data)
+                    if unit_of_work.is_empty():
+                        st.info("変更はありません。")
+                        all_success = None
+                    else:
+                        try:
+                            all_success = write_sheet(selected_user, unit_of_work.apply)
+                        except Exception as e:
+                            st.error(f"案件情報の更新に失敗しました: {str(e)}")
                             all_success = False
                     if all_success:
                         st.success("すべての案件情報を更新しました！")
                         if "edit_projects_buffer" in st.session_state:
                             del st.session_state["edit_projects_buffer"]
                         st.rerun()
-                    else:
+                    elif all_success is False:
                         st.error("案件情報の更新に失敗しました。")
             elif edit_mode == "新しい案件情報の追加":
                 st.subheader("新しい案件情報の追加")
                 
-                if not projects_data.empty:
-                    if 'period_start' in projects_data.columns:
-                        try:
-                            projects_data_sorted = projects_data.copy()
-                            projects_data_sorted['period_start_sort'] = pd.to_datetime(projects_data_sorted['period_start'], errors='coerce')
-                            projects_data_sorted = projects_data_sorted.sort_values('period_start_sort', ascending=False)
-                            projects_list = [row for _, row in projects_data_sorted.iterrows()]
-                        except Exception:
-                            projects_list = [row for _, row in projects_data.sort_values('id', ascending=False).iterrows()]
-                    else:
-                        projects_list = [row for _, row in projects_data.sort_values('id', ascending=False).iterrows()]
+                if sheet.projects:
                     st.write("**現在の案件情報:**")
-                    for idx, project in enumerate(projects_list):
-                        with st.expander(f"案件 {idx + 1}: {project.get('system_name', 'N/A')}"):
+                    for idx, project in enumerate(sheet.projects):
+                        with st.expander(f"案件 {idx + 1}: {project.system_name}"):
                             col1, col2 = st.columns(2)
                             with col1:
-                                st.write(f"**期間:** {project.get('period_start', 'N/A')} ～ {project.get('period_end', 'N/A')}")
-                                st.write(f"**役割:** {project.get('role', 'N/A')}")
-                                st.write(f"**業種:** {project.get('industry', 'N/A')}")
+                                st.write(f"**期間:** {project.period_start} ～ {project.period_end}")
+                                st.write(f"**役割:** {project.role}")
+                                st.write(f"**業種:** {project.industry}")
                             with col2:
-                                st.write(f"**工程:** {project.get('phases', 'N/A')}")
-                                st.write(f"**人数:** {project.get('headcount', 'N/A')}")
-                                st.write(f"**作業内容:** {project.get('work_content', 'N/A')}")
+                                st.write(f"**工程:** {', '.join(project.phases) or 'N/A'}")
+                                st.write(f"**人数:** {project.headcount}")
+                                st.write(f"**作業内容:** {project.work_content}")
                             st.write("**環境情報:**")
                             env_cols = st.columns(4)
                             for i, (env_type, env_label, env_key) in enumerate([
@@ -899,9 +470,7 @@ if selected_user:
                                 ("env_oss", "OS/マシン", "machine"),
                             ]):
                                 with env_cols[i]:
-                                    env_display = project.get(env_type, 'N/A')
-                                    if isinstance(env_display, dict):
-                                        env_display = 'N/A'
+                                    env_display = ", ".join(project.envs(env_type)) or 'N/A'
                                     st.write(f"**{env_label}:** {env_display}")
                 
                 st.markdown("---")
@@ -909,22 +478,6 @@ if selected_user:
                 with st.form("new_project_form"):
                     col1, col2 = st.columns(2)
                     with col1:
-                        def get_default_ym(val):
-                            if not val:
-                                return ""
-                            if isinstance(val, str):
-                                try:
-                                    if "/" in val:
-                                        return datetime.strptime(val, "%Y/%m").strftime("%Y/%m")
-                                    elif "-" in val:
-                                        return datetime.strptime(val, "%Y-%m").strftime("%Y/%m")
-                                    elif len(val) == 6 and val.isdigit():
-                                        return f"{val[:4]}/{val[4:]}"
-                                except:
-                                    return val
-                            elif isinstance(val, datetime):
-                                return val.strftime("%Y/%m")
-                            return str(val)
                         period_start = st.text_input("開始年月 (yyyy/MM)", key="new_period_start")
                         period_end = st.text_input("終了年月 (yyyy/MM)", key="new_period_end")
                         system_name_work_content = st.text_input("システム名・作業内容", key="new_system_name_work_content")
@@ -944,13 +497,15 @@ if selected_user:
                     st.write("**工程:**")
                     phase_cols = st.columns(5)
                     phases = []
-                    phase_options = ["環境構築", "要件", "基本", "詳細", "製造", "単体", "結合", "総合", "保守運用", "他"]
-                    for i, phase in enumerate(phase_options):
+                    for i, phase in enumerate(PHASE_LABELS):
                         with phase_cols[i % 5]:
                             if st.checkbox(phase, key=f"new_phase_{i}"):
                                 phases.append(phase)
                     
                     st.write("**環境情報:**")
+                    st.caption("期間を入力した案件のスキルは、経験年数を案件期間から計算します（入力した年数は使いません）。")
+                    # 登録済みの期間の入った案件で使っているスキルは、年数の入力欄を出さずに計算値を表示する
+                    derived_months = form_skill_months([p.to_dict() for p in sheet.projects])
                     env_cols = st.columns(4)
                     env_inputs = {}
                     env_years_dicts = {}
@@ -969,18 +524,17 @@ if selected_user:
                             years_dict = st.session_state.get(years_dict_key, {})
                             for x in env_items:
                                 if x not in years_dict:
-                                    # skills_dataから既存年数を取得
-                                    years, months = 0, 0
-                                    if not skills_data.empty:
-                                        skill_row = skills_data[(skills_data['skill_type'] == env_key) & (skills_data['skill_name'] == x)]
-                                        if not skill_row.empty:
-                                            y, m = float_to_years_months(skill_row.iloc[0]['experience_years'])
-                                            years, months = y, m
-                                    years_dict[x] = (years, months)
+                                    # 登録済みスキルの経験年数を初期値にする
+                                    skill = sheet.find_skill(env_key, x)
+                                    years_dict[x] = months_to_years_months(skill.experience_months if skill else None)
                             for k in list(years_dict.keys()):
-                                if k not in env_items:
+                                if k not in env_items or (env_key, k) in derived_months:
                                     del years_dict[k]
                             for x in env_items:
+                                if (env_key, x) in derived_months:
+                                    y, m = months_to_years_months(derived_months[env_key, x])
+                                    st.caption(f"{env_label}「{x}」経験年数: {y}年{m}ヶ月（案件期間から計算）")
+                                    continue
                                 year_key = f"new_{env_type}_years_{x}_year"
                                 month_key = f"new_{env_type}_years_{x}_month"
                                 default_year, default_month = years_dict.get(x, (0, 0))
@@ -1001,114 +555,46 @@ if selected_user:
                     submitted = st.form_submit_button("案件情報を追加", type="primary")
                     
                     if submitted:
-                        def ym_to_date(ym):
-                            try:
-                                return datetime.strptime(ym, "%Y/%m")
-                            except:
-                                try:
-                                    return datetime.strptime(ym, "%Y-%m")
-                                except:
-                                    return None
-
-                        def calculate_years_ym(start_ym, end_ym):
-                            start = ym_to_date(start_ym)
-                            end = ym_to_date(end_ym)
-                            if not start or not end:
-                                return 0
-                            months = (end.year - start.year) * 12 + (end.month - start.month) + 1
-                            return round(months / 12, 2)
+                        def add_project(user_id, project_data, env_years_dicts):
+                            # 追加後に案件期間から計算されるスキル（この案件に期間があれば全部）は、手入力の年数を書き込まない
+                            derived = form_skill_months([p.to_dict() for p in sheet.projects] + [project_data])
+                            rows = []
+                            skill_keys = set()
+                            for skill_type, env_type in [('language', 'env_langs'), ('tool', 'env_tools'), ('db', 'env_dbs'), ('machine', 'env_oss')]:
+                                env_value = project_data[env_type]
+                                if not env_value:
+                                    continue
+                                years_dict = env_years_dicts.get(env_type, {})
+                                for item in split_skill_items(env_value):
+                                    skill_keys.add((skill_type, item))
+                                    if (skill_type, item) in derived:
+                                        continue
+                                    y, m = years_dict.get(item, (0, 0))
+                                    months = to_months(y, m)
+                                    rows.append((user_id, skill_type, item, format_experience(months), months))
+
+                            def _write(conn):
+                                # 案件の追加とスキルの更新は1つのトランザクションで行う（途中で失敗すれば両方とも書き込まない）
+                                covered_before = set(sheet_skill_months(conn, user_id))
+                                insert_project(conn, user_id, project_data)
+                                # 既存行は上書き、未登録は追加（1回の executemany）
+                                upsert_skills(conn, rows)
+                                # 案件期間が入っていれば、経験月数は期間の和集合で上書き（他の書き込みと同じ規則で再計算する）
+                                recompute_sheet_skills(conn, user_id, skill_keys, covered_before)
+                                return True
 
-                        def save_new_project(user_id, project_data):
-                            conn = sqlite3.connect(DB_PATH)
                             try:
-                                cursor = conn.cursor()
-                                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_info'")
-                                use_new_schema = cursor.fetchone() is not None
-                                if use_new_schema:
-                                    cursor.execute("""
-                                        INSERT INTO projects (user_info_id, period_start, period_end, system_name,
-                                                           role, industry, work_content, phases, headcount,
-                                                           env_langs, env_tools, env_dbs, env_oss)
-                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                    """, (
-                                        user_id, project_data['period_start'], project_data['period_end'],
-                                        project_data['system_name'], project_data['role'], project_data['industry'],
-                                        project_data['work_content'], str(phases) if not isinstance(phases, dict) else '', project_data['headcount'],
-                                        project_data['env_langs'], project_data['env_tools'],
-                                        project_data['env_dbs'], project_data['env_oss']
-                                    ))
-
-                                else:
-                                    cursor.execute("""
-                                        INSERT INTO projects (basic_info_id, period_start, period_end, system_name,
-                                                           role, industry, work_content, phases, headcount,
-                                                           env_langs, env_tools, env_dbs, env_oss)
-                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                     """, (
-                                        user_id, project_data['period_start'], project_data['period_end'],
-                                        project_data['system_name'], project_data['role'], project_data['industry'],
-                                        project_data['work_content'], str(phases) if not isinstance(phases, dict) else '', project_data['headcount'],
-                                        project_data['env_langs'], project_data['env_tools'],
-                                        project_data['env_dbs'], project_data['env_oss']
-                                    ))
-                                conn.commit()
-                                return True
+                                return write_sheet(user_id, _write)
                             except Exception as e:
-                                conn.rollback()
                                 st.error(f"案件情報の保存に失敗しました: {str(e)}")
                                 return False
-                            finally:
-                                conn.close()
-                        def update_skills_from_project(user_id, project_data, env_years_dicts):
-                            conn = sqlite3.connect(DB_PATH)
-                            try:
-                                cursor = conn.cursor()
-                                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_info'")
-                                use_new_schema = cursor.fetchone() is not None
-                                if not use_new_schema:
-                                    return
-                                cursor.execute("SELECT skill_type, skill_name, experience_years FROM skills WHERE user_info_id = ?", (user_id,))
-                                all_skills = cursor.fetchall()
-                                skill_dict = {}
-                                for skill_type, skill_name, exp in all_skills:
-                                    norm_name = normalize_skill_name(skill_name)
-                                    skill_dict[(skill_type, norm_name)] = exp
-                                def process_skill_update(skill_type, env_value, years_dict):
-                                    if env_value:
-                                        items = [normalize_skill_name(x) for x in re.split(r'[\n,]', str(env_value)) if normalize_skill_name(x) and normalize_skill_name(x) not in ["''", '""', "[]"]]
-                                        for item in items:
-                                            key = (skill_type, item)
-                                            y, m = years_dict.get(item, (0, 0))
-                                            years = year_month_to_float(y, m)
-                                            if key in skill_dict:
-                                                new_years = years  # 上書き方式
-                                                cursor.execute("""
-                                                    UPDATE skills SET experience_years = ? 
-                                                    WHERE user_info_id = ? AND skill_type = ? AND skill_name = ?
-                                                """, (new_years, user_id, skill_type, item))
-                                            else:
-                                                cursor.execute("""
-                                                    INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years)
-                                                    VALUES (?, ?, ?, ?)
-                                                """, (user_id, skill_type, item, years))
-                                process_skill_update('language', project_data['env_langs'], env_years_dicts.get('env_langs', {}))
-                                process_skill_update('tool', project_data['env_tools'], env_years_dicts.get('env_tools', {}))
-                                process_skill_update('db', project_data['env_dbs'], env_years_dicts.get('env_dbs', {}))
-                                process_skill_update('machine', project_data['env_oss'], env_years_dicts.get('env_oss', {}))
-                                conn.commit()
-                                return True
-                            except Exception as e:
-                                conn.rollback()
-                                st.error(f"スキル情報の更新に失敗しました: {str(e)}")
-                                return False
-                            finally:
-                                conn.close()
                         project_data = {
                             'period_start': period_start,
                             'period_end': period_end,
                             'system_name': system_name_work_content,
                             'role': role,
                             'industry': industry,
+                            'phases': phases,
                             'headcount': headcount,
                             'env_langs': env_inputs.get('env_langs', ''),
                             'env_tools': env_inputs.get('env_tools', ''),
@@ -1117,10 +603,8 @@ if selected_user:
                         }
                         project_data['work_content'] = system_name_work_content
 
-                        if save_new_project(selected_user, project_data):
-                            st.success("案件情報を追加しました！")
-                            if update_skills_from_project(selected_user, project_data, env_years_dicts):
-                                st.success("スキル情報を自動更新しました！")
+                        if add_project(selected_user, project_data, env_years_dicts):
+                            st.success("案件情報を追加し、スキル情報を自動更新しました！")
                             if "edit_projects_buffer" in st.session_state:
                                 del st.session_state["edit_projects_buffer"]
                             st.rerun()
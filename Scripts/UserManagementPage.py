@@ -1,8 +1,9 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import os
 import hashlib
+from query_cache import read_sql_cached
+from db_writer import execute_write
 
 # データベースパス
 DB_PATH = os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
@@ -54,24 +55,19 @@ def hash_password(password):
 
 def get_all_users():
     """全ユーザーを取得"""
-    conn = sqlite3.connect(DB_PATH)
     try:
-        df = pd.read_sql_query(
+        return read_sql_cached(
+            DB_PATH,
             "SELECT id, login_id, password_hash, username, role, created_at FROM users ORDER BY created_at DESC",
-            conn
         )
-        return df
     except Exception as e:
         st.error(f"ユーザー一覧の取得に失敗しました: {str(e)}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
 def create_user(login_id, password, username, role):
     """新規ユーザーを作成"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
+    def _create(conn):
+        cursor = conn.cursor()
         # 重複チェック
         cursor.execute("SELECT id FROM users WHERE login_id = ?", (login_id,))
         if cursor.fetchone():
@@ -82,19 +78,17 @@ def create_user(login_id, password, username, role):
             "INSERT INTO users (login_id, password_hash, username, role) VALUES (?, ?, ?, ?)",
             (login_id, password_hash, username, role)
         )
-        conn.commit()
         return True, "ユーザーを作成しました。"
+
+    try:
+        return execute_write(DB_PATH, _create)
     except Exception as e:
-        conn.rollback()
         return False, f"ユーザー作成エラー: {str(e)}"
-    finally:
-        conn.close()
 
 def update_user(user_id, login_id, password, username, role):
     """ユーザー情報を更新"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
+    def _update(conn):
+        cursor = conn.cursor()
         # 重複チェック（自分以外）
         cursor.execute("SELECT id FROM users WHERE login_id = ? AND id != ?", (login_id, user_id))
         if cursor.fetchone():
@@ -113,32 +107,25 @@ def update_user(user_id, login_id, password, username, role):
                 "UPDATE users SET login_id = ?, username = ?, role = ? WHERE id = ?",
                 (login_id, username, role, user_id)
             )
-        conn.commit()
         return True, "ユーザー情報を更新しました。"
+
+    try:
+        return execute_write(DB_PATH, _update)
     except Exception as e:
-        conn.rollback()
         return False, f"ユーザー更新エラー: {str(e)}"
-    finally:
-        conn.close()
 
 def delete_user(user_id):
     """ユーザーを削除"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     try:
         # 現在ログイン中のユーザーは削除できない
         current_user_id = st.session_state.get('user_id')
         if user_id == current_user_id:
             return False, "現在ログイン中のユーザーは削除できません。"
         
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        conn.commit()
+        execute_write(DB_PATH, lambda conn: conn.execute("DELETE FROM users WHERE id = ?", (user_id,)))
         return True, "ユーザーを削除しました。"
     except Exception as e:
-        conn.rollback()
         return False, f"ユーザー削除エラー: {str(e)}"
-    finally:
-        conn.close()
 
 # タブで機能を分ける
 tab1, tab2, tab3 = st.tabs(["📋 ユーザー一覧", "➕ 新規登録", "✏️ 編集・削除"])
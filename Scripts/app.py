@@ -5,7 +5,10 @@ import os  # ← ここを追加
 import openpyxl  # ← ここに追加
 from io import BytesIO
 import hashlib
-import sqlite3
+from page_registry import run_page
+from db_migrations import ensure_schema
+from db_connection import read_connection
+from page_queries import LOGIN_USER_SQL
 
 # ページ設定
 st.set_page_config(
@@ -30,77 +33,35 @@ if 'STREAMLIT_SERVER_PORT' not in os.environ:
 # --- ログイン認証機能 ---
 DB_PATH = os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
 
+# --- ページ定義（メニュー名 → ページファイル） ---
+PAGE_FILES = {
+    "📝 スキルシート作成": os.path.join(os.path.dirname(__file__), "SkillSheetWebCreate.py"),
+    "📊 データ参照・管理": os.path.join(os.path.dirname(__file__), "DataViewPage.py"),
+    "✏️ スキルシート更新": os.path.join(os.path.dirname(__file__), "UpdatePageEnhanced.py"),
+    "👥 ユーザー管理": os.path.join(os.path.dirname(__file__), "UserManagementPage.py"),
+}
+
 def hash_password(password):
     """パスワードをハッシュ化"""
     return hashlib.sha256(password.encode()).hexdigest()
 
-def init_users_table():
-    """ユーザー管理テーブルを初期化"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                login_id TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                username TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT '一般',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # 既存テーブルへのマイグレーション
-        cursor.execute("PRAGMA table_info(users)")
-        existing_cols = [row[1] for row in cursor.fetchall()]
-        
-        # usernameカラムが存在しない場合は追加
-        if 'username' not in existing_cols:
-            try:
-                cursor.execute("ALTER TABLE users ADD COLUMN username TEXT NOT NULL DEFAULT ''")
-            except Exception as e:
-                pass
-        
-        # roleカラムが存在しない場合は追加
-        if 'role' not in existing_cols:
-            try:
-                cursor.execute("ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT '一般'")
-            except Exception as e:
-                pass
-        
-        # デフォルトユーザーが存在しない場合は作成
-        cursor.execute("SELECT COUNT(*) FROM users")
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('''
-                INSERT INTO users (login_id, password_hash, username, role)
-                VALUES (?, ?, ?, ?)
-            ''', ('admin', hash_password('admin123'), '管理者', '管理者'))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        st.error(f"ユーザーテーブルの初期化エラー: {str(e)}")
-    finally:
-        conn.close()
-
 def authenticate_user(login_id, password):
     """ユーザー認証"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            SELECT id, login_id, password_hash, username, role FROM users WHERE login_id = ?
-        ''', (login_id,))
-        user = cursor.fetchone()
+        with read_connection(DB_PATH) as conn:
+            user = conn.execute(LOGIN_USER_SQL, (login_id,)).fetchone()
         if user and hash_password(password) == user[2]:
             return {'id': user[0], 'login_id': user[1], 'username': user[3], 'role': user[4]}
         return None
     except Exception as e:
         st.error(f"認証エラー: {str(e)}")
         return None
-    finally:
-        conn.close()
 
-# ユーザーテーブルを初期化
-init_users_table()
+# スキーマを最新化（プロセス起動後の初回のみ実行される）
+try:
+    ensure_schema(DB_PATH)
+except Exception as e:
+    st.error(f"データベースの初期化エラー: {str(e)}")
 
 # セッション状態の初期化
 if 'authenticated' not in st.session_state:
@@ -534,17 +495,14 @@ if st.session_state.current_page == "🏠 ホーム":
     st.markdown("---")
 
 elif st.session_state.current_page == "📝 スキルシート作成":
-    # スキルシート作成ページの内容を直接実行
-    skill_sheet_path = os.path.join(os.path.dirname(__file__), "SkillSheetWebCreate.py")
-    exec(open(skill_sheet_path, encoding="utf-8").read())
+    # スキルシート作成ページを実行（コンパイル済みコードを再利用）
+    run_page(PAGE_FILES["📝 スキルシート作成"])
 elif st.session_state.current_page == "📊 データ参照・管理":
-    # データ参照ページの内容を直接実行
-    data_view_path = os.path.join(os.path.dirname(__file__), "DataViewPage.py")
-    exec(open(data_view_path, encoding="utf-8").read())
+    # データ参照ページを実行
+    run_page(PAGE_FILES["📊 データ参照・管理"])
 elif st.session_state.current_page == "✏️ スキルシート更新":
-    # スキルシート更新ページの内容を直接実行
-    update_path = os.path.join(os.path.dirname(__file__), "UpdatePageEnhanced.py")
-    exec(open(update_path, encoding="utf-8").read())
+    # スキルシート更新ページを実行
+    run_page(PAGE_FILES["✏️ スキルシート更新"])
 elif st.session_state.current_page == "👥 ユーザー管理":
     # 管理者以外はユーザー管理ページへアクセス不可
     if st.session_state.get('role') != "管理者":
@@ -552,9 +510,4 @@ elif st.session_state.current_page == "👥 ユーザー管理":
         st.session_state.current_page = "🏠 ホーム"
         st.rerun()
     else:
-        user_mgmt_path = os.path.join(os.path.dirname(__file__), "UserManagementPage.py")
-        exec(open(user_mgmt_path, encoding="utf-8").read())
-
-
-
-   
\ No newline at end of file
+        run_page(PAGE_FILES["👥 ユーザー管理"])
\ No newline at end of file
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# --- 生成したExcelファイルの保存（任意） ---
+# Excel出力はメモリ上（BytesIO）で作成してそのままダウンロードさせ、既定ではファイルを残さない。
+# 控えを残したい場合だけ、環境変数 SKILLSHEET_KEEP_EXCEL=1 で generated_excels フォルダへの保存を有効にする。
+# 保存先は上限付きで管理する:
+#   - 合計サイズの上限（SKILLSHEET_ARTIFACT_MAX_MB）を超えたら、最後に使われたのが古いファイルから消す
+#   - 保存してから保持期間（SKILLSHEET_ARTIFACT_TTL_HOURS）を過ぎたファイルは消す
+#   - ファイルの一覧（名前・サイズ・保存日時・最終利用日時）は index.json に持ち、フォルダの走査は
+#     index.json が無い・壊れているときの作り直しだけで行う
+#   - 取り出し（find_artifact）で更新する最終利用日時はメモリ上だけで更新し、index.json には次の保存時に書く
+# 一括出力のZIPは控えではなくダウンロードまでの一時ファイルのため、設定に関係なく generated_excels とは別の
+# 一時フォルダ（get_temp_store）に書き、出力ジョブの結果と同じ保持時間を過ぎたら消す。
+# 出力ジョブの結果のダウンロードは find_artifact を通してここから渡す（消えていれば期限切れとして扱う）。
+# ファイル・index.json はどちらも一時ファイルに書いてから置き換えるため、書き込み途中のファイルが見えることはない。
+
+ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_excels")
+KEEP_ENV = "SKILLSHEET_KEEP_EXCEL"
+MAX_MB_ENV = "SKILLSHEET_ARTIFACT_MAX_MB"
+TTL_HOURS_ENV = "SKILLSHEET_ARTIFACT_TTL_HOURS"
+ARTIFACT_MAX_MB_DEFAULT = 200
+ARTIFACT_TTL_HOURS_DEFAULT = 24 * 7
+INDEX_FILENAME = "index.json"
+TMP_SUFFIX = ".tmp"
+# 一時ファイルの置き場（アプリの配置ごとに分ける）と保持時間（export_jobs.JOB_RESULT_TTL_SEC と同じ）
+TEMP_ARTIFACT_DIR = os.path.join(
+    tempfile.gettempdir(), "skillsheet_exports_" + hashlib.sha1(ARTIFACT_DIR.encode("utf-8")).hexdigest()[:8]
+)
+TEMP_ARTIFACT_TTL_SEC = 3600
+
+
+def artifacts_enabled():
+    return os.environ.get(KEEP_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_number(name, default):
+    try:
+        value = float(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def _atomic_write(path, write):
+    """write(f) で一時ファイルに書いてから path に置き換える"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TMP_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ArtifactStore:
+    """上限付きのファイル置き場（フォルダごとにプロセスに1つ。一覧はメモリと index.json に持つ）"""
+
+    def __init__(self, directory=ARTIFACT_DIR, max_bytes=None, ttl_sec=None):
+        self.directory = directory
+        self.max_bytes = max_bytes or int(_env_number(MAX_MB_ENV, ARTIFACT_MAX_MB_DEFAULT) * 1024 * 1024)
+        self.ttl_sec = ttl_sec or _env_number(TTL_HOURS_ENV, ARTIFACT_TTL_HOURS_DEFAULT) * 3600
+        self._index = None  # ファイル名 → {"size", "created", "accessed"}
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _load_index(self):
+        """一覧を読み込む（ロック内で呼ぶ）。index.json が使えなければフォルダを1回走査して作り直す"""
+        if self._index is not None:
+            return self._index
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            if not isinstance(index, dict):
+                raise ValueError("index.json の形式が正しくありません")
+        except (OSError, ValueError):
+            index = {}
+            for entry in os.scandir(self.directory):
+                if not entry.is_file() or entry.name == INDEX_FILENAME:
+                    continue
+                if entry.name.endswith(TMP_SUFFIX):
+                    # 書き込み途中で終了した一時ファイル
+                    os.unlink(entry.path)
+                    continue
+                stat = entry.stat()
+                index[entry.name] = {"size": stat.st_size, "created": stat.st_mtime, "accessed": stat.st_mtime}
+        self._index = index
+        return index
+
+    def _save_index(self):
+        data = json.dumps(self._index, ensure_ascii=False).encode("utf-8")
+        _atomic_write(self.index_path, lambda f: f.write(data))
+
+    def _remove(self, name):
+        self._index.pop(name, None)
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, now):
+        """期限切れのファイルを消し、合計サイズが上限以下になるまで最終利用が古い順に消す（ロック内で呼ぶ）"""
+        for name, meta in list(self._index.items()):
+            if now - meta["created"] > self.ttl_sec:
+                self._remove(name)
+        total = sum(meta["size"] for meta in self._index.values())
+        for name, meta in sorted(self._index.items(), key=lambda item: item[1]["accessed"]):
+            if total <= self.max_bytes:
+                break
+            total -= meta["size"]
+            self._remove(name)
+
+    def save(self, filename, data):
+        """ファイルを保存してパスを返す（上限を超えた分は古いものから消す）"""
+        return self.write(filename, lambda f: f.write(data))
+
+    def write(self, filename, write):
+        """write(f) で書いたファイルを保存してパスを返す（大きなファイルをメモリに溜めずに書く場合）"""
+        name = os.path.basename(filename)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            # 一覧の作り直し（一時ファイルの掃除）は書き始める前に済ませておく
+            self._load_index()
+        # 書き込みはロックの外で行い、置き換えと一覧の更新だけをロック内で行う
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            os.replace(tmp_path, path)
+            now = time.time()
+            self._index[name] = {"size": os.path.getsize(path), "created": now, "accessed": now}
+            self._evict(now)
+            self._save_index()
+        return path if name in self._index else None
+
+    def find(self, filename):
+        """保存済みのファイルのパスを返す（無い・期限切れなら None）。最終利用日時はメモリ上だけで更新する"""
+        name = os.path.basename(filename)
+        now = time.time()
+        with self._lock:
+            meta = self._load_index().get(name)
+            if meta is None:
+                return None
+            path = os.path.join(self.directory, name)
+            if now - meta["created"] > self.ttl_sec or not os.path.exists(path):
+                self._remove(name)
+                self._save_index()
+                return None
+            meta["accessed"] = now
+        return path
+
+
+_stores = {}
+_store_lock = threading.Lock()
+
+
+def _get_store(directory, ttl_sec=None):
+    store = _stores.get(directory)
+    if store is None:
+        with _store_lock:
+            store = _stores.get(directory)
+            if store is None:
+                store = _stores[directory] = ArtifactStore(directory, ttl_sec=ttl_sec)
+    return store
+
+
+def get_artifact_store():
+    """控え（generated_excels）の置き場"""
+    return _get_store(ARTIFACT_DIR)
+
+
+def get_temp_store():
+    """ダウンロードまでの一時ファイル（一括出力のZIP）の置き場。控えの設定に関係なく使う"""
+    return _get_store(TEMP_ARTIFACT_DIR, ttl_sec=TEMP_ARTIFACT_TTL_SEC)
+
+
+def save_artifact(filename, data):
+    """有効な場合だけ generated_excels に保存してパスを返す（無効なら None）"""
+    if not artifacts_enabled():
+        return None
+    return get_artifact_store().save(filename, data)
+
+
+def find_artifact(path):
+    """保存済みのファイルのパス（無い・期限切れなら None）。一時フォルダのパスなら一時ファイルから探す"""
+    if os.path.dirname(os.path.abspath(path)) == TEMP_ARTIFACT_DIR:
+        return get_temp_store().find(path)
+    return get_artifact_store().find(path)
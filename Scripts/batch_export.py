@@ -0,0 +1,137 @@
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass
+
+from artifact_store import get_temp_store
+from db_connection import read_connection
+from excel_template import TEMPLATE_PATH
+from export_jobs import get_job_queue
+from sheet_store import load_sheet
+
+# --- 複数スキルシートの一括Excel出力（ZIP） ---
+# 選んだスキルシートを1件ずつ出力し、出来た順に ZIP へ書き込む（全件のブックをメモリに溜めない）。
+# 出力は Excel出力ジョブ（export_jobs）の子プロセスのプールで行う（呼び出しごとにプロセスを起動しない）。
+#   - 書き込む内容が同じシートはキャッシュ（export_cache）の結果を使う（出力中なら同じ結果を待つ）
+#   - 同時に投入する件数は子プロセス数の数倍に抑え、出力済みのバイト列が溜まらないようにする
+# 失敗した件は ZIP に入れず、件ごとのエラーとして返す。
+# 画面からは submit_batch_export でジョブとして投入する（画面のスクリプトは完了を待たない）。
+# ZIP は控えの設定に関係なく artifact_store の一時フォルダ（generated_excels ではない）に直接書き込み、
+# ダウンロードはそのファイルから渡す。
+
+BATCH_IN_FLIGHT_PER_WORKER = 2
+
+_UNSAFE_FILENAME_RE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+@dataclass(slots=True)
+class BatchItem:
+    """一括出力の1件分の結果（error が None なら filename で ZIP に入っている）"""
+    user_info_id: int
+    name: str = ""
+    filename: str | None = None
+    error: str | None = None
+
+
+def export_filename(sheet):
+    """ZIP 内のファイル名（id を先頭に付けて重複させない）"""
+    name = _UNSAFE_FILENAME_RE.sub("_", sheet.name or "").strip("_") or "noname"
+    return f"SkillSheet_{sheet.id}_{name}.xlsx"
+
+
+def export_batch(db_path, sheet_ids, out, login_user_id=None, template_path=TEMPLATE_PATH,
+                 on_progress=None, queue=None):
+    """sheet_ids のスキルシートを出力して ZIP（out はファイルパスまたは書き込み可能なファイル）に書き込む
+
+    on_progress(完了件数, 全件数, BatchItem) を1件終わるごとに呼ぶ（呼び出し元のスレッドで呼ぶ）。
+    戻り値は sheet_ids の順の BatchItem の一覧。login_user_id を渡すと作成者以外のシートはエラーにする。
+    queue を省略するとプロセスに1つの ExportJobQueue で出力する。
+    """
+    sheet_ids = list(dict.fromkeys(sheet_ids))
+    queue = queue or get_job_queue()
+    in_flight = queue.workers * BATCH_IN_FLIGHT_PER_WORKER
+    items = {sheet_id: BatchItem(sheet_id) for sheet_id in sheet_ids}
+    done = 0
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as zf, read_connection(db_path) as conn:
+
+        def sheets():
+            # シートは投入する直前に1件ずつ読む
+            for sheet_id in sheet_ids:
+                item = items[sheet_id]
+                try:
+                    sheet = load_sheet(conn, sheet_id, login_user_id)
+                except Exception as e:
+                    item.error = f"読み込みに失敗しました: {e}"
+                    yield item, None
+                    continue
+                if sheet is None:
+                    item.error = "見つからないか、出力する権限がありません"
+                else:
+                    item.name = sheet.name
+                    item.filename = export_filename(sheet)
+                yield item, sheet
+
+        def finish(item, data=None, error=None):
+            nonlocal done
+            if error is not None:
+                item.error = f"出力に失敗しました: {error}"
+                item.filename = None
+            elif data is not None:
+                # xlsx は圧縮済みのため ZIP では無圧縮で格納する
+                zf.writestr(item.filename, data)
+            done += 1
+            if on_progress:
+                on_progress(done, len(sheet_ids), item)
+
+        pending = {}
+        source = sheets()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < in_flight:
+                next_item = next(source, None)
+                if next_item is None:
+                    exhausted = True
+                    break
+                item, sheet = next_item
+                if sheet is None:
+                    finish(item)
+                    continue
+                try:
+                    # 内容が同じシートは同じ Future になるため、Future ごとに件の一覧を持つ
+                    pending.setdefault(queue.render(sheet, template_path), []).append(item)
+                except Exception as e:
+                    finish(item, error=e)
+            if not pending:
+                break
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                for item in pending.pop(future):
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        finish(item, error=e)
+                    else:
+                        finish(item, data)
+
+    return [items[sheet_id] for sheet_id in sheet_ids]
+
+
+def _batch_task(job, db_path, sheet_ids, login_user_id, template_path):
+    def on_progress(done, total, item):
+        job.progress = (done, total)
+
+    def write(f):
+        job.items = export_batch(db_path, sheet_ids, f, login_user_id, template_path, on_progress=on_progress)
+
+    job.progress = (0, len(sheet_ids))
+    path = get_temp_store().write(job.filename, write)
+    if path is None:
+        raise ValueError("ZIPが保存できる大きさの上限を超えています")
+    return path
+
+
+def submit_batch_export(db_path, sheet_ids, filename, owner=None, login_user_id=None, template_path=TEMPLATE_PATH):
+    """一括出力をジョブとして投入してジョブIDを返す（filename は保存するZIPのファイル名）"""
+    sheet_ids = list(dict.fromkeys(sheet_ids))
+    return get_job_queue().submit_task(filename, owner, _batch_task, db_path, sheet_ids, login_user_id, template_path)
@@ -0,0 +1,107 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from io import BytesIO
+
+import openpyxl
+
+from db_connection import connect
+from db_migrations import migrate
+from excel_export import ENGINES, export_sheet_bytes
+from excel_template import TEMPLATE_PATH, template_anchors
+from sheet_layout import PROJECT_BLOCK_ROWS, layout_anchors, template_layout_errors
+from sheet_store import load_sheet
+
+# Excel出力エンジン（excel_export）ごとに同じスキルシートを出力し、
+# 全シートのセルの値・結合セルが一致するかと、1件あたりの出力時間を確認する（不一致があれば終了コード1）。
+# DBファイルは一時ディレクトリにコピーしてからマイグレーションを適用するため、元のDBは変更しない。
+
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
+REPEAT = 5
+# テンプレートの案件ブロック数を超える場合（ブロックの複製）も確認する
+MANY_PROJECTS = len(PROJECT_BLOCK_ROWS) * 2 + 8
+
+
+def workbook_cells(data):
+    """xlsx のバイト列を {シート名: ({セル番地: 値}, 結合セルの一覧)} に読み込む"""
+    workbook = openpyxl.load_workbook(BytesIO(data))
+    result = {}
+    for ws in workbook.worksheets:
+        values = {
+            cell.coordinate: cell.value
+            for row in ws.iter_rows()
+            for cell in row
+            if cell.value is not None
+        }
+        result[ws.title] = (values, sorted(str(r) for r in ws.merged_cells.ranges))
+    return result
+
+
+with tempfile.TemporaryDirectory() as work_dir:
+    work_db = os.path.join(work_dir, "skillsheet_data.db")
+    shutil.copy(DB_PATH, work_db)
+    migrate(work_db)
+    conn = connect(work_db)
+    sheet_ids = [row[0] for row in conn.execute("SELECT id FROM user_info ORDER BY id")]
+    sheets = [load_sheet(conn, sheet_id) for sheet_id in sheet_ids]
+    conn.close()
+
+if not sheets:
+    print("スキルシートがありません")
+    sys.exit(0)
+base_sheet = max(sheets, key=lambda s: len(s.projects))
+if base_sheet.projects:
+    projects = (base_sheet.projects * MANY_PROJECTS)[:MANY_PROJECTS]
+    sheets.append(replace(base_sheet, projects=projects))
+
+# テンプレートの見出しの位置がレイアウト定義どおりでなければ出力できないため、先に確認する
+layout_errors = template_layout_errors(template_anchors(TEMPLATE_PATH))
+print(f"テンプレートの見出し: {len(layout_anchors())}件中 {len(layout_errors)}件が定義と不一致")
+for error in layout_errors[:10]:
+    print(f"    {error}")
+if layout_errors:
+    sys.exit(1)
+
+failed = 0
+print("\n出力内容の比較:")
+for sheet in sheets:
+    outputs = {engine: workbook_cells(export_sheet_bytes(sheet, engine=engine)) for engine in ENGINES}
+    base_engine, base = ENGINES[0], outputs[ENGINES[0]]
+    diffs = []
+    for engine in ENGINES[1:]:
+        other = outputs[engine]
+        if list(base) != list(other):
+            diffs.append(f"{engine}: シート構成 {list(other)}")
+            continue
+        for title, (values, merged) in base.items():
+            other_values, other_merged = other[title]
+            for coordinate in sorted(set(values) | set(other_values)):
+                if values.get(coordinate) != other_values.get(coordinate):
+                    diffs.append(
+                        f"{engine}: {title}!{coordinate} {values.get(coordinate)!r} != {other_values.get(coordinate)!r}"
+                    )
+            if merged != other_merged:
+                diffs.append(f"{engine}: {title} の結合セルが異なります")
+    if diffs:
+        failed += 1
+        print(f"- NG id={sheet.id} 案件{len(sheet.projects)}件（{base_engine} との差分 {len(diffs)}件）")
+        for diff in diffs[:10]:
+            print(f"    {diff}")
+    else:
+        print(f"- OK id={sheet.id} 案件{len(sheet.projects)}件")
+
+# 1回目はテンプレートの読み込みを含むため、計測の前に1回ずつ出力しておく
+for sheet in (base_sheet, sheets[-1]):
+    print(f"\n出力時間（id={sheet.id}, 案件{len(sheet.projects)}件, {REPEAT}回の平均）:")
+    for engine in ENGINES:
+        export_sheet_bytes(sheet, engine=engine)
+        started = time.perf_counter()
+        for _ in range(REPEAT):
+            export_sheet_bytes(sheet, engine=engine)
+        print(f"- {engine}: {(time.perf_counter() - started) / REPEAT * 1000:.1f}ms")
+
+print(f"\n不一致: {failed}件")
+sys.exit(1 if failed else 0)
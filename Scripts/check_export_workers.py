@@ -0,0 +1,67 @@
+import dataclasses
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from db_connection import connect
+from db_migrations import migrate
+from export_jobs import DONE, ExportJobQueue
+from sheet_store import load_sheet
+
+# Excel出力ジョブの子プロセスが、親プロセスの __main__（Streamlit では app.py）を読み込まないことを確認する（読み込めば終了コード1）。
+# Streamlit と同じように __main__ を別のスクリプトのモジュールに差し替えてから、内容の違うジョブを子プロセス数だけ続けて投入する
+# （プールの作成時に子プロセスを全部起動していなければ、2件目の投入で差し替えなしに子プロセスが起動して目印が作られる）。
+# 差し替えたスクリプトは読み込まれると目印のファイルを作るため、ジョブの完了後に目印が無ければよい。
+# DBファイルは一時ディレクトリにコピーしてからマイグレーションを適用するため、元のDBは変更しない。
+
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
+JOB_TIMEOUT_SEC = 300
+
+
+def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_db = os.path.join(work_dir, "skillsheet_data.db")
+        shutil.copy(DB_PATH, work_db)
+        migrate(work_db)
+        conn = connect(work_db)
+        sheet_id = conn.execute("SELECT id FROM user_info ORDER BY id LIMIT 1").fetchone()
+        sheet = load_sheet(conn, sheet_id[0]) if sheet_id else None
+        conn.close()
+        if sheet is None:
+            print("スキルシートがありません")
+            return 0
+
+        marker = os.path.join(work_dir, "main_imported")
+        fake_main_path = os.path.join(work_dir, "fake_app.py")
+        with open(fake_main_path, "w", encoding="utf-8") as f:
+            f.write(f"open({marker!r}, 'w').close()\n")
+        fake_main = types.ModuleType("__main__")
+        fake_main.__file__ = fake_main_path
+
+        queue = ExportJobQueue(workers=2)
+        sheets = [sheet, dataclasses.replace(sheet, name=f"{sheet.name}（確認用）")]
+        real_main = sys.modules["__main__"]
+        sys.modules["__main__"] = fake_main
+        try:
+            job_ids = [queue.submit(s, f"check_export_workers_{i}.xlsx") for i, s in enumerate(sheets)]
+        finally:
+            sys.modules["__main__"] = real_main
+        jobs = [queue.get(job_id) for job_id in job_ids]
+        deadline = time.time() + JOB_TIMEOUT_SEC
+        while not all(job.finished for job in jobs) and time.time() < deadline:
+            time.sleep(0.2)
+        queue.shutdown()
+
+        ok = all(job.status == DONE for job in jobs) and not os.path.exists(marker)
+        for job in jobs:
+            print(f"ジョブの状態: {job.status}" + (f"（{job.error}）" if job.error else ""))
+        print(f"子プロセスでの __main__ の読み込み: {'あり' if os.path.exists(marker) else 'なし'}")
+        print("OK" if ok else "NG")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from db_migrations import migrate
+from page_queries import DATA_VIEW_SHEETS_SQL, LOGIN_USER_SQL, UPDATE_PAGE_SHEETS_SQL
+from project_periods import ONGOING_MONTH_INDEX
+from sheet_store import (
+    _CURRENT_PROJECTS_SQL, _DELETE_PROJECT_ENVS_SQL, _FIND_SHEETS_SQL, _LOAD_SHEET_PROJECTS_SQL,
+    _LOAD_SHEET_SKILLS_SQL, _LOAD_SHEET_SQL, _SHEET_SKILL_PERIODS_SQL, _SHEETS_IN_PERIOD_SQL, _UPSERT_SKILL_SQL,
+)
+
+# 各ページが発行する検索クエリ（page_queries・sheet_store のSQLをそのまま読み込む）の実行計画（EXPLAIN QUERY PLAN）を確認し、
+# user_info / skills / projects / project_env を全件走査しているものがあれば終了コード1で終わる。
+# 実行計画は統計情報（sqlite_stat1）で変わるため、次の2通りで確認する。
+#   - 統計情報なし: マイグレーション直後・ANALYZE 前のDB
+#   - 本番相当の統計: 本番規模の件数のダミーデータを入れて ANALYZE したDB（本番はマイグレーションと書き込みスレッドが ANALYZE する）
+# DBファイルは一時ディレクトリにコピーしてからマイグレーションを適用するため、元のDBは変更しない。
+
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
+
+# ダミーデータの件数（スキルシート数・作成者数と、1シートあたりの案件・スキル・開発環境の数）
+SEED_SHEETS = 20000
+SEED_LOGIN_USERS = 20
+SEED_PROJECTS_PER_SHEET = 5
+SEED_SKILLS_PER_SHEET = 10
+SEED_ENVS_PER_PROJECT = 3
+SEED_SKILL_NAMES = 50
+
+# (説明, SQL, パラメータ)
+PAGE_QUERIES = [
+    ("ログイン認証", LOGIN_USER_SQL, ("admin",)),
+    ("データ一覧（参照ページ）", DATA_VIEW_SHEETS_SQL, (1,)),
+    ("データ一覧（更新ページ）", UPDATE_PAGE_SHEETS_SQL, (1,)),
+    ("基本情報", _LOAD_SHEET_SQL, (1,)),
+    ("スキル", _LOAD_SHEET_SKILLS_SQL, (1,)),
+    # 一意インデックスが無ければ ON CONFLICT の対象が無いためエラーになる
+    ("スキルのUPSERT", _UPSERT_SKILL_SQL, (1, "language", "Python", "1年", 12, 0)),
+    ("案件＋開発環境", _LOAD_SHEET_PROJECTS_SQL, (1,)),
+    ("一括出力の対象（氏名で絞り込み）", _FIND_SHEETS_SQL, (1, "山田", "山田", "山田")),
+    ("一括出力の対象（2023年に参画）", _SHEETS_IN_PERIOD_SQL, (1, 2023 * 12, 2023 * 12 + 11)),
+    ("一括出力の対象（現在参画中）", _CURRENT_PROJECTS_SQL, (1, ONGOING_MONTH_INDEX)),
+    ("スキル経験月数の再計算", _SHEET_SKILL_PERIODS_SQL, (1,)),
+    ("案件の開発環境の削除", _DELETE_PROJECT_ENVS_SQL.format(where="user_info_id = ?"), (1,)),
+]
+
+
+def full_scans(conn, sql, params):
+    """実行計画のうち、テーブル全体を走査している行を返す（SQLが実行できなければそのエラー）"""
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return [f"エラー: {e}"]
+    return [detail for _, _, _, detail in plan if detail.startswith("SCAN ") and "CONSTANT ROW" not in detail]
+
+
+def seed_rows(conn):
+    """本番規模の件数のダミーデータを追加する"""
+    first_id = (conn.execute("SELECT MAX(id) FROM user_info").fetchone()[0] or 0) + 1
+    sheet_ids = range(first_id, first_id + SEED_SHEETS)
+    conn.executemany(
+        "INSERT INTO user_info (id, name, name_kana, login_user_id, created_at) VALUES (?, ?, ?, ?, ?)",
+        (
+            (i, f"氏名{i}", f"シメイ{i}", i % SEED_LOGIN_USERS + 1, f"2020-01-01 00:00:{i:08d}")
+            for i in sheet_ids
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years, experience_months) "
+        "VALUES (?, 'language', ?, '1年', 12)",
+        ((i, f"スキル{(i + k) % SEED_SKILL_NAMES}") for i in sheet_ids for k in range(SEED_SKILLS_PER_SHEET)),
+    )
+    projects = []
+    for i in sheet_ids:
+        for k in range(SEED_PROJECTS_PER_SHEET):
+            start_idx = 2010 * 12 + (i + k * 24) % 180
+            # 各シートの最初の案件の一部は継続中
+            end_idx = ONGOING_MONTH_INDEX if k == 0 and i % 10 == 0 else start_idx + 11
+            projects.append((i, f"システム{k}", start_idx, end_idx))
+    conn.executemany(
+        "INSERT INTO projects (user_info_id, system_name, start_month_idx, end_month_idx) VALUES (?, ?, ?, ?)",
+        projects,
+    )
+    conn.executemany(
+        "INSERT INTO project_env (project_id, env_type, name, position) VALUES (?, 'env_langs', ?, ?)",
+        (
+            (project_id, f"スキル{(project_id + k) % SEED_SKILL_NAMES}", k)
+            for (project_id,) in conn.execute("SELECT id FROM projects WHERE user_info_id >= ?", (first_id,)).fetchall()
+            for k in range(SEED_ENVS_PER_PROJECT)
+        ),
+    )
+
+
+def check_plans(conn, title):
+    print(f"\n実行計画の確認（{title}）:")
+    failed = 0
+    for label, sql, params in PAGE_QUERIES:
+        scans = full_scans(conn, sql, params)
+        if scans:
+            failed += 1
+            print(f"- NG {label}: {', '.join(scans)}")
+        else:
+            print(f"- OK {label}")
+    return failed
+
+
+with tempfile.TemporaryDirectory() as work_dir:
+    work_db = os.path.join(work_dir, "skillsheet_data.db")
+    shutil.copy(DB_PATH, work_db)
+    print(f"スキーマバージョン: {migrate(work_db)}")
+
+    conn = sqlite3.connect(work_db)
+    # 開発用DBは件数が少なく、その統計では全件走査の方が安いと判断されるため、開発用DBの統計では確認しない
+    conn.execute("DELETE FROM sqlite_stat1")
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(work_db)
+    failed = check_plans(conn, "統計情報なし")
+
+    with conn:
+        seed_rows(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+    # 統計情報は接続を開いたときに読み込まれる
+    conn = sqlite3.connect(work_db)
+    failed += check_plans(conn, f"本番相当の統計: スキルシート{SEED_SHEETS}件")
+    conn.close()
+
+print(f"\n全件走査: {failed}件")
+sys.exit(1 if failed else 0)
@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# --- SQLite接続の共通管理 ---
+# 各ページは sqlite3.connect を直接呼ばず、参照はここのプールから接続を借りて返す。
+# 接続は使い回すため、接続時のPRAGMA設定やプリペアドステートメントのキャッシュが再実行をまたいで効く。
+# 更新系は db_writer の書き込みスレッドに集約する。
+
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+POOL_MAX_IDLE = 8
+
+_CONNECTION_PRAGMAS = [
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size = -16000",    # 約16MB
+    "PRAGMA mmap_size = 268435456",  # 256MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA synchronous = NORMAL",   # WAL時は NORMAL で十分
+]
+
+
+def connect(db_path, readonly=False):
+    """PRAGMA設定済みの接続を新規作成"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    # journal_mode はDBファイルに永続化される（WAL済みなら何もしない）
+    conn.execute("PRAGMA journal_mode = WAL")
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    """DBファイルごとの接続プール"""
+
+    def __init__(self, db_path, readonly=False, max_idle=POOL_MAX_IDLE):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.db_path, self.readonly)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, readonly=False):
+    key = (db_path, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_path, readonly=readonly)
+                _pools[key] = pool
+    return pool
+
+
+@contextmanager
+def read_connection(db_path):
+    """参照用の読み取り専用接続を借りる"""
+    with get_pool(db_path, readonly=True).connection() as conn:
+        yield conn
+
@@ -0,0 +1,304 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from experience import parse_experience_months
+from project_phases import encode_phases
+from project_periods import period_indexes
+from sheet_store import ENV_TYPES, all_skill_months, build_env_rows
+
+# --- スキーママイグレーション ---
+# schema_version テーブルに適用済みバージョンを記録し、未適用のステップだけを順番に実行する。
+# プロセス起動後の最初の1回だけ実行し、複数ワーカーが同時に起動してもファイルロックで直列化する。
+
+_migrated_paths = set()
+_process_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(lock_path):
+    """プロセス間の排他ロック（Windows/Unix両対応）"""
+    with open(lock_path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _existing_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _add_missing_columns(cursor, table, columns):
+    existing_cols = _existing_columns(cursor, table)
+    for col, typ in columns:
+        if col not in existing_cols:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col} {typ}")
+
+
+# ======== マイグレーションステップ ========
+
+def _m001_base_schema(cursor):
+    """users / user_info / skills / projects の初期スキーマ（既存DBの旧カラム追加も吸収）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            login_id TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            username TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT '一般',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    _add_missing_columns(cursor, "users", [
+        ("username", "TEXT NOT NULL DEFAULT ''"),
+        ("role", "TEXT NOT NULL DEFAULT '一般'"),
+    ])
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_kana TEXT NOT NULL,
+            transportation TEXT,
+            nearest_station TEXT,
+            access_method TEXT,
+            access_time TEXT,
+            gender TEXT,
+            birth_date DATE,
+            final_education TEXT,
+            graduation_date TEXT,
+            self_pr TEXT,
+            qualifications TEXT,
+            login_user_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (login_user_id) REFERENCES users (id)
+        )
+    ''')
+    _add_missing_columns(cursor, "user_info", [("login_user_id", "INTEGER")])
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS skills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_info_id INTEGER,
+            skill_type TEXT,
+            skill_name TEXT,
+            experience_years TEXT,
+            FOREIGN KEY (user_info_id) REFERENCES user_info (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT
+        )
+    ''')
+    _add_missing_columns(cursor, "projects", [
+        ("user_info_id", "INTEGER"),
+        ("period_start", "TEXT"),
+        ("period_end", "TEXT"),
+        ("system_name", "TEXT"),
+        ("role", "TEXT"),
+        ("industry", "TEXT"),
+        ("work_content", "TEXT"),
+        ("phases", "TEXT"),
+        ("headcount", "TEXT"),
+        ("env_langs", "TEXT"),
+        ("env_tools", "TEXT"),
+        ("env_dbs", "TEXT"),
+        ("env_oss", "TEXT"),
+    ])
+    # デフォルトユーザーが存在しない場合は作成
+    cursor.execute("SELECT COUNT(*) FROM users")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO users (login_id, password_hash, username, role)
+            VALUES (?, ?, ?, ?)
+        ''', ('admin', hashlib.sha256('admin123'.encode()).hexdigest(), '管理者', '管理者'))
+
+
+def _m002_unique_skills(cursor):
+    """skills の重複行を整理し、(user_info_id, skill_type, skill_name) に一意インデックスを張る"""
+    # 同じスキルが複数行ある場合は最後に書き込まれた行を残す
+    cursor.execute('''
+        DELETE FROM skills
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM skills
+            GROUP BY user_info_id, skill_type, skill_name
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_skills_user_type_name
+        ON skills (user_info_id, skill_type, skill_name)
+    ''')
+
+
+def _m003_project_env(cursor):
+    """案件の開発環境を project_env に正規化し、既存の env_* 文字列から移行する"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS project_env (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            env_type TEXT NOT NULL,
+            name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_project_env_project
+        ON project_env (project_id, env_type, position)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_project_env_type_name
+        ON project_env (env_type, name)
+    ''')
+    cursor.execute("DELETE FROM project_env")
+    cursor.execute("SELECT id, env_langs, env_tools, env_dbs, env_oss FROM projects")
+    env_rows = []
+    for project_id, *values in cursor.fetchall():
+        env_rows.extend(build_env_rows(project_id, dict(zip(ENV_TYPES, values))))
+    cursor.executemany(
+        "INSERT INTO project_env (project_id, env_type, name, position) VALUES (?, ?, ?, ?)",
+        env_rows
+    )
+
+
+def _m004_phase_mask(cursor):
+    """工程をビットマスク列 phase_mask に移行し、phases 列も工程名リストの表現に揃える"""
+    _add_missing_columns(cursor, "projects", [("phase_mask", "INTEGER NOT NULL DEFAULT 0")])
+    cursor.execute("SELECT id, phases FROM projects")
+    rows = [(*encode_phases(phases), project_id) for project_id, phases in cursor.fetchall()]
+    cursor.executemany("UPDATE projects SET phases = ?, phase_mask = ? WHERE id = ?", rows)
+
+
+def _m005_access_path_indexes(cursor):
+    """各ページの検索条件に合わせたインデックスを作成し、統計情報を取り直す"""
+    # 一覧: WHERE login_user_id = ? ORDER BY created_at DESC（id, name, name_kana まで索引だけで返せる）
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_user_info_login_created
+        ON user_info (login_user_id, created_at, name, name_kana)
+    ''')
+    # 詳細・削除: projects WHERE user_info_id = ?
+    # （skills WHERE user_info_id = ? は ux_skills_user_type_name の先頭列で引ける）
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_projects_user_info
+        ON projects (user_info_id)
+    ''')
+    cursor.execute("ANALYZE")
+
+
+def _m006_experience_months(cursor):
+    """skills.experience_years（TEXT）を月数の整数列 experience_months に読み替える"""
+    _add_missing_columns(cursor, "skills", [("experience_months", "INTEGER")])
+    cursor.execute("SELECT id, experience_years FROM skills")
+    rows = [(parse_experience_months(years), skill_id) for skill_id, years in cursor.fetchall()]
+    cursor.executemany("UPDATE skills SET experience_months = ? WHERE id = ?", rows)
+
+
+def _m007_period_month_index(cursor):
+    """案件の期間を月インデックス列に移行し、並べ替え・範囲検索用のインデックスを張る"""
+    _add_missing_columns(cursor, "projects", [
+        ("start_month_idx", "INTEGER"),
+        ("end_month_idx", "INTEGER"),
+    ])
+    cursor.execute("SELECT id, period_start, period_end FROM projects")
+    rows = [(*period_indexes(start, end), project_id) for project_id, start, end in cursor.fetchall()]
+    cursor.executemany("UPDATE projects SET start_month_idx = ?, end_month_idx = ? WHERE id = ?", rows)
+    # シート内の案件一覧（新しい順）。user_info_id 単独のインデックスはこれで置き換える
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_projects_user_start
+        ON projects (user_info_id, start_month_idx)
+    ''')
+    cursor.execute("DROP INDEX IF EXISTS ix_projects_user_info")
+    # 継続中の案件（end_month_idx = 継続中の値）・期間の重なり検索
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_projects_period
+        ON projects (end_month_idx, start_month_idx)
+    ''')
+
+
+def _m008_skill_experience_derived(cursor):
+    """経験月数を案件期間から計算した行かどうかを skills.experience_derived に持つ"""
+    _add_missing_columns(cursor, "skills", [("experience_derived", "INTEGER NOT NULL DEFAULT 0")])
+    # 今の案件期間で計算されるスキルを、計算した行として扱う
+    rows = [(user_info_id, skill_type, name) for user_info_id, skill_type, name, _ in all_skill_months(cursor.connection)]
+    cursor.executemany(
+        "UPDATE skills SET experience_derived = 1 WHERE user_info_id = ? AND skill_type = ? AND skill_name = ?",
+        rows
+    )
+
+
+# (バージョン, 説明, 実行関数) を昇順で定義する。適用済みのステップは変更しないこと。
+MIGRATIONS = [
+    (1, "初期スキーマ", _m001_base_schema),
+    (2, "skills 一意インデックス（UPSERT用）", _m002_unique_skills),
+    (3, "project_env（案件の開発環境）", _m003_project_env),
+    (4, "projects.phase_mask（工程のビットマスク）", _m004_phase_mask),
+    (5, "一覧・詳細の検索用インデックス", _m005_access_path_indexes),
+    (6, "skills.experience_months（経験月数）", _m006_experience_months),
+    (7, "projects の期間の月インデックス", _m007_period_month_index),
+    (8, "skills.experience_derived（案件期間から計算した経験月数か）", _m008_skill_experience_derived),
+]
+
+
+def get_schema_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(db_path):
+    """未適用のマイグレーションを順番に適用し、適用後のバージョンを返す"""
+    with _file_lock(db_path + ".migrate.lock"):
+        conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        try:
+            current = get_schema_version(conn)
+            for version, description, step in MIGRATIONS:
+                if version <= current:
+                    continue
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    step(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                        (version, description)
+                    )
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+                current = version
+            return current
+        finally:
+            conn.close()
+
+
+def ensure_schema(db_path):
+    """プロセス内で一度だけマイグレーションを実行（2回目以降は何もしない）"""
+    if db_path in _migrated_paths:
+        return
+    with _process_lock:
+        if db_path in _migrated_paths:
+            return
+        migrate(db_path)
+        _migrated_paths.add(db_path)
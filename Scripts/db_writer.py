@@ -0,0 +1,175 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from db_connection import connect
+
+# --- 単一書き込みスレッド ---
+# 作成・更新・削除・ユーザー管理の更新処理はすべてここに投入し、専用スレッドが1本の接続で順に実行する。
+# キューに溜まった処理はまとめて1トランザクションでコミットし（グループコミット）、
+# 各処理はSAVEPOINTで区切るため、1件の失敗が同じバッチの他の処理を巻き込むことはない。
+# 書き込み処理は conn を受け取る関数として渡す。関数内で commit / rollback は呼ばないこと。
+
+BATCH_MAX = 64
+WRITE_TIMEOUT_SEC = 30
+LOCK_RETRY_MAX = 5
+LOCK_RETRY_BASE_SEC = 0.05
+CHECKPOINT_IDLE_SEC = 2.0
+CHECKPOINT_TRUNCATE_PAGES = 4000
+CHECKPOINT_EVERY_COMMITS = 500  # 書き込みが途切れない場合でもこの回数ごとにチェックポイント
+ANALYZE_INTERVAL_SEC = 3600
+ANALYSIS_LIMIT = 400  # ANALYZE 時に1インデックスあたり走査する行数の上限
+
+
+class _WriteJob:
+    __slots__ = ("fn", "future")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = Future()
+
+
+def _is_lock_error(e):
+    msg = str(e).lower()
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+class DatabaseWriter:
+    """DBファイル1つにつき1本の書き込みスレッド"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._queue = queue.Queue()
+        self._commits_since_checkpoint = 0
+        self._commits_since_analyze = 0
+        self.generation = 0  # コミット済みのバッチ数（参照キャッシュの無効化に使う）
+        self._last_analyze = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        """書き込み処理をキューに投入し、結果を受け取るFutureを返す"""
+        job = _WriteJob(fn)
+        self._queue.put(job)
+        return job.future
+
+    def execute(self, fn, timeout=WRITE_TIMEOUT_SEC):
+        """書き込み処理を投入して完了まで待つ（処理内の例外はそのまま送出）"""
+        return self.submit(fn).result(timeout=timeout)
+
+    def _run(self):
+        conn = connect(self.db_path)
+        conn.isolation_level = None  # トランザクションは明示的に制御する
+        # チェックポイントはコミット時ではなくアイドル時にこのスレッドで行う
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        while True:
+            try:
+                first = self._queue.get(timeout=CHECKPOINT_IDLE_SEC)
+            except queue.Empty:
+                self._checkpoint_if_needed(conn)
+                self._analyze_if_due(conn)
+                continue
+            batch = [first]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, batch)
+            if self._commits_since_checkpoint >= CHECKPOINT_EVERY_COMMITS:
+                self._checkpoint_if_needed(conn)
+
+    def _commit_batch(self, conn, batch):
+        for attempt in range(LOCK_RETRY_MAX + 1):
+            results = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for job in batch:
+                    conn.execute("SAVEPOINT write_job")
+                    try:
+                        result = job.fn(conn)
+                    except Exception as e:
+                        if _is_lock_error(e):
+                            raise
+                        conn.execute("ROLLBACK TO write_job")
+                        conn.execute("RELEASE write_job")
+                        results.append((job, None, e))
+                    else:
+                        conn.execute("RELEASE write_job")
+                        results.append((job, result, None))
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if _is_lock_error(e) and attempt < LOCK_RETRY_MAX:
+                    # 他プロセスとの競合: 指数バックオフ（ジッター付き）で再試行
+                    time.sleep(LOCK_RETRY_BASE_SEC * (2 ** attempt) * (1 + random.random()))
+                    continue
+                for job in batch:
+                    job.future.set_exception(e)
+                return
+            self._commits_since_checkpoint += 1
+            self._commits_since_analyze += 1
+            self.generation += 1
+            for job, result, error in results:
+                if error is not None:
+                    job.future.set_exception(error)
+                else:
+                    job.future.set_result(result)
+            return
+
+    def _checkpoint_if_needed(self, conn):
+        if not self._commits_since_checkpoint:
+            return
+        try:
+            _, wal_pages, _ = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            if wal_pages >= CHECKPOINT_TRUNCATE_PAGES:
+                # WALが大きくなっていればアイドル中に切り詰める（読み取り中なら次回に持ち越し）
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._commits_since_checkpoint = 0
+        except sqlite3.Error:
+            pass
+
+    def _analyze_if_due(self, conn):
+        """書き込みがあれば一定間隔でアイドル時に統計情報を更新（クエリプランナー用）"""
+        if not self._commits_since_analyze:
+            return
+        if time.monotonic() - self._last_analyze < ANALYZE_INTERVAL_SEC:
+            return
+        try:
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+            self._commits_since_analyze = 0
+            self._last_analyze = time.monotonic()
+        except sqlite3.Error:
+            pass
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path):
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(db_path)
+            if writer is None:
+                writer = DatabaseWriter(db_path)
+                _writers[db_path] = writer
+    return writer
+
+
+def write_generation(db_path):
+    """このプロセスの書き込みスレッドがコミットした回数（書き込み前は0）"""
+    writer = _writers.get(db_path)
+    return writer.generation if writer is not None else 0
+
+
+def execute_write(db_path, fn, timeout=WRITE_TIMEOUT_SEC):
+    """書き込みスレッドで fn(conn) を実行して結果を返す"""
+    return get_writer(db_path).execute(fn, timeout=timeout)
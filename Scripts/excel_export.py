@@ -0,0 +1,43 @@
+import os
+
+import xlsx_patch
+from excel_template import TEMPLATE_PATH, load_template, row_block, workbook_bytes
+from sheet_layout import (
+    PROJECT_BLOCK_HEIGHT, PROJECT_BLOCK_ROWS, PROJECT_LIST_SHEET,
+    cell_values, extra_blocks, project_list_rows, render_sheet, validate_template,
+)
+
+# --- Excel出力（エンジンの切り替え） ---
+# 作成ページ・更新ページのExcel出力はここを通し、どちらも同じレイアウト定義（sheet_layout）で書き込む。
+#   - "openpyxl": テンプレートの複製（excel_template）に書き込んで保存する（既定）
+#   - "xml":      テンプレートの xlsx を直接書き換える（xlsx_patch）。書式・図形などのパートはコピーするだけなので速い
+# 環境変数 SKILLSHEET_EXCEL_ENGINE で切り替える。
+# 案件がテンプレートのブロック数（16件）より多い場合は、どちらのエンジンも最後のブロックを複製して全件を書き込む。
+# 出力の前にテンプレートの見出しの位置がレイアウト定義どおりかを確かめる（sheet_layout.validate_template）。
+
+ENGINE_ENV = "SKILLSHEET_EXCEL_ENGINE"
+ENGINES = ("openpyxl", "xml")
+DEFAULT_ENGINE = "openpyxl"
+
+
+def export_engine():
+    engine = os.environ.get(ENGINE_ENV, "").strip().lower()
+    return engine if engine in ENGINES else DEFAULT_ENGINE
+
+
+def export_sheet_bytes(sheet, template_path=TEMPLATE_PATH, engine=None):
+    """スキルシートをテンプレートに書き込んだ xlsx のバイト列を返す"""
+    engine = engine or export_engine()
+    validate_template(template_path)
+    if engine == "xml":
+        return xlsx_patch.render_xlsx(
+            template_path, cell_values(sheet),
+            list_sheet_name=PROJECT_LIST_SHEET, list_rows=project_list_rows(sheet),
+            repeat_rows=(PROJECT_BLOCK_ROWS[-1], PROJECT_BLOCK_HEIGHT, extra_blocks(sheet)),
+        )
+    if engine != "openpyxl":
+        raise ValueError(f"不明なExcel出力エンジンです: {engine}")
+    wb = load_template(template_path)
+    project_block = row_block(PROJECT_BLOCK_ROWS[-1], PROJECT_BLOCK_HEIGHT, template_path) if extra_blocks(sheet) else None
+    render_sheet(wb, sheet, project_block)
+    return workbook_bytes(wb)
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import pickle
+from copy import copy
+import threading
+from io import BytesIO
+
+import openpyxl
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.formula.translate import Translator
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+from openpyxl.worksheet.dimensions import RowDimension
+
+# --- Excelテンプレートのキャッシュ ---
+# SkillSheetTemplate.xlsx（書式・結合セルの多いブック）は openpyxl での解析に時間がかかるため、
+# プロセス内で1回だけ解析し、解析済みのブックを pickle したスナップショットを (パス, 更新日時, サイズ) ごとに保持する。
+# 出力のたびにスナップショットから複製を作る（ファイルのコピー・再解析は行わない）。
+# copy.deepcopy は openpyxl のスタイル一覧（IndexedList）を正しく複製できず保存時に失敗するため使わない。
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_PATH = os.path.join(TEMPLATE_DIR, "SkillSheetTemplate.xlsx")
+
+_snapshots = {}
+_lock = threading.Lock()
+_row_blocks = {}
+_digests = {}
+_anchors = {}
+
+
+def _snapshot(path):
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    entry = _snapshots.get(path)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _lock:
+        entry = _snapshots.get(path)
+        if entry is None or entry[0] != version:
+            workbook = openpyxl.load_workbook(path)
+            entry = (version, pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL))
+            # テンプレートが差し替えられた場合は古いスナップショットを置き換える
+            _snapshots[path] = entry
+    return entry[1]
+
+
+def load_template(path=TEMPLATE_PATH):
+    """テンプレートを複製した Workbook を返す（呼び出し側で自由に書き換えてよい）"""
+    return pickle.loads(_snapshot(os.path.abspath(path)))
+
+
+class RowBlock:
+    """シート末尾の連続した行（案件ブロック）を後ろに複製する
+
+    セルの書式（StyleArray）・値・数式、行の高さ、ブロック内の結合セル・入力規則の範囲を
+    ブロック先頭からの相対位置で1回だけ読み取っておき、複製時はその一覧をそのまま書き込む。
+    結合セルの内側のセルは読み込み時に罫線が整えられた書式ごと写すため、ws.merge_cells（範囲の重複確認と
+    罫線の付け直しを1範囲ずつ行う）は使わずに範囲を登録する。
+    """
+
+    def __init__(self, ws, first_row, height):
+        last_row = first_row + height - 1
+        if ws.max_row > last_row:
+            raise ValueError(f"{last_row}行目より後ろに行があるため、行の複製はできません")
+        self.first_row = first_row
+        self.height = height
+        self.cells = [
+            (cell.row - first_row, cell.column, copy(cell._style), cell.value, cell.coordinate,
+             isinstance(cell, MergedCell))
+            for row in ws.iter_rows(min_row=first_row, max_row=last_row)
+            for cell in row
+            if cell.has_style or cell.value is not None
+        ]
+        self.row_dimensions = []
+        for row in range(first_row, last_row + 1):
+            if row in ws.row_dimensions:
+                dim = ws.row_dimensions[row]
+                attrs = dict(ht=dim.ht, customHeight=dim.customHeight, thickBot=dim.thickBot, thickTop=dim.thickTop,
+                             hidden=dim.hidden, outlineLevel=dim.outlineLevel, collapsed=dim.collapsed)
+                self.row_dimensions.append((row - first_row, attrs, copy(dim._style)))
+        self.merges = [
+            (r.min_col, r.min_row - first_row, r.max_col, r.max_row - first_row)
+            for r in ws.merged_cells.ranges
+            if first_row <= r.min_row and r.max_row <= last_row
+        ]
+        # 入力規則は ws.data_validations.dataValidation の並び順で対応づける
+        self.validations = [
+            (i, [(r.min_col, r.min_row - first_row, r.max_col, r.max_row - first_row)
+                 for r in dv.sqref.ranges if first_row <= r.min_row and r.max_row <= last_row])
+            for i, dv in enumerate(ws.data_validations.dataValidation)
+        ]
+
+    def repeat(self, ws, copies):
+        """ブロックを copies 回、直後に続けて複製する"""
+        cells = ws._cells
+        merged = ws.merged_cells.ranges
+        validations = ws.data_validations.dataValidation
+        for k in range(1, copies + 1):
+            shift = self.height * k
+            base_row = self.first_row + shift
+            for offset, attrs, style in self.row_dimensions:
+                dim = RowDimension(ws, index=base_row + offset, **attrs)
+                dim._style = copy(style)
+                ws.row_dimensions[base_row + offset] = dim
+            for offset, col, style, value, origin, is_merged in self.cells:
+                row = base_row + offset
+                if is_merged:
+                    target = MergedCell(ws, row, col)
+                    target._style = copy(style)
+                else:
+                    target = Cell(ws, row=row, column=col, style_array=copy(style))
+                    if isinstance(value, str) and value.startswith("="):
+                        value = Translator(value, origin=origin).translate_formula(row_delta=shift)
+                    target.value = value
+                cells[row, col] = target
+            for min_col, min_off, max_col, max_off in self.merges:
+                merged.add(MergedCellRange(ws, CellRange(min_col=min_col, min_row=base_row + min_off,
+                                                         max_col=max_col, max_row=base_row + max_off).coord))
+            for i, ranges in self.validations:
+                for min_col, min_off, max_col, max_off in ranges:
+                    validations[i].sqref.ranges.add(CellRange(min_col=min_col, min_row=base_row + min_off,
+                                                              max_col=max_col, max_row=base_row + max_off))
+        return ws
+
+
+def row_block(first_row, height, path=TEMPLATE_PATH):
+    """テンプレートの有効シートの行ブロック（RowBlock）。テンプレートの版ごとに1回だけ読み取る"""
+    path = os.path.abspath(path)
+    snapshot = _snapshot(path)
+    key = (path, first_row, height)
+    entry = _row_blocks.get(key)
+    if entry is None or entry[0] is not snapshot:
+        entry = (snapshot, RowBlock(pickle.loads(snapshot).active, first_row, height))
+        _row_blocks[key] = entry
+    return entry[1]
+
+
+def template_digest(path=TEMPLATE_PATH):
+    """テンプレートファイルの内容の SHA-256（(更新日時, サイズ) が変わったときだけ読み直す）"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    entry = _digests.get(path)
+    if entry is None or entry[0] != version:
+        with open(path, "rb") as f:
+            entry = (version, hashlib.sha256(f.read()).hexdigest())
+        _digests[path] = entry
+    return entry[1]
+
+
+def _label_key(text):
+    return "".join(text.split())
+
+
+class AnchorIndex:
+    """テンプレートの有効シートの見出し（文字列のセル）→ セル番地の索引
+
+    見出しは空白・改行を除いて比べる（"環境\n構築" と "環境構築" は同じ）。同じ見出しが複数あればシート上の順に並べる。
+    """
+
+    def __init__(self, ws):
+        self._cells = {}
+        for row in ws.iter_rows():
+            for cell in row:
+                value = cell.value
+                if isinstance(value, str) and not value.startswith("="):
+                    self._cells.setdefault(_label_key(value), []).append(cell.coordinate)
+
+    def cells(self, label):
+        return tuple(self._cells.get(_label_key(label), ()))
+
+
+def template_anchors(path=TEMPLATE_PATH):
+    """テンプレートの見出しの索引（AnchorIndex）。テンプレートの版ごとに1回だけ読み取る"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    entry = _anchors.get(path)
+    if entry is None or entry[0] != version:
+        # 値だけを読めばよいので読み取り専用モードで開く（書式は解析しない）
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            entry = (version, AnchorIndex(workbook.active))
+        finally:
+            workbook.close()
+        _anchors[path] = entry
+    return entry[1]
+
+
+def workbook_bytes(workbook):
+    """Workbook をファイルに書かずに xlsx のバイト列へ変換"""
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,62 @@
+import math
+import re
+import unicodedata
+
+# --- スキルの経験年数 ---
+# 経験年数は skills.experience_months に月数（整数）で保存する。
+# 「〇年〇ヶ月」への変換は画面表示とExcel出力の直前だけで行う。
+# skills.experience_years（TEXT）は旧データ・入力値のまま残し、月数に読み替えられない場合の表示に使う。
+
+_YEAR_MONTH_PATTERN = re.compile(
+    r"^(?:(?P<years>\d+(?:\.\d+)?)\s*年)?\s*(?:(?P<months>\d+)\s*(?:ヶ月|ヵ月|か月|カ月|ケ月|月))?$"
+)
+
+
+def parse_experience_months(value):
+    """経験年数の値（「3年2ヶ月」「2ヶ月」「1.5」「3」や数値）を月数に変換。読み替えられなければ None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        # 数値は年単位（旧データの float 年）
+        return max(int(round(value * 12)), 0)
+    s = unicodedata.normalize("NFKC", str(value)).strip().replace(" ", "")
+    if not s:
+        return None
+    try:
+        return max(int(round(float(s) * 12)), 0)
+    except ValueError:
+        pass
+    match = _YEAR_MONTH_PATTERN.match(s)
+    if not match or not (match.group("years") or match.group("months")):
+        return None
+    years = float(match.group("years") or 0)
+    months = int(match.group("months") or 0)
+    return int(round(years * 12)) + months
+
+
+def to_months(years, months):
+    """(年, 月) の入力を月数に変換"""
+    return int(years) * 12 + int(months)
+
+
+def months_to_years_months(months):
+    """月数を (年, 月) に変換（未設定は (0, 0)）"""
+    if months is None or (isinstance(months, float) and math.isnan(months)):
+        return 0, 0
+    return divmod(int(months), 12)
+
+
+def format_experience(months, fallback=""):
+    """月数を「〇年〇ヶ月」表記に変換（未設定は fallback）"""
+    if months is None or (isinstance(months, float) and math.isnan(months)):
+        return fallback if isinstance(fallback, str) else ""
+    years, rest = divmod(int(months), 12)
+    if years > 0 and rest > 0:
+        return f"{years}年{rest}ヶ月"
+    elif years > 0:
+        return f"{years}年"
+    elif rest > 0:
+        return f"{rest}ヶ月"
+    return "0ヶ月"
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from excel_template import TEMPLATE_PATH, template_digest
+from sheet_layout import LAYOUT_VERSION, cell_values, project_list_rows
+
+# --- Excel出力のキャッシュ ---
+# 出力結果（xlsx のバイト列）を、書き込む内容から作ったキーで保持する（プロセスに1つ）。
+#   キー = レイアウト定義の版 + 出力エンジン + テンプレートの内容のハッシュ + 書き込むセルの値・一覧シートの行
+# 内容が同じなら同じキーになるため、同じシートを続けて出力した場合は出力処理を行わずに前回の結果を返す。
+# 同じキーの出力が実行中なら、新たに出力せずその結果を待つ（同時に押された出力を1回にまとめる）。
+# スキルシートを書き換えたら invalidate_sheet(user_info の id) でそのシートの結果を捨てる
+# （捨てる前に始まっていた出力の結果もキャッシュには入れない）。
+# 保持するバイト数に上限を設け、超えたら最後に使われたのが古いものから捨てる。
+
+EXPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def export_key(sheet, engine, template_path=TEMPLATE_PATH):
+    """スキルシートの出力結果のキー（書き込む内容・テンプレート・エンジンが同じなら同じ値）"""
+    digest = hashlib.sha256()
+    digest.update(repr((LAYOUT_VERSION, engine, template_digest(template_path))).encode())
+    digest.update(repr(cell_values(sheet)).encode())
+    digest.update(repr(list(project_list_rows(sheet))).encode())
+    return digest.hexdigest()
+
+
+@dataclass(slots=True)
+class _Flight:
+    """実行中の出力（同じキーの要求はこの future の結果を待つ）"""
+    future: Future
+    sheet_id: int
+    generation: int
+
+
+class ExportCache:
+    def __init__(self, max_bytes=EXPORT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # キー → (シートID, バイト列)
+        self._keys_by_sheet = {}
+        self._flights = {}
+        self._generations = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def claim(self, key, sheet_id):
+        """(Future, 出力するか) を返す
+
+        キャッシュにあれば完了済みの Future、同じキーの出力が実行中ならその Future を返す（どちらも False）。
+        どちらでもなければ新しい Future を返す（True）。呼び出し側は出力して resolve() で結果を渡す。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                future = Future()
+                future.set_result(entry[1])
+                return future, False
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight.future, False
+            flight = _Flight(Future(), sheet_id, self._generations.get(sheet_id, 0))
+            self._flights[key] = flight
+            return flight.future, True
+
+    def resolve(self, key, source):
+        """claim() で出力を任されたキーの結果を、source（出力処理の Future）が終わったら反映する"""
+        source.add_done_callback(lambda f: self._settle(key, f))
+
+    def _settle(self, key, source):
+        try:
+            data = source.result()
+        except BaseException as e:
+            with self._lock:
+                flight = self._flights.pop(key)
+            flight.future.set_exception(e)
+            return
+        with self._lock:
+            flight = self._flights.pop(key)
+            if self._generations.get(flight.sheet_id, 0) == flight.generation:
+                self._store(key, flight.sheet_id, data)
+        # 待っている側のコールバックはロックの外で呼ぶ
+        flight.future.set_result(data)
+
+    def _store(self, key, sheet_id, data):
+        """ロック内で呼ぶ"""
+        if len(data) > self.max_bytes:
+            return
+        self._entries[key] = (sheet_id, data)
+        self._keys_by_sheet.setdefault(sheet_id, set()).add(key)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            old_key, _ = next(iter(self._entries.items()))
+            self._discard(old_key)
+
+    def _discard(self, key):
+        sheet_id, data = self._entries.pop(key)
+        self._size -= len(data)
+        keys = self._keys_by_sheet.get(sheet_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_sheet[sheet_id]
+
+    def invalidate(self, sheet_id):
+        """スキルシートの出力結果を捨てる（実行中の出力の結果も保持しない）"""
+        with self._lock:
+            self._generations[sheet_id] = self._generations.get(sheet_id, 0) + 1
+            for key in list(self._keys_by_sheet.get(sheet_id, ())):
+                self._discard(key)
+
+
+_cache = ExportCache()
+
+
+def get_export_cache():
+    return _cache
+
+
+def invalidate_sheet(sheet_id):
+    """スキルシートへの書き込み後に呼ぶ（そのシートのExcel出力のキャッシュを捨てる）"""
+    _cache.invalidate(sheet_id)
@@ -0,0 +1,130 @@
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from artifact_store import find_artifact
+from batch_export import submit_batch_export
+from export_jobs import DONE, FAILED, get_job, submit_export
+
+# --- Excel出力ジョブの表示（作成ページ・更新ページ・データ一覧ページの一括出力で共通） ---
+# 投入したジョブIDはセッションに保持し、再実行のたびに状態を表示する。
+# 実行中のジョブがある間はこの部分だけを一定間隔で再実行して状態を更新する（ページ全体は再実行しない）。
+# 結果をファイルに保存したジョブは、ダウンロードが押されたときに artifact_store から読み込んで渡す（画面の実行中には読まない）。
+
+JOB_POLL_SEC = 1.0
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MIME = "application/zip"
+
+
+def start_export(session_key, sheet, filename, download_name, template_path=None):
+    """Excel出力ジョブを投入してセッションに記録する"""
+    owner = st.session_state.get("user_id")
+    job_id = submit_export(sheet, filename, owner=owner, template_path=template_path)
+    st.session_state.setdefault(session_key, []).append((job_id, download_name))
+    return job_id
+
+
+def start_batch_export(session_key, db_path, sheet_ids, login_user_id=None):
+    """一括出力（ZIP）のジョブを投入してセッションに記録する"""
+    owner = st.session_state.get("user_id")
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 保存するファイル名は他のセッションと重ならないようにする（ダウンロード名には付けない）
+    filename = f"SkillSheets_{stamp}_{uuid.uuid4().hex[:8]}.zip"
+    job_id = submit_batch_export(db_path, sheet_ids, filename, owner=owner, login_user_id=login_user_id)
+    st.session_state.setdefault(session_key, []).append((job_id, f"SkillSheets_{stamp}.zip"))
+    return job_id
+
+
+def _session_jobs(session_key):
+    """セッションに記録したジョブを (ExportJob, ダウンロード名) で返す（期限切れで消えたものはセッションからも外す）"""
+    owner = st.session_state.get("user_id")
+    entries = []
+    for job_id, download_name in st.session_state.get(session_key, []):
+        job = get_job(job_id, owner)
+        if job is not None:
+            entries.append((job, download_name))
+    st.session_state[session_key] = [(job.id, download_name) for job, download_name in entries]
+    return entries
+
+
+def _artifact_reader(artifact_path):
+    def read():
+        path = find_artifact(artifact_path)
+        if path is None:
+            raise FileNotFoundError(f"保存期間を過ぎたため削除されました: {artifact_path}")
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+
+def _download_button(job, download_name):
+    """結果のダウンロードボタン（保存したファイルが消えていれば False）"""
+    if job.artifact_path:
+        if find_artifact(job.artifact_path) is None:
+            st.warning(f"保存期間を過ぎたため、出力したファイルは削除されました（{download_name}）")
+            return False
+        data = _artifact_reader(job.artifact_path)
+    else:
+        data = job.data
+    st.download_button(
+        label=f"ダウンロード（{download_name}）",
+        data=data,
+        file_name=download_name,
+        mime=ZIP_MIME if download_name.endswith(".zip") else XLSX_MIME,
+        key=f"export_job_download_{job.id}",
+    )
+    return True
+
+
+def _render_batch_job(job, download_name):
+    if job.status == FAILED:
+        st.error(f"一括出力中にエラーが発生しました: {job.error}")
+    elif job.status == DONE:
+        failed = [item for item in job.items if item.error]
+        succeeded = len(job.items) - len(failed)
+        if succeeded:
+            st.success(f"{succeeded}件をExcelに出力しました。")
+            _download_button(job, download_name)
+        if failed:
+            st.error(f"{len(failed)}件は出力できませんでした。")
+            st.dataframe(
+                pd.DataFrame([{"ID": item.user_info_id, "氏名": item.name, "エラー": item.error} for item in failed]),
+                use_container_width=True, hide_index=True,
+            )
+    else:
+        done, total = job.progress or (0, 0)
+        st.progress(done / total if total else 0.0, text=f"{done}/{total}件 出力しました（{download_name}）")
+
+
+def _render_jobs(session_key):
+    entries = _session_jobs(session_key)
+    for job, download_name in reversed(entries):
+        if job.progress is not None:
+            _render_batch_job(job, download_name)
+        elif job.status == DONE:
+            if job.artifact_path:
+                st.success(f"Excelファイルが生成されました: `{job.artifact_path}`")
+            else:
+                st.success("Excelファイルが生成されました。")
+            _download_button(job, download_name)
+        elif job.status == FAILED:
+            st.error(f"Excel出力中にエラーが発生しました: {job.error}")
+        else:
+            st.info(f"Excelを出力しています...（{download_name}）")
+    return any(not job.finished for job, _ in entries)
+
+
+def _poll_jobs(session_key):
+    # すべて終わったらページ全体を1回再実行して定期更新を止める
+    if not _render_jobs(session_key):
+        st.rerun()
+
+
+def show_export_jobs(session_key):
+    """このセッションで投入したExcel出力ジョブの状態とダウンロードボタンを表示する"""
+    if any(not job.finished for job, _ in _session_jobs(session_key)):
+        st.fragment(run_every=JOB_POLL_SEC)(_poll_jobs)(session_key)
+    else:
+        _render_jobs(session_key)
@@ -0,0 +1,279 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from artifact_store import save_artifact
+from excel_export import export_engine, export_sheet_bytes
+from export_cache import export_key, get_export_cache
+from excel_template import TEMPLATE_PATH, load_template
+
+# --- Excel出力ジョブ ---
+# 作成ページ・更新ページのExcel出力は画面のスクリプト内では行わず、ここにジョブとして投入する。
+# ジョブは子プロセス（同時実行数の上限付き）で実行し、画面はジョブIDで状態を確認して、終わったらダウンロードさせる。
+#   - 子プロセスは spawn で起動し、優先度を下げて実行する（出力中も他のセッションの応答を遅らせない）
+#     Streamlit は実行中のページ（app.py）を __main__ に置くため、spawn の子プロセスは起動時に app.py を読み込み直して
+#     アプリ全体を実行してしまう。子プロセスはプールの作成時に全部起動し、その間だけ __main__ を空のモジュールに差し替える
+#     （ジョブの投入では子プロセスを起動しないため、投入のたびに __main__ を触らない）
+#   - テンプレートの解析は子プロセスの起動時に1回だけ行う
+#   - 結果（xlsx のバイト列）はこのプロセスで保持するため、再実行（rerun）をまたいで取り出せる
+#   - 書き込む内容が同じ出力は export_cache の結果を使う（出力中なら同じ結果を待つ）ため、子プロセスには投入しない
+#     終わったジョブは一定時間・一定件数を超えたら古いものから捨てる
+#   - 一括出力のように複数件の出力をまとめるジョブ（submit_task）は、このプロセスのスレッドでまとめ役を動かし、
+#     1件ずつの出力は同じ子プロセスのプールに投入する（render）。結果は artifact_store に保存したファイルで渡す
+
+EXPORT_WORKERS_ENV = "SKILLSHEET_EXPORT_WORKERS"
+EXPORT_WORKERS_DEFAULT = 2
+EXPORT_WORKER_NICE = 10
+JOB_RESULT_TTL_SEC = 3600
+JOB_MAX_FINISHED = 100
+TASK_THREADS = 2
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+@dataclass(slots=True)
+class ExportJob:
+    id: str
+    filename: str
+    owner: object = None  # ログインユーザーID（他人のジョブは見せない）
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    data: bytes | None = None
+    artifact_path: str | None = None
+    error: str | None = None
+    progress: tuple | None = None  # (完了件数, 全件数)。複数件をまとめるジョブのみ
+    items: list | None = None  # 件ごとの結果。複数件をまとめるジョブのみ
+    future: object = field(default=None, repr=False)
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return FAILED
+        if self.finished_at is not None:
+            return DONE
+        return RUNNING if self.future is not None and self.future.running() else QUEUED
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+
+def export_workers():
+    try:
+        return max(1, int(os.environ.get(EXPORT_WORKERS_ENV, EXPORT_WORKERS_DEFAULT)))
+    except ValueError:
+        return EXPORT_WORKERS_DEFAULT
+
+
+def _init_worker(template_path, engine):
+    """子プロセスの初期化: 優先度を下げ、テンプレートを先に解析しておく"""
+    if hasattr(os, "nice"):
+        os.nice(EXPORT_WORKER_NICE)
+    if engine == "openpyxl" and os.path.exists(template_path):
+        load_template(template_path)
+
+
+def _run_export(sheet, template_path, engine):
+    """子プロセスで1件出力する"""
+    return export_sheet_bytes(sheet, template_path, engine)
+
+
+def _warm_up():
+    """子プロセスを起動させるための空のジョブ"""
+    return os.getpid()
+
+
+_main_lock = threading.Lock()
+
+
+@contextmanager
+def _plain_main():
+    """子プロセスの起動中だけ __main__ を空のモジュールにする（spawn の子プロセスに __main__ を読み込ませない）"""
+    with _main_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def _start_pool(workers, template_path, engine):
+    """子プロセスのプールを作り、子プロセスをすべて起動してから返す
+
+    ProcessPoolExecutor（spawn）は、空いている子プロセスが無いと submit の中で1つずつ起動する。
+    作成時に子プロセス数と同じ数の空のジョブを投入して全部起動しておき、以降の submit では起動させない。
+    """
+    with _plain_main():
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(template_path, engine),
+        )
+        for _ in range(workers):
+            pool.submit(_warm_up)
+    return pool
+
+
+class ExportJobQueue:
+    """Excel出力ジョブの受付と結果の保持（プロセスに1つ）"""
+
+    def __init__(self, template_path=TEMPLATE_PATH, engine=None, workers=None):
+        self.template_path = template_path
+        self.engine = engine or export_engine()
+        self.workers = workers or export_workers()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._tasks = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = _start_pool(self.workers, self.template_path, self.engine)
+        return self._pool
+
+    def submit(self, sheet, filename, owner=None, template_path=None):
+        """出力ジョブを投入してジョブIDを返す（完了を待たない）"""
+        job = ExportJob(id=uuid.uuid4().hex, filename=filename, owner=owner)
+        result, job.future = self._render(sheet, template_path)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        result.add_done_callback(lambda f, job=job: self._finish(job, f))
+        return job.id
+
+    def submit_task(self, filename, owner, fn, *args):
+        """fn(job, *args) をこのプロセスのスレッドで実行するジョブを投入してジョブIDを返す
+
+        fn は保存したファイルのパス（artifact_store）を返す。途中経過は job.progress・job.items に書いてよい。
+        """
+        job = ExportJob(id=uuid.uuid4().hex, filename=filename, owner=owner, progress=(0, 0))
+        with self._lock:
+            self._prune()
+            if self._tasks is None:
+                self._tasks = ThreadPoolExecutor(max_workers=TASK_THREADS, thread_name_prefix="export-task")
+            job.future = self._tasks.submit(fn, job, *args)
+            self._jobs[job.id] = job
+        job.future.add_done_callback(lambda f, job=job: self._finish_task(job, f))
+        return job.id
+
+    def _finish_task(self, job, future):
+        try:
+            job.artifact_path = future.result()
+        except Exception as e:
+            job.error = str(e)
+        job.finished_at = time.time()
+        job.future = None
+
+    def render(self, sheet, template_path=None):
+        """1件の出力を子プロセスに投入し、結果（xlsx のバイト列）の Future を返す（一括出力などジョブの中から使う）"""
+        return self._render(sheet, template_path)[0]
+
+    def _render(self, sheet, template_path=None):
+        """(結果の Future, 出力処理の Future) を返す
+
+        キャッシュにある・同じ内容を出力中のときは子プロセスに投入せず、その結果を待つだけにする（2つは同じ Future）。
+        """
+        template_path = template_path or self.template_path
+        cache = get_export_cache()
+        key = export_key(sheet, self.engine, template_path)
+        result, leader = cache.claim(key, sheet.id)
+        if not leader:
+            return result, result
+        with self._lock:
+            source = self._submit(_run_export, sheet, template_path, self.engine)
+        cache.resolve(key, source)
+        return result, source
+
+    def _submit(self, *args):
+        """子プロセスに投入して Future を返す（ロック内で呼ぶ。投入できなければ失敗した Future を返す）"""
+        try:
+            try:
+                return self._get_pool().submit(*args)
+            except BrokenProcessPool:
+                # 子プロセスが異常終了していたらプールを作り直す
+                self._pool = None
+                return self._get_pool().submit(*args)
+        except Exception as e:
+            failed = Future()
+            failed.set_exception(e)
+            return failed
+
+    def _finish(self, job, future):
+        try:
+            data = future.result()
+            job.artifact_path = save_artifact(job.filename, data)
+            # 控えを保存した場合はダウンロードもそこから渡す（artifact_store）ため、バイト列は持たない
+            job.data = None if job.artifact_path else data
+        except BrokenProcessPool as e:
+            with self._lock:
+                self._pool = None
+            job.error = f"出力処理が異常終了しました: {e}"
+        except Exception as e:
+            job.error = str(e)
+        job.finished_at = time.time()
+        job.future = None
+
+    def get(self, job_id, owner=None):
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def shutdown(self):
+        """子プロセスとまとめ役のスレッドを終了する（スクリプトから使った場合に終了前に呼ぶ）"""
+        with self._lock:
+            pool, tasks = self._pool, self._tasks
+            self._pool = self._tasks = None
+        if tasks is not None:
+            tasks.shutdown()
+        if pool is not None:
+            pool.shutdown()
+
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        """期限切れ・件数超過の終わったジョブを捨てる（ロック内で呼ぶ）"""
+        now = time.time()
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at,
+        )
+        over = len(finished) - JOB_MAX_FINISHED
+        for i, job in enumerate(finished):
+            if i < over or now - job.finished_at > JOB_RESULT_TTL_SEC:
+                del self._jobs[job.id]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = ExportJobQueue()
+    return _queue
+
+
+def submit_export(sheet, filename, owner=None, template_path=None):
+    """スキルシートのExcel出力をジョブとして投入し、ジョブIDを返す"""
+    return get_job_queue().submit(sheet, filename, owner, template_path)
+
+
+def get_job(job_id, owner=None):
+    """ジョブIDからジョブを返す（期限切れ・他のユーザーのジョブは None）"""
+    return get_job_queue().get(job_id, owner)
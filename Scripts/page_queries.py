@@ -0,0 +1,24 @@
+# --- 各ページの一覧・ログインのSQL ---
+# ページのスクリプトに直接書かず、ここにまとめる（check_query_plans でも同じSQLの実行計画を確認する）。
+# スキルシート1件の読み書き・検索のSQLは sheet_store にある。
+
+# ログイン認証（login_id は一意）
+LOGIN_USER_SQL = '''
+    SELECT id, login_id, password_hash, username, role FROM users WHERE login_id = ?
+'''
+
+# データ参照ページの登録一覧（ログインユーザーが作成したスキルシートのみ）
+DATA_VIEW_SHEETS_SQL = '''
+    SELECT id, name, name_kana, gender, birth_date, final_education, created_at
+    FROM user_info
+    WHERE login_user_id = ?
+    ORDER BY created_at DESC
+'''
+
+# 更新ページの選択肢（ログインユーザーが作成したスキルシートのみ）
+UPDATE_PAGE_SHEETS_SQL = '''
+    SELECT id, name, name_kana, created_at
+    FROM user_info
+    WHERE login_user_id = ?
+    ORDER BY created_at DESC
+'''
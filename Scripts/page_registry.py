@@ -0,0 +1,35 @@
+import os
+import threading
+
+# --- ページスクリプトのコンパイル済みコードキャッシュ ---
+# Streamlitは操作のたびにapp.pyを再実行するが、このモジュールはプロセス内で
+# 一度だけimportされるため、ここに保持したコードオブジェクトは再実行をまたいで再利用される。
+
+_code_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_page_code(path):
+    """ページファイルのコードオブジェクトを取得（ファイル更新時のみ再コンパイル）"""
+    mtime = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        cached = _code_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    code = compile(source, path, "exec")
+    with _cache_lock:
+        _code_cache[path] = (mtime, code)
+    return code
+
+
+def run_page(path):
+    """ページをコンパイル済みコードで実行"""
+    namespace = {
+        "__name__": "__main__",
+        "__file__": path,
+        "__builtins__": __builtins__,
+    }
+    exec(get_page_code(path), namespace)
+
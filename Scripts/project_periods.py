@@ -0,0 +1,65 @@
+import re
+import unicodedata
+from datetime import date
+
+# --- 案件の期間 ---
+# 期間は projects.start_month_idx / end_month_idx に「年 * 12 + (月 - 1)」の整数で保存する。
+# 終了が「現在」（継続中）の案件は ONGOING_MONTH_INDEX を入れ、並べ替え・範囲検索をインデックスだけで行う。
+# period_start / period_end（TEXT）は入力値のまま残す。
+
+ONGOING_LABEL = "現在"
+ONGOING_MONTH_INDEX = 9999 * 12 + 11  # 9999/12
+
+_YM_PATTERN = re.compile(r"^(\d{4})\s*(?:[/\-.年]\s*(\d{1,2})\s*月?|(\d{2}))$")
+
+
+def month_index(year, month):
+    return int(year) * 12 + int(month) - 1
+
+
+def parse_month_index(value):
+    """「yyyy/MM」「yyyy-MM」「yyyyMM」「yyyy年M月」「現在」を月インデックスに変換。読み替えられなければ None"""
+    if value is None:
+        return None
+    s = unicodedata.normalize("NFKC", str(value)).strip()
+    if not s:
+        return None
+    if s == ONGOING_LABEL:
+        return ONGOING_MONTH_INDEX
+    match = _YM_PATTERN.match(s)
+    if not match:
+        return None
+    month = int(match.group(2) or match.group(3))
+    if not 1 <= month <= 12:
+        return None
+    return month_index(match.group(1), month)
+
+
+def format_month_index(idx):
+    """月インデックスを「yyyy/MM」（継続中は「現在」）に変換"""
+    if idx is None:
+        return ""
+    idx = int(idx)
+    if idx >= ONGOING_MONTH_INDEX:
+        return ONGOING_LABEL
+    year, month0 = divmod(idx, 12)
+    return f"{year:04d}/{month0 + 1:02d}"
+
+
+def normalize_ym(value):
+    """入力欄の初期値用に「yyyy/MM」へ揃える（読み替えられない値はそのまま返す）"""
+    idx = parse_month_index(value)
+    if idx is None:
+        return "" if value is None else str(value)
+    return format_month_index(idx)
+
+
+def period_indexes(period_start, period_end):
+    """(start_month_idx, end_month_idx) を返す"""
+    return parse_month_index(period_start), parse_month_index(period_end)
+
+
+def current_month_index(today=None):
+    """当月の月インデックス"""
+    today = today or date.today()
+    return month_index(today.year, today.month)
@@ -0,0 +1,78 @@
+import ast
+import json
+
+import numpy as np
+import pandas as pd
+
+# --- 案件の工程 ---
+# 工程は projects.phase_mask に PHASE_LABELS の並び順のビットで保存する（環境構築 = 1, 要件 = 2, ...）。
+# 旧データの phases 列（dict / list の文字列表現など）は phases_to_mask で読み替える。
+
+PHASE_LABELS = [
+    "環境構築", "要件", "基本", "詳細", "製造", "単体", "結合", "総合", "保守運用", "他"
+]
+PHASE_BITS = {label: 1 << i for i, label in enumerate(PHASE_LABELS)}
+
+_TRUE_VALUES = [True, 1, 'true', 'True', '1']
+
+
+def _parse_phases_text(text):
+    s = text.strip()
+    if not s:
+        return []
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            return parse(s)
+        except Exception:
+            continue
+    # 改行・カンマ区切りの工程名
+    return [part.strip() for part in s.replace('\n', ',').split(',')]
+
+
+def phases_to_mask(value):
+    """工程の値（dict / list / それらの文字列表現 / ビットマスク）をビットマスクに変換"""
+    if value is None:
+        return 0
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        value = _parse_phases_text(value)
+    mask = 0
+    if isinstance(value, dict):
+        for label, checked in value.items():
+            if checked in _TRUE_VALUES:
+                mask |= PHASE_BITS.get(label, 0)
+    elif isinstance(value, (list, tuple, set)):
+        for label in value:
+            mask |= PHASE_BITS.get(str(label).strip(), 0)
+    return mask
+
+
+def mask_to_phases(mask):
+    """ビットマスクを工程名のリスト（PHASE_LABELS順）に変換"""
+    try:
+        mask = int(mask)
+    except (TypeError, ValueError):
+        return []
+    return [label for label, bit in PHASE_BITS.items() if mask & bit]
+
+
+def project_phases(project):
+    """案件（dict / Series）の工程名リスト。phase_mask 列がない旧データは phases 列から読み替える"""
+    mask = project.get('phase_mask')
+    if mask is None or pd.isna(mask):
+        mask = phases_to_mask(project.get('phases'))
+    return mask_to_phases(mask)
+
+
+def encode_phases(value):
+    """保存用に (phases 列の文字列, phase_mask) を返す。phases 列は工程名リストの表現に揃える"""
+    mask = phases_to_mask(value)
+    return str(mask_to_phases(mask)), mask
+
+
+def decode_phase_columns(masks):
+    """phase_mask の Series を工程ごとの ●/空白 列の DataFrame に一括変換"""
+    values = pd.to_numeric(masks, errors='coerce').fillna(0).astype(np.int64).to_numpy()
+    bits = (values[:, None] >> np.arange(len(PHASE_LABELS))) & 1
+    return pd.DataFrame(np.where(bits == 1, '●', ''), columns=PHASE_LABELS, index=masks.index)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from db_connection import connect, read_connection
+from db_writer import write_generation
+
+# --- 参照クエリのキャッシュ ---
+# 一覧・詳細の参照結果を (DBファイル, ログインユーザー, クエリ+パラメータ) ごとにプロセス内LRUで保持する。
+# フォーム入力などによる再実行では、DBが変わっていなければSQLiteに問い合わせずにキャッシュを返す。
+# DBの変更は次の2つで検知する。
+#   - 書き込みスレッド（db_writer）のコミット回数: このプロセスからの更新はすぐに反映される
+#   - 監視用接続の PRAGMA data_version: 他プロセス（バッチ等）からの更新。確認は一定間隔に間引く
+
+CACHE_MAX_ENTRIES = 256
+DATA_VERSION_CHECK_SEC = 1.0
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+_sentinels = {}
+_sentinel_lock = threading.Lock()
+
+
+class _DataVersionSentinel:
+    """他の接続によるコミットを PRAGMA data_version で検知するための専用接続"""
+
+    def __init__(self, db_path):
+        self._conn = connect(db_path, readonly=True)
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._version = None
+
+    def version(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._version is None or now - self._checked_at >= DATA_VERSION_CHECK_SEC:
+                self._version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                self._checked_at = now
+            return self._version
+
+
+def _get_sentinel(db_path):
+    sentinel = _sentinels.get(db_path)
+    if sentinel is None:
+        with _sentinel_lock:
+            sentinel = _sentinels.get(db_path)
+            if sentinel is None:
+                sentinel = _DataVersionSentinel(db_path)
+                _sentinels[db_path] = sentinel
+    return sentinel
+
+
+def current_version(db_path):
+    """DBの変更を表すバージョン（書き込みスレッドのコミット回数, data_version）"""
+    return write_generation(db_path), _get_sentinel(db_path).version()
+
+
+def cached_read(db_path, key, loader, scope=None):
+    """loader(conn) の結果をキャッシュして返す（scope にはログインユーザーIDなどを渡す）
+
+    戻り値は共有されるため、呼び出し側で変更しないこと（DataFrame は read_sql_cached がコピーを返す）。
+    """
+    cache_key = (db_path, scope, key)
+    version = current_version(db_path)
+    with _cache_lock:
+        entry = _cache.get(cache_key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(cache_key)
+            return entry[1]
+    with read_connection(db_path) as conn:
+        value = loader(conn)
+    with _cache_lock:
+        _cache[cache_key] = (version, value)
+        _cache.move_to_end(cache_key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return value
+
+
+def read_sql_cached(db_path, sql, params=(), scope=None):
+    """pd.read_sql_query のキャッシュ版（呼び出し側で変更できるようにコピーを返す）"""
+    params = tuple(params)
+    df = cached_read(
+        db_path, ("sql", sql, params),
+        lambda conn: pd.read_sql_query(sql, conn, params=list(params)),
+        scope=scope,
+    )
+    return df.copy()
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
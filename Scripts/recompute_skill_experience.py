@@ -0,0 +1,22 @@
+import os
+import sys
+
+from db_connection import connect
+from db_migrations import migrate
+from sheet_store import recompute_all_skills
+
+# 全スキルシートのスキル経験月数を、案件期間（開発環境に含まれるスキル × 案件の期間）の和集合から再計算する。
+# 継続中の案件は実行した月までを数えるため、月次などで定期的に実行する。
+
+DB_PATH = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "skillsheet_data.db")
+
+print(f"スキーマバージョン: {migrate(DB_PATH)}")
+
+conn = connect(DB_PATH)
+try:
+    with conn:
+        count = recompute_all_skills(conn)
+finally:
+    conn.close()
+
+print(f"再計算したスキル: {count}件")
@@ -0,0 +1,293 @@
+from functools import lru_cache
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from excel_template import RowBlock, template_anchors
+from project_phases import PHASE_LABELS
+from sheet_store import ENV_TYPES, normalize_skill_name
+
+# --- SkillSheetTemplate.xlsx のレイアウト定義 ---
+# どのセルに何を書くかをここにまとめて定義し、Excel出力（openpyxl の render_sheet / xlsx_patch）はどちらもこの定義だけを使う。
+# 定義は1回だけ (行番号, 列番号, 値のキー) の平らな一覧にコンパイルし、出力時は
+# スキルシートから作ったキー → 値の辞書を引いて書き込むだけにする（セル番地の組み立て・解析をしない）。
+# 結合セルは左上のセルにだけ書く（結合範囲の内側のセルは指定しない）。
+# 定義（セル番地・値の作り方）を変えたら LAYOUT_VERSION を上げる（Excel出力のキャッシュ export_cache のキーに含まれる）。
+# テンプレートの見出し（アンカー）がどのセルにあるはずかも定義しておき、出力の前にテンプレートの版ごとに1回、
+# 見出しの索引（excel_template.template_anchors）と照らし合わせる（validate_template）。テンプレートの行・列がずれていれば
+# 出力せずに、見出しが今どこにあるかをエラーで示す。
+
+LAYOUT_VERSION = 1
+
+# 基本情報: (セル, SkillSheet のフィールド)
+SHEET_FIELD_CELLS = [
+    ("E4", "name_kana"),
+    ("E5", "name"),
+    ("Q5", "gender"),
+    ("T5", "transportation"),
+    ("AB5", "nearest_station"),
+    ("AJ5", "access_method"),
+    ("AM5", "access_time"),
+    ("AV1", "birth_date"),
+    ("B8", "final_education"),
+    ("AE8", "graduation_date"),
+    ("B27", "self_pr"),
+]
+
+# 保有資格（入りきらない分は最後のセルにまとめる）
+QUALIFICATION_CELLS = ["B10", "B11", "B12", "V10", "V11", "V12"]
+
+# スキル表: skill_type → (スキル名の列, 経験年数の列)
+SKILL_COLUMNS = {
+    "language": ("B", "H"),
+    "tool": ("L", "R"),
+    "db": ("V", "AB"),
+    "machine": ("AF", "AL"),
+}
+SKILL_FIRST_ROW = 15
+SKILL_ROWS = 10
+
+# 職務経歴: テンプレートの案件ブロックの先頭行（No の行。2件目だけ14行、他は13行）
+PROJECT_BLOCK_ROWS = [37, 50, 64, 77, 90, 103, 116, 129, 142, 155, 168, 181, 194, 207, 220, 233]
+# 案件がテンプレートのブロック数より多い場合は、最後のブロック（シートの末尾）を書式・結合セルごと後ろに複製する
+PROJECT_BLOCK_HEIGHT = 13
+# 複製したブロックの No（テンプレートの最後のブロックの No=15 に続けて振る）
+PROJECT_NO_COLUMN = "B"
+# ブロック内のセル: (列, ブロック先頭からの行, Project のフィールド)
+PROJECT_FIELD_CELLS = [
+    ("D", 0, "period_start"),
+    ("E", 1, "period_end"),
+    ("L", 2, "industry"),
+    ("T", 2, "role"),
+    ("Z", 2, "headcount"),
+    ("J", 3, "system_name"),
+]
+# 工程（●）: PHASE_LABELS の順に J 列から2列おき
+PHASE_FIRST_COLUMN = "J"
+PHASE_ROW = 1
+# 開発環境: env_type → 列。ブロック先頭から2行目以降に1行1項目
+PROJECT_ENV_COLUMNS = {
+    "env_langs": "AD",
+    "env_tools": "AG",
+    "env_dbs": "AJ",
+    "env_oss": "AM",
+}
+PROJECT_ENV_FIRST_ROW = 2
+PROJECT_ENV_ROWS = 11
+
+# 全案件の一覧シート（テンプレートにない場合は作成する）
+PROJECT_LIST_SHEET = "Projects"
+PROJECT_LIST_HEADERS = (
+    ["開始(yyyy/MM)", "終了(yyyy/MM|現在)", "システム名/案件名・業務内容", "役割", "業種"]
+    + [f"工程:{p}" for p in PHASE_LABELS]
+    + ["人数"]
+    + [f"環境:言語{i+1}" for i in range(PROJECT_ENV_ROWS)]
+    + [f"環境:ツール/FW/Lib{i+1}" for i in range(PROJECT_ENV_ROWS)]
+    + [f"環境:DB{i+1}" for i in range(PROJECT_ENV_ROWS)]
+    + [f"環境:OS/マシン{i+1}" for i in range(PROJECT_ENV_ROWS)]
+)
+
+# テンプレートの見出し: (見出し, セル)
+SHEET_ANCHORS = [
+    ("ﾌﾘｶﾞﾅ", "B4"),
+    ("氏名", "B5"),
+    ("性別", "Q4"),
+    ("最寄駅", "T4"),
+    ("生年月日", "AR1"),
+    ("最終学歴", "B7"),
+    ("保有資格・免許", "B9"),
+    ("自己PR、他", "B26"),
+]
+# スキル表の見出し（スキル名の列の、表の1行上）: skill_type → 見出し
+SKILL_ANCHORS = {
+    "language": "言語",
+    "tool": "ﾂｰﾙ/FW/Lib",
+    "db": "DB",
+    "machine": "ﾏｼﾝ/OS",
+}
+# 案件ブロックの見出し: (見出し, 列, ブロック先頭からの行)。工程の見出しは ● の1行上にある
+PROJECT_BLOCK_ANCHORS = [
+    ("業種", "J", 2),
+    ("役割", "R", 2),
+    ("人数", "X", 2),
+]
+
+_validated = {}
+
+
+def _cell_index(cell):
+    letters = cell.rstrip("0123456789")
+    return int(cell[len(letters):]), column_index_from_string(letters)
+
+
+def project_block_rows(block_count=len(PROJECT_BLOCK_ROWS)):
+    """案件ブロックの先頭行（テンプレートの分 + 複製する分）"""
+    extra = max(0, block_count - len(PROJECT_BLOCK_ROWS))
+    last = PROJECT_BLOCK_ROWS[-1]
+    return PROJECT_BLOCK_ROWS + [last + PROJECT_BLOCK_HEIGHT * (i + 1) for i in range(extra)]
+
+
+def block_count(sheet):
+    """出力する案件ブロック数（テンプレートのブロック数未満にはしない）"""
+    return max(len(PROJECT_BLOCK_ROWS), len(sheet.projects))
+
+
+@lru_cache(maxsize=None)
+def compile_plan(block_count=len(PROJECT_BLOCK_ROWS)):
+    """レイアウト定義を (行, 列, 値のキー) の一覧にコンパイル（ブロック数ごとにプロセス内で1回）"""
+    plan = []
+    for cell, field_name in SHEET_FIELD_CELLS:
+        plan.append((*_cell_index(cell), field_name))
+    for i, cell in enumerate(QUALIFICATION_CELLS):
+        plan.append((*_cell_index(cell), ("qualification", i)))
+    for skill_type, (name_col, years_col) in SKILL_COLUMNS.items():
+        name_idx = column_index_from_string(name_col)
+        years_idx = column_index_from_string(years_col)
+        for i in range(SKILL_ROWS):
+            plan.append((SKILL_FIRST_ROW + i, name_idx, ("skill", skill_type, i, "name")))
+            plan.append((SKILL_FIRST_ROW + i, years_idx, ("skill", skill_type, i, "years")))
+    phase_first_idx = column_index_from_string(PHASE_FIRST_COLUMN)
+    no_idx = column_index_from_string(PROJECT_NO_COLUMN)
+    for block, base_row in enumerate(project_block_rows(block_count)):
+        if block >= len(PROJECT_BLOCK_ROWS):
+            plan.append((base_row, no_idx, ("project", block, "no")))
+        for col, row_offset, field_name in PROJECT_FIELD_CELLS:
+            plan.append((base_row + row_offset, column_index_from_string(col), ("project", block, field_name)))
+        for i, label in enumerate(PHASE_LABELS):
+            plan.append((base_row + PHASE_ROW, phase_first_idx + i * 2, ("phase", block, label)))
+        for env_type, col in PROJECT_ENV_COLUMNS.items():
+            col_idx = column_index_from_string(col)
+            for i in range(PROJECT_ENV_ROWS):
+                plan.append((base_row + PROJECT_ENV_FIRST_ROW + i, col_idx, ("env", block, env_type, i)))
+    return tuple(plan)
+
+
+def layout_anchors():
+    """テンプレートにあるはずの見出しを (見出し, セル) で返す"""
+    anchors = list(SHEET_ANCHORS)
+    for skill_type, label in SKILL_ANCHORS.items():
+        anchors.append((label, f"{SKILL_COLUMNS[skill_type][0]}{SKILL_FIRST_ROW - 1}"))
+    phase_first_idx = column_index_from_string(PHASE_FIRST_COLUMN)
+    for base_row in PROJECT_BLOCK_ROWS:
+        for i, label in enumerate(PHASE_LABELS):
+            anchors.append((label, f"{get_column_letter(phase_first_idx + i * 2)}{base_row + PHASE_ROW - 1}"))
+        for label, col, row_offset in PROJECT_BLOCK_ANCHORS:
+            anchors.append((label, f"{col}{base_row + row_offset}"))
+    return anchors
+
+
+def template_layout_errors(index):
+    """見出しの索引（AnchorIndex）とレイアウト定義の食い違いを説明の一覧で返す（一致すれば空）"""
+    errors = []
+    for label, cell in layout_anchors():
+        found = index.cells(label)
+        if cell not in found:
+            where = "、".join(found[:3]) + (" ほか" if len(found) > 3 else "") if found else "見つかりません"
+            errors.append(f"「{label}」が {cell} にありません（テンプレート上: {where}）")
+    return errors
+
+
+def validate_template(path):
+    """テンプレートがレイアウト定義どおりか確かめる（テンプレートの版ごとに1回。違っていれば ValueError）"""
+    index = template_anchors(path)
+    if _validated.get(path) is index:
+        return
+    errors = template_layout_errors(index)
+    if errors:
+        raise ValueError("テンプレートのレイアウトが定義と一致しません: " + " / ".join(errors[:5])
+                         + (f" ほか{len(errors) - 5}件" if len(errors) > 5 else ""))
+    _validated[path] = index
+
+
+def split_qualifications(value):
+    """資格の文字列（改行・カンマ区切り）をリストに分割"""
+    if not value:
+        return []
+    items = []
+    for part in str(value).replace('\r\n', '\n').replace('\r', '\n').replace(',', '\n').split('\n'):
+        part = part.strip()
+        if part and part not in ['""', "''", "[]"]:
+            items.append(part)
+    return items
+
+
+def sheet_values(sheet):
+    """SkillSheet を出力用の {値のキー: 値} に展開（データのある項目だけを1回なめる）"""
+    values = {field_name: getattr(sheet, field_name) for _, field_name in SHEET_FIELD_CELLS}
+    qualifications = split_qualifications(sheet.qualifications)
+    last = len(QUALIFICATION_CELLS) - 1
+    if len(qualifications) > last + 1:
+        qualifications[last:] = [", ".join(qualifications[last:])]
+    for i, qualification in enumerate(qualifications):
+        values[("qualification", i)] = qualification
+    counts = dict.fromkeys(SKILL_COLUMNS, 0)
+    for skill in sheet.skills:
+        i = counts.get(skill.skill_type)
+        if i is None or i >= SKILL_ROWS:
+            continue
+        values[("skill", skill.skill_type, i, "name")] = normalize_skill_name(skill.skill_name)
+        values[("skill", skill.skill_type, i, "years")] = skill.experience
+        counts[skill.skill_type] = i + 1
+    for block in range(len(PROJECT_BLOCK_ROWS), len(sheet.projects)):
+        values[("project", block, "no")] = block
+    for block, project in enumerate(sheet.projects):
+        for _, _, field_name in PROJECT_FIELD_CELLS:
+            values[("project", block, field_name)] = getattr(project, field_name)
+        for label in project.phases:
+            values[("phase", block, label)] = "●"
+        for env_type in ENV_TYPES:
+            for i, name in enumerate(project.envs(env_type)[:PROJECT_ENV_ROWS]):
+                values[("env", block, env_type, i)] = name
+    return values
+
+
+def project_list_rows(sheet):
+    """一覧シートの行（見出し行 + 全案件を1行ずつ）"""
+    yield list(PROJECT_LIST_HEADERS)
+    for p in sheet.projects:
+        phases = set(p.phases)
+        yield [
+            p.period_start, p.period_end, p.system_name, p.role, p.industry,
+            *[1 if label in phases else 0 for label in PHASE_LABELS],
+            p.headcount,
+            *[
+                name
+                for env_type in ENV_TYPES
+                for name in (p.envs(env_type)[:PROJECT_ENV_ROWS] + [None] * PROJECT_ENV_ROWS)[:PROJECT_ENV_ROWS]
+            ],
+        ]
+
+
+def cell_values(sheet):
+    """レイアウト定義の全セルについて (行, 列, 値) を返す（値のない項目は None で、テンプレートの値を消す）"""
+    get = sheet_values(sheet).get
+    return [(row, col, get(key)) for row, col, key in compile_plan(block_count(sheet))]
+
+
+def extra_blocks(sheet):
+    """テンプレートの後ろに複製する案件ブロック数"""
+    return block_count(sheet) - len(PROJECT_BLOCK_ROWS)
+
+
+def render_project_list(workbook, sheet):
+    """全案件を1行ずつ一覧シートに書き出す"""
+    ws = workbook[PROJECT_LIST_SHEET] if PROJECT_LIST_SHEET in workbook.sheetnames else workbook.create_sheet(PROJECT_LIST_SHEET)
+    ws.delete_rows(1, ws.max_row)
+    for row in project_list_rows(sheet):
+        ws.append(row)
+
+
+def render_sheet(workbook, sheet, project_block=None):
+    """テンプレートの複製（excel_template.load_template）にスキルシートを書き込む
+
+    project_block には excel_template.row_block で読み取り済みの最後の案件ブロックを渡す（省略時はこのブックから読み取る）。
+    """
+    ws = workbook.active
+    copies = extra_blocks(sheet)
+    if copies:
+        block = project_block or RowBlock(ws, PROJECT_BLOCK_ROWS[-1], PROJECT_BLOCK_HEIGHT)
+        block.repeat(ws, copies)
+    cell = ws.cell
+    for row, col, value in cell_values(sheet):
+        cell(row=row, column=col).value = value
+    render_project_list(workbook, sheet)
+    return workbook
@@ -0,0 +1,87 @@
+from dataclasses import dataclass, field
+
+from experience import format_experience
+from project_phases import mask_to_phases
+
+# --- スキルシートの集約 ---
+# 1シート分（基本情報・スキル・案件・開発環境）を sheet_store.load_sheet でまとめて読み込み、
+# 各ページとExcel出力はこのオブジェクトを参照する（単票の参照では DataFrame を作らない）。
+# 参照キャッシュ（query_cache）で共有されるため、画面側では書き換えず、編集用には to_dict() のコピーを使う。
+
+
+@dataclass(slots=True)
+class Skill:
+    skill_type: str
+    skill_name: str
+    experience_years: str = ""  # 入力値のまま（月数に読み替えられない旧データの表示用）
+    experience_months: int | None = None
+
+    @property
+    def experience(self):
+        """表示・出力用の「〇年〇ヶ月」"""
+        return format_experience(self.experience_months, self.experience_years)
+
+
+@dataclass(slots=True)
+class Project:
+    id: int
+    period_start: str = ""
+    period_end: str = ""
+    start_month_idx: int | None = None
+    end_month_idx: int | None = None
+    system_name: str = ""
+    role: str = ""
+    industry: str = ""
+    work_content: str = ""
+    headcount: str = ""
+    phase_mask: int = 0
+    env_langs: list = field(default_factory=list)
+    env_tools: list = field(default_factory=list)
+    env_dbs: list = field(default_factory=list)
+    env_oss: list = field(default_factory=list)
+
+    @property
+    def phases(self):
+        """工程名のリスト（PHASE_LABELS順）"""
+        return mask_to_phases(self.phase_mask)
+
+    def envs(self, env_type):
+        return getattr(self, env_type)
+
+    def to_dict(self):
+        """更新ページの編集バッファ用（開発環境のリストもコピーする）"""
+        data = {name: getattr(self, name) for name in self.__slots__}
+        for env_type in ("env_langs", "env_tools", "env_dbs", "env_oss"):
+            data[env_type] = list(data[env_type])
+        data["phases"] = self.phases
+        return data
+
+
+@dataclass(slots=True)
+class SkillSheet:
+    id: int
+    name: str = ""
+    name_kana: str = ""
+    gender: str = ""
+    birth_date: str = ""
+    final_education: str = ""
+    graduation_date: str = ""
+    transportation: str = ""
+    nearest_station: str = ""
+    access_method: str = ""
+    access_time: str = ""
+    self_pr: str = ""
+    qualifications: str = ""
+    created_at: str = ""
+    login_user_id: int | None = None
+    skills: list = field(default_factory=list)
+    projects: list = field(default_factory=list)  # 開始年月の新しい順
+
+    def skills_of(self, skill_type):
+        return [skill for skill in self.skills if skill.skill_type == skill_type]
+
+    def find_skill(self, skill_type, skill_name):
+        for skill in self.skills:
+            if skill.skill_type == skill_type and skill.skill_name == skill_name:
+                return skill
+        return None
@@ -0,0 +1,498 @@
+import ast
+import re
+
+from experience import format_experience, parse_experience_months
+from project_phases import encode_phases
+from project_periods import ONGOING_MONTH_INDEX, current_month_index, period_indexes
+from sheet_model import Project, Skill, SkillSheet
+from skill_experience import ENV_SKILL_TYPES, iter_sorted_skill_months, skill_months
+
+# --- スキルシートの一括書き込み ---
+# 行データをまとめて組み立て、executemany / UPSERT で書き込む。
+# 件数にかかわらず、1シートの保存は一定数のSQL文で完了する。
+# いずれの関数も書き込みスレッド（db_writer）から conn を受け取って呼ばれる前提で、commitは行わない。
+
+# (入力データのキー, 経験年数のキー, skills.skill_type)
+SKILL_INPUT_KEYS = [
+    ("languages", "language_years", "language"),
+    ("tools", "tool_years", "tool"),
+    ("databases", "db_years", "db"),
+    ("machines", "machine_years", "machine"),
+]
+
+# projects の開発環境（project_env.env_type の値）
+ENV_TYPES = ["env_langs", "env_tools", "env_dbs", "env_oss"]
+
+PROJECT_COLUMNS = [
+    "user_info_id", "period_start", "period_end", "system_name",
+    "role", "industry", "work_content", "phases", "headcount",
+    "env_langs", "env_tools", "env_dbs", "env_oss", "phase_mask",
+    "start_month_idx", "end_month_idx",
+]
+
+# load_sheet で読み込む列（sheet_model の各クラスのフィールド名と同じ）
+_SHEET_FIELDS = [
+    "id", "name", "name_kana", "gender", "birth_date", "final_education", "graduation_date",
+    "transportation", "nearest_station", "access_method", "access_time",
+    "self_pr", "qualifications", "created_at", "login_user_id",
+]
+_PROJECT_FIELDS = [
+    "id", "period_start", "period_end", "start_month_idx", "end_month_idx",
+    "system_name", "role", "industry", "work_content", "headcount", "phase_mask",
+]
+
+_INSERT_USER_INFO_SQL = '''
+    INSERT INTO user_info (name, name_kana, transportation, nearest_station,
+                           access_method, access_time, gender, birth_date,
+                           final_education, graduation_date, self_pr, qualifications, login_user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_UPSERT_SKILL_SQL = '''
+    INSERT INTO skills (user_info_id, skill_type, skill_name, experience_years, experience_months,
+                        experience_derived)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_info_id, skill_type, skill_name)
+    DO UPDATE SET experience_years = excluded.experience_years,
+                  experience_months = excluded.experience_months,
+                  experience_derived = excluded.experience_derived
+'''
+# 案件期間から計算した経験月数をすべて 0 に戻す（全件の再計算の前に行う）
+_RESET_DERIVED_SKILLS_SQL = '''
+    UPDATE skills SET experience_years = ?, experience_months = 0, experience_derived = 0
+    WHERE experience_derived = 1
+'''
+_INSERT_PROJECT_SQL = f'''
+    INSERT INTO projects ({", ".join(PROJECT_COLUMNS)})
+    VALUES ({", ".join("?" for _ in PROJECT_COLUMNS)})
+'''
+
+_UPDATE_PROJECT_SQL = '''
+    UPDATE projects SET
+    period_start = ?, period_end = ?, system_name = ?,
+    role = ?, industry = ?, work_content = ?, phases = ?,
+    headcount = ?, env_langs = ?, env_tools = ?,
+    env_dbs = ?, env_oss = ?, phase_mask = ?,
+    start_month_idx = ?, end_month_idx = ?
+    WHERE id = ?
+'''
+
+_INSERT_PROJECT_ENV_SQL = '''
+    INSERT INTO project_env (project_id, env_type, name, position)
+    VALUES (?, ?, ?, ?)
+'''
+# スキルシート1件の読み込み（基本情報・スキル・案件＋開発環境の3文）
+_LOAD_SHEET_SQL = f'''
+    SELECT {", ".join(_SHEET_FIELDS)}
+    FROM user_info WHERE id = ?
+'''
+_LOAD_SHEET_SKILLS_SQL = '''
+    SELECT skill_type, skill_name, experience_years, experience_months
+    FROM skills WHERE user_info_id = ?
+    ORDER BY skill_type, experience_months DESC, id
+'''
+_LOAD_SHEET_PROJECTS_SQL = f'''
+    SELECT {", ".join("p." + name for name in _PROJECT_FIELDS)}, e.env_type, e.name
+    FROM projects p
+    LEFT JOIN project_env e ON e.project_id = p.id
+    WHERE p.user_info_id = ?
+    ORDER BY p.start_month_idx DESC, p.id DESC, e.env_type, e.position
+'''
+
+# 一覧の絞り込み（氏名・フリガナの部分一致。空文字なら全件）
+_FIND_SHEETS_SQL = '''
+    SELECT id FROM user_info
+    WHERE login_user_id = ? AND (? = '' OR instr(name, ?) > 0 OR instr(name_kana, ?) > 0)
+    ORDER BY created_at DESC
+'''
+
+# 期間の範囲検索（月インデックスは project_periods 参照）
+_SHEETS_IN_PERIOD_SQL = '''
+    SELECT DISTINCT p.user_info_id
+    FROM projects p
+    JOIN user_info u ON u.id = p.user_info_id
+    WHERE u.login_user_id = ? AND p.end_month_idx >= ? AND p.start_month_idx <= ?
+'''
+_CURRENT_PROJECTS_SQL = '''
+    SELECT p.user_info_id, p.id, p.system_name, p.start_month_idx
+    FROM projects p
+    JOIN user_info u ON u.id = p.user_info_id
+    WHERE u.login_user_id = ? AND p.end_month_idx = ?
+    ORDER BY p.start_month_idx DESC
+'''
+
+# スキル経験月数の算出用（案件期間 × 開発環境）
+_SHEET_SKILL_PERIODS_SQL = '''
+    SELECT e.env_type, e.name, p.start_month_idx, p.end_month_idx
+    FROM project_env e
+    JOIN projects p ON p.id = e.project_id
+    WHERE p.user_info_id = ?
+'''
+_ALL_SKILL_PERIODS_SQL = '''
+    SELECT p.user_info_id, e.env_type, e.name, p.start_month_idx, p.end_month_idx
+    FROM project_env e
+    JOIN projects p ON p.id = e.project_id
+    WHERE p.user_info_id IS NOT NULL
+    ORDER BY p.user_info_id, e.env_type, e.name, p.start_month_idx
+'''
+
+# 案件と開発環境の削除（{where} は projects の条件）
+_DELETE_PROJECT_ENVS_SQL = '''
+    DELETE FROM project_env WHERE project_id IN (SELECT id FROM projects WHERE {where})
+'''
+_DELETE_PROJECTS_SQL = '''
+    DELETE FROM projects WHERE {where}
+'''
+
+_EMPTY_ITEM_VALUES = ["''", '""', "[]"]
+
+# 更新ページの編集バッファで差分を取る項目
+PROJECT_EDIT_FIELDS = [
+    "period_start", "period_end", "system_name", "role", "industry",
+    "phases", "headcount", "env_langs", "env_tools", "env_dbs", "env_oss",
+]
+
+
+def normalize_skill_name(name):
+    """スキル名の正規化（記号除去・空白トリム）"""
+    if name is None:
+        return ""
+    s = str(name).strip()
+    # 記号除去: [ ] ' " など
+    s = re.sub(r"^[\[\]'\"]+|[\[\]'\"]+$", "", s)
+    s = s.strip()
+    return s
+
+
+def split_skill_items(value):
+    """改行・カンマ区切りの入力を正規化済みのスキル名リストに分割"""
+    items = []
+    for part in re.split(r"[\n,]", str(value)):
+        item = normalize_skill_name(part)
+        if item and item not in _EMPTY_ITEM_VALUES:
+            items.append(item)
+    return items
+
+
+def parse_env_value(value):
+    """開発環境の値（リスト / str(list) / 改行・カンマ区切り）を項目名のリストに変換"""
+    if value is None or isinstance(value, (dict, float)):
+        return []
+    if isinstance(value, str):
+        s = value.strip()
+        if s.startswith("[") and s.endswith("]"):
+            try:
+                value = ast.literal_eval(s)
+            except Exception:
+                value = s
+    if isinstance(value, (list, tuple)):
+        items = [normalize_skill_name(x) for x in value if x is not None]
+        return [x for x in items if x and x not in _EMPTY_ITEM_VALUES]
+    return split_skill_items(value)
+
+
+def build_env_rows(project_id, project):
+    """案件1件の開発環境から project_env の行を組み立てる"""
+    rows = []
+    for env_type in ENV_TYPES:
+        for position, name in enumerate(parse_env_value(project.get(env_type))):
+            rows.append((project_id, env_type, name, position))
+    return rows
+
+
+def build_skill_rows(user_info_id, data):
+    """作成フォームの入力から skills の行をまとめて組み立てる"""
+    rows = []
+    for names_key, years_key, skill_type in SKILL_INPUT_KEYS:
+        for name, years in zip(data[names_key], data[years_key]):
+            if isinstance(name, str) and name.strip():
+                rows.append((user_info_id, skill_type, name, years, parse_experience_months(years)))
+    return rows
+
+
+def _project_values(project, system_name):
+    """案件1件の projects の値を PROJECT_COLUMNS の user_info_id 以降の順で返す"""
+    phases_text, phase_mask = encode_phases(project.get('phases'))
+    return (
+        project.get('period_start', ""), project.get('period_end', ""),
+        system_name, project.get('role', ""), project.get('industry', ""),
+        project.get('work_content', ""), phases_text, project.get('headcount', ""),
+        str(project.get('env_langs', "")), str(project.get('env_tools', "")),
+        str(project.get('env_dbs', "")), str(project.get('env_oss', "")), phase_mask,
+        *period_indexes(project.get('period_start'), project.get('period_end'))
+    )
+
+
+def build_project_rows(user_info_id, projects):
+    """作成フォームの案件リストから projects の行をまとめて組み立てる"""
+    return [
+        (user_info_id, *_project_values(project, project.get('system_and_work', "")))
+        for project in projects
+    ]
+
+
+def upsert_skills(conn, rows, derived=False):
+    """(user_info_id, skill_type, skill_name, experience_years, experience_months) の行を一括UPSERT
+
+    derived は案件期間から計算した値かどうか（skills.experience_derived。手入力の値は False）。
+    """
+    if rows:
+        conn.executemany(_UPSERT_SKILL_SQL, [(*row, int(derived)) for row in rows])
+
+
+def insert_projects(conn, rows):
+    if rows:
+        conn.executemany(_INSERT_PROJECT_SQL, rows)
+
+
+def insert_project(conn, user_info_id, project):
+    """更新ページで追加した案件1件（system_name で入力）を開発環境ごと登録し、projects.id を返す"""
+    cursor = conn.execute(_INSERT_PROJECT_SQL, (user_info_id, *_project_values(project, project.get('system_name', ""))))
+    replace_project_envs(conn, [], build_env_rows(cursor.lastrowid, project))
+    return cursor.lastrowid
+
+
+def replace_project_envs(conn, project_ids, env_rows):
+    """対象案件の project_env を削除してから一括登録"""
+    if project_ids:
+        conn.executemany("DELETE FROM project_env WHERE project_id = ?", [(pid,) for pid in project_ids])
+    if env_rows:
+        conn.executemany(_INSERT_PROJECT_ENV_SQL, env_rows)
+
+
+def load_sheet(conn, user_info_id, login_user_id=None):
+    """スキルシート1件を SkillSheet で返す（login_user_id を渡すと作成者で絞り込む）。見つからなければ None"""
+    row = conn.execute(_LOAD_SHEET_SQL, (user_info_id,)).fetchone()
+    if row is None:
+        return None
+    sheet = SkillSheet(**dict(zip(_SHEET_FIELDS, row)))
+    if login_user_id is not None and sheet.login_user_id != login_user_id:
+        return None
+    sheet.skills = [Skill(*skill) for skill in conn.execute(_LOAD_SHEET_SKILLS_SQL, (user_info_id,))]
+    # 案件と開発環境は1文で読み、案件ごとにまとめる（並び順は案件 → 種類 → 入力順）
+    field_count = len(_PROJECT_FIELDS)
+    project = None
+    for values in conn.execute(_LOAD_SHEET_PROJECTS_SQL, (user_info_id,)):
+        if project is None or project.id != values[0]:
+            project = Project(**dict(zip(_PROJECT_FIELDS, values[:field_count])))
+            sheet.projects.append(project)
+        env_type, name = values[field_count:]
+        if env_type in ENV_TYPES:
+            getattr(project, env_type).append(name)
+    return sheet
+
+
+def delete_projects(conn, where_sql, params):
+    """条件に合う案件と、その開発環境をまとめて削除"""
+    conn.execute(_DELETE_PROJECT_ENVS_SQL.format(where=where_sql), params)
+    conn.execute(_DELETE_PROJECTS_SQL.format(where=where_sql), params)
+
+
+def join_qualifications(qualifications):
+    """資格の入力欄（リスト）を user_info.qualifications の文字列に変換"""
+    return ",".join([q for q in qualifications if isinstance(q, str) and q.strip()])
+
+
+def sheet_from_form(data):
+    """作成フォームの入力（insert_sheet と同じ形式）から、保存前の SkillSheet を組み立てる（Excel出力用）"""
+    sheet = SkillSheet(
+        id=None,
+        qualifications=join_qualifications(data['qualifications']),
+        **{name: data.get(name) for name in _SHEET_FIELDS if name not in ("id", "qualifications", "created_at", "login_user_id")},
+    )
+    # 保存時（recompute_sheet_skills）と同じく、期間の入った案件で使ったスキルは案件期間から計算した値にする
+    derived = form_skill_months(data['projects'])
+    sheet.skills = [
+        Skill(skill_type, name, format_experience(derived[skill_type, name]), derived[skill_type, name])
+        if (skill_type, name) in derived else Skill(skill_type, name, years, months)
+        for _, skill_type, name, years, months in build_skill_rows(None, data)
+    ]
+    entered = {(skill.skill_type, skill.skill_name) for skill in sheet.skills}
+    sheet.skills.extend(
+        Skill(skill_type, name, format_experience(m), m)
+        for (skill_type, name), m in derived.items() if (skill_type, name) not in entered
+    )
+    for project_data, row in zip(data['projects'], build_project_rows(None, data['projects'])):
+        values = dict(zip(PROJECT_COLUMNS, row))
+        project = Project(None, **{name: values[name] for name in _PROJECT_FIELDS if name != "id"})
+        for _, env_type, name, _ in build_env_rows(None, project_data):
+            project.envs(env_type).append(name)
+        sheet.projects.append(project)
+    return sheet
+
+
+def insert_sheet(conn, data, login_user_id):
+    """スキルシート1件（基本情報・スキル・案件）を登録し、user_info.id を返す"""
+    cursor = conn.execute(_INSERT_USER_INFO_SQL, (
+        data['name'], data['name_kana'], data['transportation'], data['nearest_station'],
+        data['access_method'], data['access_time'], data['gender'], data['birth_date'],
+        data['final_education'], data['graduation_date'], data['self_pr'],
+        join_qualifications(data['qualifications']), login_user_id
+    ))
+    user_info_id = cursor.lastrowid
+    upsert_skills(conn, build_skill_rows(user_info_id, data))
+    insert_projects(conn, build_project_rows(user_info_id, data['projects']))
+    # 新規シートの案件は登録順に採番されるため、id順に並べれば入力順と対応する
+    project_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM projects WHERE user_info_id = ? ORDER BY id", (user_info_id,)
+    )]
+    env_rows = []
+    for project_id, project in zip(project_ids, data['projects']):
+        env_rows.extend(build_env_rows(project_id, project))
+    replace_project_envs(conn, [], env_rows)
+    # 案件期間が入っていれば、スキルの経験月数は期間の和集合で上書き
+    recompute_sheet_skills(conn, user_info_id)
+    return user_info_id
+
+
+def find_sheet_ids(conn, login_user_id, name_contains=""):
+    """ログインユーザーのスキルシートの id を新しい順に返す（name_contains で氏名・フリガナを部分一致検索）"""
+    keyword = (name_contains or "").strip()
+    return [row[0] for row in conn.execute(_FIND_SHEETS_SQL, (login_user_id, keyword, keyword, keyword))]
+
+
+def find_sheet_ids_in_period(conn, login_user_id, start_idx, end_idx):
+    """指定期間（月インデックスの両端を含む）に案件へ参画していたスキルシートの id を返す"""
+    return [row[0] for row in conn.execute(_SHEETS_IN_PERIOD_SQL, (login_user_id, start_idx, end_idx))]
+
+
+def find_current_projects(conn, login_user_id):
+    """終了が「現在」の案件を (user_info_id, project_id, system_name, start_month_idx) で返す"""
+    return conn.execute(_CURRENT_PROJECTS_SQL, (login_user_id, ONGOING_MONTH_INDEX)).fetchall()
+
+
+def project_skill_keys(conn, project_ids):
+    """案件の開発環境に含まれるスキルを {(skill_type, スキル名)} で返す"""
+    if not project_ids:
+        return set()
+    placeholders = ", ".join("?" for _ in project_ids)
+    rows = conn.execute(
+        f"SELECT DISTINCT env_type, name FROM project_env WHERE project_id IN ({placeholders})",
+        list(project_ids)
+    )
+    return {(ENV_SKILL_TYPES[env_type], name) for env_type, name in rows if env_type in ENV_SKILL_TYPES}
+
+
+def sheet_skill_months(conn, user_info_id, skill_keys=None):
+    """シート1件の案件期間の和集合から {(skill_type, スキル名): 経験月数} を求める（保存はしない）"""
+    rows = [
+        (ENV_SKILL_TYPES[env_type], name, start_idx, end_idx)
+        for env_type, name, start_idx, end_idx in conn.execute(_SHEET_SKILL_PERIODS_SQL, (user_info_id,))
+        if env_type in ENV_SKILL_TYPES
+    ]
+    if skill_keys is not None:
+        rows = [row for row in rows if row[:2] in skill_keys]
+    return skill_months(rows, current_month_index())
+
+
+def form_skill_months(projects):
+    """画面の案件（dict: 期間 'yyyy/MM' と開発環境）から、保存後に案件期間から計算される経験月数を求める
+
+    {(skill_type, スキル名): 経験月数} を返す。ここに含まれるスキルは保存時に再計算されるため、手入力の年数は使われない。
+    """
+    rows = []
+    for project in projects:
+        start_idx, end_idx = period_indexes(project.get('period_start'), project.get('period_end'))
+        for env_type, skill_type in ENV_SKILL_TYPES.items():
+            rows.extend((skill_type, name, start_idx, end_idx) for name in parse_env_value(project.get(env_type)))
+    return skill_months(rows, current_month_index())
+
+
+def recompute_sheet_skills(conn, user_info_id, skill_keys=None, covered_before=()):
+    """シート1件のスキル経験月数を案件期間の和集合から再計算して保存
+
+    skill_keys を渡した場合はそのスキルだけを再計算する（案件1件の変更時など）。
+    期間の入った案件で使われていないスキルは、入力済みの経験年数をそのまま残す。
+    covered_before には変更前の sheet_skill_months のキーを渡す。変更前は期間の入った案件で使われていて
+    今は使われていないスキル（案件の削除・開発環境からの削除）は、古い計算値を残さず 0 にする。
+    """
+    months = sheet_skill_months(conn, user_info_id, skill_keys)
+    upsert_skills(conn, [
+        (user_info_id, skill_type, name, format_experience(m), m)
+        for (skill_type, name), m in months.items()
+    ], derived=True)
+    upsert_skills(conn, [
+        (user_info_id, skill_type, name, format_experience(0), 0)
+        for skill_type, name in covered_before
+        if (skill_type, name) not in months and (skill_keys is None or (skill_type, name) in skill_keys)
+    ])
+    return months
+
+
+def all_skill_months(conn):
+    """全シートの案件期間の和集合から (user_info_id, skill_type, スキル名, 経験月数) を順に返す（保存はしない）"""
+    current_idx = current_month_index()
+    for user_info_id, env_type, name, m in iter_sorted_skill_months(
+        conn.execute(_ALL_SKILL_PERIODS_SQL), current_idx
+    ):
+        if env_type in ENV_SKILL_TYPES:
+            yield user_info_id, ENV_SKILL_TYPES[env_type], name, m
+
+
+def recompute_all_skills(conn):
+    """全シートのスキル経験月数を1回の走査で再計算して保存し、更新した件数を返す
+
+    案件期間から計算した値（experience_derived）はいったん 0 に戻してから計算し直すため、
+    期間の入った案件で使われなくなったスキルは recompute_sheet_skills の covered_before と同じく 0 になる。
+    """
+    rows = [
+        (user_info_id, skill_type, name, format_experience(m), m)
+        for user_info_id, skill_type, name, m in all_skill_months(conn)
+    ]
+    conn.execute(_RESET_DERIVED_SKILLS_SQL, (format_experience(0),))
+    upsert_skills(conn, rows, derived=True)
+    return len(rows)
+
+
+def changed_fields(baseline, current, fields=PROJECT_EDIT_FIELDS):
+    """読み込み時のスナップショットと比較し、値が変わった項目名を返す"""
+    if baseline is None:
+        return list(fields)
+    return [f for f in fields if baseline.get(f) != current.get(f)]
+
+
+def changed_skill_years(baseline_years, current_years):
+    """{スキル名: (年, 月)} のうち、追加または年数が変わったものを返す"""
+    baseline_years = baseline_years or {}
+    return {
+        name: years for name, years in current_years.items()
+        if baseline_years.get(name) != years
+    }
+
+
+class SheetUnitOfWork:
+    """1シート分の案件・スキルの変更を集め、1回の書き込みジョブ（1トランザクション）で反映する
+
+    apply は書き込みスレッド上でSAVEPOINT内に実行されるため、途中で失敗した場合はすべて取り消される。
+    """
+
+    def __init__(self, user_info_id):
+        self.user_info_id = user_info_id
+        self.project_rows = []
+        self.env_rows = []
+        self.skill_rows = []
+
+    def update_project(self, project_id, data):
+        self.project_rows.append((*_project_values(data, data.get('system_name', "")), project_id))
+        self.env_rows.extend(build_env_rows(project_id, data))
+
+    def set_skill_months(self, skill_type, skill_name, months):
+        self.skill_rows.append((self.user_info_id, skill_type, skill_name, format_experience(months), months))
+
+    def is_empty(self):
+        return not self.project_rows and not self.skill_rows
+
+    def apply(self, conn):
+        # 変更前後の開発環境と手入力したスキルを対象に、経験月数を再計算する
+        affected = {(skill_type, name) for _, skill_type, name, _, _ in self.skill_rows}
+        covered_before = ()
+        if self.project_rows:
+            covered_before = set(sheet_skill_months(conn, self.user_info_id))
+            project_ids = [row[-1] for row in self.project_rows]
+            affected |= project_skill_keys(conn, project_ids)
+            conn.executemany(_UPDATE_PROJECT_SQL, self.project_rows)
+            replace_project_envs(conn, project_ids, self.env_rows)
+            affected |= {(ENV_SKILL_TYPES[env_type], name) for _, env_type, name, _ in self.env_rows}
+        upsert_skills(conn, self.skill_rows)
+        if affected:
+            recompute_sheet_skills(conn, self.user_info_id, affected, covered_before)
+        return True
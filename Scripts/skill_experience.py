@@ -0,0 +1,74 @@
+from itertools import groupby
+
+# --- 案件期間からのスキル経験月数 ---
+# スキルごとに、そのスキルを使った案件の期間（月インデックスの閉区間）の和集合の長さを経験月数とする。
+# 期間が重なる案件を並行して担当していても二重には数えない。
+# 区間を開始月で並べてから1回走査するため、1スキルあたり O(n log n)（ソート済みなら O(n)）。
+
+# project_env.env_type → skills.skill_type
+ENV_SKILL_TYPES = {
+    "env_langs": "language",
+    "env_tools": "tool",
+    "env_dbs": "db",
+    "env_oss": "machine",
+}
+
+
+def _closed_interval(start_idx, end_idx, current_idx):
+    if start_idx is None or end_idx is None:
+        return None
+    # 継続中（終了 = 現在）や終了予定が先の案件は当月までを数える
+    end_idx = min(end_idx, current_idx)
+    if end_idx < start_idx:
+        return None
+    return int(start_idx), int(end_idx)
+
+
+def _union_length(sorted_intervals):
+    """開始月順に並んだ閉区間の和集合の月数"""
+    total = 0
+    cur_start = cur_end = None
+    for start, end in sorted_intervals:
+        if cur_end is None or start > cur_end + 1:
+            if cur_end is not None:
+                total += cur_end - cur_start + 1
+            cur_start, cur_end = start, end
+        elif end > cur_end:
+            cur_end = end
+    if cur_end is not None:
+        total += cur_end - cur_start + 1
+    return total
+
+
+def union_months(intervals):
+    """(開始月インデックス, 終了月インデックス) の閉区間の和集合の月数"""
+    return _union_length(sorted(intervals))
+
+
+def skill_months(rows, current_idx):
+    """(skill_type, スキル名, 開始, 終了) の行からスキルごとの経験月数を求める
+
+    期間が未入力・不正な案件は数えない。有効な期間が1件もないスキルは結果に含めない。
+    """
+    intervals = {}
+    for skill_type, name, start_idx, end_idx in rows:
+        interval = _closed_interval(start_idx, end_idx, current_idx)
+        if interval is not None:
+            intervals.setdefault((skill_type, name), []).append(interval)
+    return {key: union_months(spans) for key, spans in intervals.items()}
+
+
+def iter_sorted_skill_months(rows, current_idx):
+    """(user_info_id, skill_type, スキル名, 開始, 終了) を この順のキー・開始月で並べ替え済みの行から、
+    (user_info_id, skill_type, スキル名, 経験月数) を順に返す（全件を保持せずに1回で走査）
+    """
+    for key, group in groupby(rows, key=lambda row: row[:3]):
+        spans = [
+            interval for interval in (
+                _closed_interval(start_idx, end_idx, current_idx)
+                for _, _, _, start_idx, end_idx in group
+            )
+            if interval is not None
+        ]
+        if spans:
+            yield (*key, _union_length(spans))
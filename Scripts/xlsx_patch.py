@@ -0,0 +1,443 @@
+import os
+import re
+import struct
+import threading
+import zlib
+import zipfile
+from xml.sax.saxutils import escape, unescape
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.formula.translate import Translator
+from openpyxl.utils import get_column_letter
+
+# --- xlsx を直接書き換える出力エンジン ---
+# テンプレートの xlsx（zip）は変更しないバイト列として扱い、出力のたびに書き換えるのは
+#   - 出力先シートの sheetData のうち、レイアウト定義（sheet_layout）で書き込む行だけ
+#   - sharedStrings.xml（新しい文字列を末尾に追加）
+#   - workbook.xml / rels / [Content_Types].xml（一覧シートの追加と、開いたときの再計算指定）
+#   - 案件ブロックを増やす場合は、複製した行・結合セル・入力規則の範囲・dimension
+# だけにする。書式・図形・コメントなど他のパートは、テンプレートの圧縮済みバイト列をそのまま zip にコピーする。
+# テンプレートの分解（zip の読み込み・行ごとの切り出し）は (パス, 更新日時, サイズ) ごとに1回だけ行う。
+
+_ROW_RE = re.compile(rb'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_ROW_NUM_RE = re.compile(rb'\br="(\d+)"')
+_CELL_RE = re.compile(rb'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_CELL_COL_RE = re.compile(rb'\br="([A-Z]+)\d+"')
+_CELL_STYLE_RE = re.compile(rb'\bs="\d+"')
+_SST_COUNT_RE = re.compile(rb'\bcount="\d+"')
+_SST_UNIQUE_RE = re.compile(rb'\buniqueCount="\d+"')
+_SI_RE = re.compile(rb'<si>(.*?)</si>', re.S)
+_PLAIN_SI_RE = re.compile(rb'<t(?: xml:space="preserve")?>([^<]*)</t>')
+_SHEET_TAG_RE = re.compile(rb'<sheet\b[^>]*/>')
+_REL_RE = re.compile(rb'<Relationship\b[^>]*/>')
+_ROW_PIECE_RE = re.compile(rb'<f( [^>]*)?>([^<]*)</f>(?:<v>[^<]*</v>)?|\br="([A-Z]*)(\d+)"')
+_MERGE_RE = re.compile(rb'<mergeCell ref="([A-Z]+)(\d+):([A-Z]+)(\d+)"/>')
+_MERGE_COUNT_RE = re.compile(rb'<mergeCells count="(\d+)">')
+_SQREF_RE = re.compile(rb'(<dataValidation\b[^>]*?\bsqref=")([^"]*)(")')
+_RANGE_RE = re.compile(r'([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?')
+_DIMENSION_RE = re.compile(rb'(<dimension ref="[A-Z]+\d+:[A-Z]+)(\d+)(")')
+
+_REL_NS = b"http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_WORKSHEET_REL_TYPE = _REL_NS + b"/worksheet"
+_WORKSHEET_CONTENT_TYPE = b"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def _attr(tag, name):
+    m = re.search(rb'\b' + name + rb'="([^"]*)"', tag)
+    return m.group(1) if m else None
+
+
+def _col_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ch - 64
+    return index
+
+
+class _Template:
+    """テンプレート xlsx を分解したもの（出力のたびに共有し、書き換えない）"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.raw = f.read()
+        with zipfile.ZipFile(path) as zf:
+            self.infos = zf.infolist()
+            self.parts = {info.filename: zf.read(info) for info in self.infos}
+        for info in self.infos:
+            if info.flag_bits & 0x08 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                raise ValueError(f"対応していない zip 形式のパートです: {info.filename}")
+
+        workbook = self.parts["xl/workbook.xml"]
+        rels = self.parts["xl/_rels/workbook.xml.rels"]
+        targets = {_attr(tag, b"Id"): _attr(tag, b"Target") for tag in _REL_RE.findall(rels)}
+        sheet_tags = _SHEET_TAG_RE.findall(workbook)
+        # シート名 → ワークシートのパート名
+        self.sheet_parts = {
+            _attr(tag, b"name").decode("utf-8"): self._part_name(targets[_attr(tag, b"r:id")])
+            for tag in sheet_tags
+        }
+        # openpyxl の workbook.active と同じく workbookView の activeTab（既定は先頭）のシートに書き込む
+        view = re.search(rb'<workbookView\b[^>]*>', workbook)
+        active = int(_attr(view.group(0), b"activeTab") or 0) if view else 0
+        self.sheet_part = self._part_name(targets[_attr(sheet_tags[active], b"r:id")])
+        self.next_sheet_id = max(int(_attr(tag, b"sheetId")) for tag in sheet_tags) + 1
+        self.next_rel_id = max([int(rel_id[3:]) for rel_id in targets if rel_id[3:].isdigit()] + [0]) + 1
+
+        # 出力先シートは sheetData を行ごとに切り出しておく
+        xml = self.parts[self.sheet_part]
+        xml = xml.replace(b"<sheetData/>", b"<sheetData></sheetData>", 1)
+        start = xml.index(b">", xml.index(b"<sheetData")) + 1
+        end = xml.index(b"</sheetData>")
+        self.sheet_head = xml[:start]
+        self.sheet_tail = xml[end:]
+        self.rows = {}
+        for m in _ROW_RE.finditer(xml, start, end):
+            self.rows[int(_ROW_NUM_RE.search(m.group(0)).group(1))] = m.group(0)
+        self.row_numbers = sorted(self.rows)
+
+        self._row_blocks = {}
+
+        # 共有文字列: 書式なしの文字列は再利用できるように番号を引けるようにする
+        sst = self.parts.get("xl/sharedStrings.xml")
+        if sst is None or b"</sst>" not in sst:
+            raise ValueError("共有文字列（sharedStrings.xml）のないテンプレートには対応していません")
+        head_end = sst.index(b">", sst.index(b"<sst")) + 1
+        self.sst_head = sst[:head_end]
+        self.sst_body = sst[head_end:sst.rindex(b"</sst>")]
+        self.sst_count = int(_attr(self.sst_head, b"count") or 0)
+        self.string_index = {}
+        self.sst_unique = 0
+        for m in _SI_RE.finditer(self.sst_body):
+            plain = _PLAIN_SI_RE.fullmatch(m.group(1))
+            if plain:
+                self.string_index.setdefault(plain.group(1), self.sst_unique)
+            self.sst_unique += 1
+
+        # 開いたときに数式（年齢・期間など）を再計算させる
+        self.workbook_xml = re.sub(
+            rb'<calcPr\b([^>]*?)(/?)>',
+            lambda m: b'<calcPr' + re.sub(rb'\s*fullCalcOnLoad="[^"]*"', b"", m.group(1)) + b' fullCalcOnLoad="1"' + m.group(2) + b'>',
+            workbook, count=1,
+        )
+        if b"<calcPr" not in self.workbook_xml:
+            self.workbook_xml = self.workbook_xml.replace(b"</sheets>", b'</sheets><calcPr fullCalcOnLoad="1"/>', 1)
+
+    @staticmethod
+    def _part_name(target):
+        target = target.decode("utf-8")
+        return target[1:] if target.startswith("/") else "xl/" + target
+
+    def row_block(self, first_row, height):
+        """first_row から height 行を複製するための下ごしらえ（同じ範囲は1回だけ作る）"""
+        key = (first_row, height)
+        block = self._row_blocks.get(key)
+        if block is None:
+            block = _RowBlock(self, first_row, height)
+            self._row_blocks[key] = block
+        return block
+
+    def raw_entry(self, info):
+        """テンプレート zip 内の圧縮済みデータ（再圧縮せずにコピーする）"""
+        offset = info.header_offset
+        name_len, extra_len = struct.unpack("<HH", self.raw[offset + 26:offset + 30])
+        start = offset + 30 + name_len + extra_len
+        return self.raw[start:start + info.compress_size]
+
+
+class _RowBlock:
+    """シート末尾の連続した行（案件ブロック）を後ろに複製する
+
+    行・セルの XML を「固定のバイト列」「ブロック先頭からの行オフセット」「数式」の部品に分けておき、
+    複製時は行番号を埋めて並べるだけにする（書式 s="…"・行の高さなどの属性はそのままコピーされる）。
+    ブロック内の結合セル・入力規則の範囲もブロック先頭からの相対位置で持っておく。
+    """
+
+    def __init__(self, template, first_row, height):
+        last_row = first_row + height - 1
+        if template.row_numbers and template.row_numbers[-1] > last_row:
+            raise ValueError(f"{last_row}行目より後ろに行があるため、行の複製はできません")
+        self.first_row = first_row
+        self.height = height
+        self.rows = []
+        for row in range(first_row, last_row + 1):
+            row_xml = template.rows.get(row)
+            if row_xml is None:
+                continue
+            if b'<f t="' in row_xml:
+                raise ValueError(f"{row}行目に共有数式・配列数式があるため、行の複製はできません")
+            pieces, pos, origin = [], 0, None
+            for m in _ROW_PIECE_RE.finditer(row_xml):
+                pieces.append(row_xml[pos:m.start()])
+                if m.group(2) is not None:
+                    # 数式は複製先の行に合わせて参照をずらす（計算結果はブックを開いたときに再計算される）
+                    pieces.append((m.group(1) or b"", "=" + unescape(m.group(2).decode("utf-8")), origin))
+                else:
+                    if m.group(3):
+                        origin = (m.group(3) + m.group(4)).decode("ascii")
+                    pieces.append(b'r="' + m.group(3))
+                    pieces.append(int(m.group(4)) - first_row)
+                    pieces.append(b'"')
+                pos = m.end()
+            pieces.append(row_xml[pos:])
+            self.rows.append((row - first_row, pieces))
+        self.merges = [
+            (c1, int(r1) - first_row, c2, int(r2) - first_row)
+            for c1, r1, c2, r2 in _MERGE_RE.findall(template.sheet_tail)
+            if first_row <= int(r1) and int(r2) <= last_row
+        ]
+
+    def _rows_xml(self, base_row, shift):
+        rows = {}
+        for offset, pieces in self.rows:
+            out = []
+            for piece in pieces:
+                if isinstance(piece, int):
+                    out.append(b"%d" % (base_row + piece))
+                elif isinstance(piece, tuple):
+                    attrs, formula, origin = piece
+                    translated = Translator(formula, origin=origin).translate_formula(row_delta=shift)
+                    out.append(b"<f" + attrs + b">" + escape(translated[1:]).encode("utf-8") + b"</f>")
+                else:
+                    out.append(piece)
+            rows[base_row + offset] = b"".join(out)
+        return rows
+
+    def _shift_sqref(self, sqref, copies):
+        """入力規則の範囲のうちブロック内のものを、複製したブロックの分だけ追加する"""
+        last_row = self.first_row + self.height - 1
+        added = []
+        for c1, r1, c2, r2 in _RANGE_RE.findall(sqref.decode("ascii")):
+            r1 = int(r1)
+            r2 = int(r2) if r2 else r1
+            if not (self.first_row <= r1 and r2 <= last_row):
+                continue
+            for k in range(1, copies + 1):
+                shift = self.height * k
+                added.append(f"{c1}{r1 + shift}:{c2 or c1}{r2 + shift}" if c2 else f"{c1}{r1 + shift}")
+        return sqref + "".join(" " + ref for ref in added).encode("ascii")
+
+    def apply(self, rows, head, tail, copies):
+        """rows（行番号 → 行XML）に複製した行を追加し、(head, tail) の dimension・結合セル・入力規則を更新して返す"""
+        merges = []
+        for k in range(1, copies + 1):
+            shift = self.height * k
+            base_row = self.first_row + shift
+            rows.update(self._rows_xml(base_row, shift))
+            for c1, r1, c2, r2 in self.merges:
+                merges.append(b'<mergeCell ref="%s%d:%s%d"/>' % (c1, base_row + r1, c2, base_row + r2))
+        last_row = self.first_row + self.height * (copies + 1) - 1
+        head = _DIMENSION_RE.sub(lambda m: m.group(1) + b"%d" % max(int(m.group(2)), last_row) + m.group(3), head, count=1)
+        if merges:
+            tail = _MERGE_COUNT_RE.sub(lambda m: b'<mergeCells count="%d">' % (int(m.group(1)) + len(merges)), tail, count=1)
+            tail = tail.replace(b"</mergeCells>", b"".join(merges) + b"</mergeCells>", 1)
+        tail = _SQREF_RE.sub(lambda m: m.group(1) + self._shift_sqref(m.group(2), copies) + m.group(3), tail)
+        return head, tail
+
+
+def _template(path):
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    entry = _templates.get(path)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _lock:
+        entry = _templates.get(path)
+        if entry is None or entry[0] != version:
+            entry = (version, _Template(path))
+            _templates[path] = entry
+    return entry[1]
+
+
+class _SharedStrings:
+    """出力1回分の共有文字列（テンプレートの一覧に追加した分だけを持つ）"""
+
+    def __init__(self, template):
+        self.template = template
+        self.added = {}
+        self.items = []
+        self.count = template.sst_count
+
+    def index(self, text):
+        key = escape(text).encode("utf-8")
+        i = self.template.string_index.get(key)
+        if i is None:
+            i = self.added.get(key)
+        if i is None:
+            i = self.template.sst_unique + len(self.items)
+            self.added[key] = i
+            space = b' xml:space="preserve"' if text != text.strip() or "\n" in text else b""
+            self.items.append(b"<si><t" + space + b">" + key + b"</t></si>")
+        self.count += 1
+        return i
+
+    def xml(self):
+        head = _SST_COUNT_RE.sub(b'count="%d"' % self.count, self.template.sst_head, count=1)
+        head = _SST_UNIQUE_RE.sub(b'uniqueCount="%d"' % (self.template.sst_unique + len(self.items)), head, count=1)
+        return head + self.template.sst_body + b"".join(self.items) + b"</sst>"
+
+
+def _cell_xml(ref, style, value, strings):
+    """1セル分の <c>（style はテンプレートのセルの s="…" をそのまま引き継ぐ）"""
+    if value is None or value == "":
+        return b"<c r=\"" + ref + b"\"" + style + b"/>"
+    if isinstance(value, bool):
+        return b"<c r=\"" + ref + b"\"" + style + b" t=\"b\"><v>" + (b"1" if value else b"0") + b"</v></c>"
+    if isinstance(value, (int, float)):
+        return b"<c r=\"" + ref + b"\"" + style + b"><v>" + repr(value).encode("ascii") + b"</v></c>"
+    text = str(value)
+    if ILLEGAL_CHARACTERS_RE.search(text):
+        raise ValueError(f"Excelに書き込めない文字が含まれています: {text!r}")
+    return b"<c r=\"" + ref + b"\"" + style + b" t=\"s\"><v>%d</v></c>" % strings.index(text)
+
+
+def _patch_row(row_num, row_xml, values, strings):
+    """テンプレートの1行に値を書き込む（書き込まないセルはそのまま残す）"""
+    if row_xml is None:
+        head, cells = b'<row r="%d">' % row_num, []
+    elif row_xml.endswith(b"/>"):
+        head, cells = row_xml[:-2] + b">", []
+    else:
+        head = row_xml[:row_xml.index(b">") + 1]
+        cells = [
+            (_col_index(_CELL_COL_RE.search(m.group(0)).group(1)), m.group(0))
+            for m in _CELL_RE.finditer(row_xml, len(head), len(row_xml) - len(b"</row>"))
+        ]
+    existing = dict(cells)
+    for col, value in values.items():
+        old = existing.get(col)
+        style = b""
+        if old is not None:
+            m = _CELL_STYLE_RE.search(old[:old.index(b">")])
+            style = b" " + m.group(0) if m else b""
+        ref = get_column_letter(col).encode("ascii") + b"%d" % row_num
+        existing[col] = _cell_xml(ref, style, value, strings)
+    return head + b"".join(existing[col] for col in sorted(existing)) + b"</row>"
+
+
+def _list_sheet_xml(rows, strings):
+    """一覧シート（見出し + 1行1案件）のワークシート XML"""
+    out = [
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        b'xmlns:r="' + _REL_NS + b'"><sheetData>'
+    ]
+    for r, values in enumerate(rows, start=1):
+        out.append(b'<row r="%d">' % r)
+        for c, value in enumerate(values, start=1):
+            if value is None or value == "":
+                continue
+            out.append(_cell_xml(get_column_letter(c).encode("ascii") + b"%d" % r, b"", value, strings))
+        out.append(b"</row>")
+    out.append(b"</sheetData></worksheet>")
+    return b"".join(out)
+
+
+def _add_list_sheet(template, name):
+    """workbook.xml / rels / [Content_Types].xml に一覧シートを追加し、(パート名, 各XML) を返す"""
+    rel_id = b"rId%d" % template.next_rel_id
+    n = 1
+    while f"xl/worksheets/sheet{n}.xml" in template.parts:
+        n += 1
+    part = f"xl/worksheets/sheet{n}.xml"
+    workbook = template.workbook_xml.replace(
+        b"</sheets>",
+        b'<sheet name="' + escape(name, {'"': "&quot;"}).encode("utf-8") + b'" sheetId="%d" r:id="' % template.next_sheet_id + rel_id + b'"/></sheets>',
+        1,
+    )
+    rels = template.parts["xl/_rels/workbook.xml.rels"].replace(
+        b"</Relationships>",
+        b'<Relationship Id="' + rel_id + b'" Type="' + _WORKSHEET_REL_TYPE + b'" Target="worksheets/sheet%d.xml"/></Relationships>' % n,
+        1,
+    )
+    content_types = template.parts["[Content_Types].xml"].replace(
+        b"</Types>",
+        b'<Override PartName="/' + part.encode("ascii") + b'" ContentType="' + _WORKSHEET_CONTENT_TYPE + b'"/></Types>',
+        1,
+    )
+    return part, workbook, rels, content_types
+
+
+def _zip_bytes(template, replaced, added):
+    """テンプレートのパート順で zip を組み立てる（書き換えたパートだけ圧縮し直す）"""
+    out = bytearray()
+    central = bytearray()
+    entries = [(info.filename, info) for info in template.infos] + [(name, None) for name in added]
+    for name, info in entries:
+        data = replaced.get(name, added.get(name))
+        name_bytes = name.encode("utf-8")
+        flags = 0x800 if not name.isascii() else 0
+        if data is None:
+            payload = template.raw_entry(info)
+            method, crc, size = info.compress_type, info.CRC, info.file_size
+            flags |= info.flag_bits & 0x06
+            dos_time, dos_date = _dos_datetime(info.date_time)
+        else:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            method, crc, size = zipfile.ZIP_DEFLATED, zlib.crc32(data), len(data)
+            dos_time, dos_date = _dos_datetime(info.date_time if info else (1980, 1, 1, 0, 0, 0))
+        offset = len(out)
+        out += struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 20, flags, method, dos_time, dos_date,
+            crc, len(payload), size, len(name_bytes), 0,
+        ) + name_bytes
+        out += payload
+        central += struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, flags, method, dos_time, dos_date,
+            crc, len(payload), size, len(name_bytes), 0, 0, 0, 0, 0, offset,
+        ) + name_bytes
+    central_offset = len(out)
+    out += central
+    out += struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(entries), len(entries), len(central), central_offset, 0)
+    return bytes(out)
+
+
+def _dos_datetime(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def render_xlsx(path, cells, list_sheet_name=None, list_rows=(), repeat_rows=None):
+    """テンプレートに値を書き込んだ xlsx のバイト列を返す
+
+    cells は出力先シートへの (行, 列, 値) の一覧（値 None はテンプレートの値を消す）。
+    repeat_rows=(先頭行, 行数, 複製数) を指定すると、その行範囲（シートの末尾）を書式・結合セルごと後ろに複製してから書き込む。
+    list_sheet_name を指定すると list_rows を1行ずつ書いたシートを追加する（同名のシートがあれば中身を置き換える）。
+    """
+    template = _template(os.path.abspath(path))
+    strings = _SharedStrings(template)
+
+    rows = template.rows
+    head, tail = template.sheet_head, template.sheet_tail
+    if repeat_rows and repeat_rows[2] > 0:
+        first_row, height, copies = repeat_rows
+        rows = dict(rows)
+        head, tail = template.row_block(first_row, height).apply(rows, head, tail, copies)
+
+    by_row = {}
+    for row, col, value in cells:
+        by_row.setdefault(row, {})[col] = value
+    patched = {row: _patch_row(row, rows.get(row), values, strings) for row, values in by_row.items()}
+    sheet = [head]
+    for row in sorted(set(rows).union(patched)):
+        sheet.append(patched.get(row) or rows[row])
+    sheet.append(tail)
+
+    replaced = {template.sheet_part: b"".join(sheet)}
+    added = {}
+    if list_sheet_name:
+        list_xml = _list_sheet_xml(list_rows, strings)
+        if list_sheet_name in template.sheet_parts:
+            replaced[template.sheet_parts[list_sheet_name]] = list_xml
+        else:
+            part, workbook, rels, content_types = _add_list_sheet(template, list_sheet_name)
+            added[part] = list_xml
+            replaced["xl/workbook.xml"] = workbook
+            replaced["xl/_rels/workbook.xml.rels"] = rels
+            replaced["[Content_Types].xml"] = content_types
+    replaced.setdefault("xl/workbook.xml", template.workbook_xml)
+    replaced["xl/sharedStrings.xml"] = strings.xml()
+    return _zip_bytes(template, replaced, added)